@@ -3,43 +3,34 @@
 import pygame
 import random
 import numpy as np
-import sys
-from location_parser import LocationParser
-            
-#lidar positioner that handles the parsing of the file into a tuple array. 
-#see location_parser.py for parameter description.
-lidar_positioner = LocationParser()
-
-#start pygame
-pygame.init()
-SCREEN_WIDTH, SCREEN_HEIGHT = 1920 , 1080 #render resolution, this will be scaled to the screen
-screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.FULLSCREEN | pygame.SCALED)
-
-running = True #indicates the game is currently running
-clock = pygame.time.Clock() #used to moduleate the frame rate and keep successive actions constant
-
-while running:
-
-    #check whether the user quit the game 
-    # if so set running to False so we can close on the next iteration
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            running = False
-
-    # Fill the background with black
-    screen.fill((0,0,0, 1))
-
-    #get positions from the LocationParser
-    positions = lidar_positioner.getPositions()
-    for xy in positions: 
-        pygame.draw.circle(screen, (0,0,255), xy, 10) 
-
-    #write pixels to the display
-    pygame.display.flip()
-    
-    #wait until next game tick
-    clock.tick(120)
-
-#exit
-pygame.quit()
-sys.exit()
+from launcher import GamePlugin, run_game
+
+#games are plugins, the launcher (or run_game when the game is run on its own) owns the display and the lidar input
+#and calls update() and draw() every frame, see launcher.GamePlugin for everything a game can override
+#the constructor may run on a background thread, load images and fonts or create surfaces in prepare() instead
+class BasicGame(GamePlugin):
+    def __init__(self, runtime):
+        """Draws a dot on everyone standing on the field"""
+        super().__init__(runtime)
+        self.positions = np.zeros((0, 2), dtype=np.float32)
+
+    def update(self, positions, dt):
+        #positions are the lidar positions already mapped to pixels
+        self.positions = positions
+
+    def draw(self, surface):
+        with self.runtime.profiler.scope("draw"):
+            # Fill the background with black
+            surface.fill((0,0,0, 1))
+
+            for xy in self.positions.tolist():
+                pygame.draw.circle(surface, (0,0,255), xy, 10)
+
+#the launcher finds the game through this name
+GAME = BasicGame
+
+def main():
+    run_game(BasicGame)
+
+if __name__ == "__main__":
+    main()
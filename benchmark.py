@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+
+import os, sys, json, time, timeit, random, platform, argparse, tempfile, contextlib, io
+
+#everything is drawn onto offscreen surfaces, so the benchmarks run without a real display (CI, ssh sessions, ...)
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import numpy as np
+import pygame
+
+#the games load their images with paths relative to the repo
+REPO_FOLDER = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(REPO_FOLDER, "benchmark_baseline.json")
+
+FIELD_RESOLUTION = (1920, 1080)
+FIELD_SIZE = (4.2, 2.5)
+
+
+def random_pixel_positions(count, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.random((count, 2)) * FIELD_RESOLUTION
+
+def bench_location_parser(folder, points):
+    """LocationParser.getPositions on a lidar_output.txt holding the given number of points"""
+    from location_parser import LocationParser
+
+    rng = np.random.default_rng(0)
+    lidar_path = os.path.join(folder, "lidar_output_%d.txt" % points)
+    with open(lidar_path, "w") as f:
+        for y, x in (rng.random((points, 2)) * (FIELD_SIZE[1], FIELD_SIZE[0])).tolist():
+            f.write("%0.6f,%0.6f\n" % (y, x))
+
+    pointer_path = os.path.join(folder, "pointer_%d.txt" % points)
+    with open(pointer_path, "w") as f:
+        f.write(lidar_path)
+
+    parser = LocationParser(lidar_file_path_file=pointer_path)
+    return parser.getPositions
+
+def bench_soccer_ball(folder, players, use_index):
+    """One SoccerBall.move physics step with the given number of players on the field"""
+    from makers_soccer import SoccerBall
+    from spatial_index import SpatialIndex
+
+    positions = random_pixel_positions(players)
+    player_list = [tuple(a) for a in positions.tolist()]
+    ball = SoccerBall(max_velocity=10, radius=50, bounds=(0, 0) + FIELD_RESOLUTION)
+
+    player_index = None
+    if(use_index):
+        player_index = SpatialIndex()
+        player_index.rebuild(positions)
+
+    #the ball starts every step from the same place, otherwise the number of touching players (and the timing) drifts with the call count
+    def run():
+        ball.x, ball.y, ball.vx, ball.vy = FIELD_RESOLUTION[0] / 2, FIELD_RESOLUTION[1] / 2, 5, 1
+        ball.move(player_list, player_index)
+    return run
+
+def bench_grid_draw(folder, rows, columns, people=20):
+    """ResponsiveGrid.draw (update plus drawing the points and lines) onto an offscreen full HD surface"""
+    from distortion_grid import ResponsiveGrid
+
+    screen = pygame.Surface(FIELD_RESOLUTION)
+    grid = ResponsiveGrid(rows, columns, draw_lines=True, size=FIELD_RESOLUTION)
+    distortions = random_pixel_positions(people)
+    return lambda: grid.draw(screen, distortions)
+
+def bench_grid_update(folder, rows, columns, moving, people=20):
+    """ResponsiveGrid.update alone, either with everyone standing still (the cached field is reused) or with everyone moving every frame"""
+    from distortion_grid import ResponsiveGrid
+
+    grid = ResponsiveGrid(rows, columns, size=FIELD_RESOLUTION)
+    distortions = random_pixel_positions(people)
+    step = [0]
+    def run():
+        if(moving):
+            step[0] = 1 - step[0]
+        grid.update(distortions + 10 * step[0])
+    return run
+
+#frames of every scenario that has been rendered so far, each scenario is only rendered once per run
+SCENARIO_FRAMES = {}
+
+def scenario_pixel_frames(name):
+    """Renders a scenario from the scenarios folder, the whole run as lists of (x, y) pixel positions, one list per frame"""
+    from scenario import Scenario, scenario_frames
+
+    if(name not in SCENARIO_FRAMES):
+        scenario = Scenario.load(os.path.join(REPO_FOLDER, "scenarios", name + ".json"))
+        scale = np.array(FIELD_RESOLUTION) / scenario.field_size
+        SCENARIO_FRAMES[name] = [[tuple(a) for a in (positions * scale).tolist()] for t, positions in scenario_frames(scenario)]
+    return SCENARIO_FRAMES[name]
+
+def bench_scenario_soccer(folder, name):
+    """SoccerBall.move with the players of the next frame of a scenario on every call"""
+    from makers_soccer import SoccerBall
+
+    frames = scenario_pixel_frames(name)
+    ball = SoccerBall(max_velocity=10, radius=50, bounds=(0, 0) + FIELD_RESOLUTION)
+    step = [0]
+    def run():
+        ball.x, ball.y, ball.vx, ball.vy = FIELD_RESOLUTION[0] / 2, FIELD_RESOLUTION[1] / 2, 5, 1
+        ball.move(frames[step[0] % len(frames)])
+        step[0] += 1
+    return run
+
+def bench_scenario_grid(folder, name):
+    """ResponsiveGrid.update with the people of the next frame of a scenario on every call"""
+    from distortion_grid import ResponsiveGrid
+
+    frames = [np.array(a, dtype=np.float32).reshape(-1, 2) for a in scenario_pixel_frames(name)]
+    grid = ResponsiveGrid(18, 32, size=FIELD_RESOLUTION)
+    step = [0]
+    def run():
+        grid.update(frames[step[0] % len(frames)])
+        step[0] += 1
+    return run
+
+def bench_line_objects(folder, count):
+    """update() of every line_object particle of random_particles, the original per object implementation"""
+    from random_particles import line_object
+
+    particles = [line_object(random.random() * 5 + 1) for a in range(count)]
+    def run():
+        for a in particles:
+            a.update()
+    return run
+
+def bench_particle_system(folder, count):
+    """ParticleSystem.update, the array version of the line_object update, for comparison"""
+    from particles import ParticleSystem
+
+    system = ParticleSystem(count, FIELD_RESOLUTION, seed=0)
+    return system.update
+
+def bench_location_generator(folder, people, output):
+    """One LocationGenerator move plus write, the per tick cost of movement_simulation"""
+    from movement_simulation import LocationGenerator
+
+    shared_path = os.path.join(folder, "lidar_output_%d.bin" % people) if output == "shared" else None
+    gen = LocationGenerator(FIELD_RESOLUTION, FIELD_SIZE, people, shared_path=shared_path, output_path=os.path.join(folder, "generated_%d.txt" % people), seed=0)
+    write = gen.write_to_file if output == "text" else gen.write_to_shared_memory
+    def run():
+        gen.move()
+        write()
+    return run
+
+
+#name of each benchmark and a function that sets it up in a temporary folder and returns the callable that gets timed
+BENCHMARKS = []
+for points in (10, 100, 1000, 10000):
+    BENCHMARKS.append(("location_parser.getPositions[points=%d]" % points, lambda folder, points=points: bench_location_parser(folder, points)))
+for players in (10, 100, 1000):
+    BENCHMARKS.append(("soccer_ball.move[players=%d]" % players, lambda folder, players=players: bench_soccer_ball(folder, players, False)))
+    BENCHMARKS.append(("soccer_ball.move[players=%d,spatial_index]" % players, lambda folder, players=players: bench_soccer_ball(folder, players, True)))
+for rows, columns in ((9, 16), (18, 32), (36, 64)):
+    BENCHMARKS.append(("responsive_grid.draw[grid=%dx%d]" % (rows, columns), lambda folder, rows=rows, columns=columns: bench_grid_draw(folder, rows, columns)))
+    BENCHMARKS.append(("responsive_grid.update[grid=%dx%d,static]" % (rows, columns), lambda folder, rows=rows, columns=columns: bench_grid_update(folder, rows, columns, False)))
+    BENCHMARKS.append(("responsive_grid.update[grid=%dx%d,moving]" % (rows, columns), lambda folder, rows=rows, columns=columns: bench_grid_update(folder, rows, columns, True)))
+for name in ("ball_crowd", "ramp"):
+    BENCHMARKS.append(("scenario[%s].soccer_ball.move" % name, lambda folder, name=name: bench_scenario_soccer(folder, name)))
+for name in ("churn", "dropout_bursts"):
+    BENCHMARKS.append(("scenario[%s].responsive_grid.update" % name, lambda folder, name=name: bench_scenario_grid(folder, name)))
+for count in (1000, 10000):
+    BENCHMARKS.append(("line_object.update[particles=%d]" % count, lambda folder, count=count: bench_line_objects(folder, count)))
+    BENCHMARKS.append(("particle_system.update[particles=%d]" % count, lambda folder, count=count: bench_particle_system(folder, count)))
+for people in (10, 100, 1000):
+    BENCHMARKS.append(("location_generator.write_to_file[people=%d]" % people, lambda folder, people=people: bench_location_generator(folder, people, "text")))
+    BENCHMARKS.append(("location_generator.write_to_shared_memory[people=%d]" % people, lambda folder, people=people: bench_location_generator(folder, people, "shared")))
+
+#benchmarks dominated by the filesystem, they are reported but never count as a regression because their timings depend on the disk and the page cache more than on the code
+UNGATED = ("location_generator.write_to_file",)
+
+
+def time_callable(function, repeat=7, min_time=0.05):
+    """Times a callable the same way as 'python -m timeit', the call count per sample is picked so each sample takes at least min_time
+
+    Returns:
+        dict: median, min and max milliseconds per call over the samples, and the number of calls per sample
+    """
+    timer = timeit.Timer(function)
+    number = 1
+    while(timer.timeit(number) < min_time):
+        number *= 2
+    samples = np.array(timer.repeat(repeat=repeat, number=number)) / number * 1000
+    return {"median_ms": float(np.median(samples)), "min_ms": float(np.min(samples)), "max_ms": float(np.max(samples)), "calls": number}
+
+def run_benchmarks(name_filter=None, repeat=7, min_time=0.05, names=None):
+    """Runs every benchmark whose name contains name_filter
+
+    Args:
+        names (list str, optional): only run these benchmarks, e.g. to confirm a regression. Defaults to None.
+
+    Returns:
+        dict: benchmark name to the timing dict of time_callable
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as folder:
+        for name, setup in BENCHMARKS:
+            if(name_filter is not None and name_filter not in name):
+                continue
+            if(names is not None and name not in names):
+                continue
+
+            #same random numbers on every run, and keep the setup chatter (LocationParser, LocationGenerator) out of the output
+            random.seed(0)
+            with contextlib.redirect_stdout(io.StringIO()):
+                function = setup(folder)
+            results[name] = time_callable(function, repeat, min_time)
+            print("  %-58s %10.4f ms" % (name, results[name]["median_ms"]))
+    return results
+
+def environment():
+    return {"python": platform.python_version(), "numpy": np.__version__, "pygame": pygame.version.ver, "machine": platform.machine(), "system": platform.system()}
+
+def compare(results, baseline, tolerance, noise_floor=0.05):
+    """Compares the fastest sample of each benchmark against the baseline, the minimum is much less affected by other load on the machine than the median
+
+    Args:
+        results (dict): output of run_benchmarks
+        baseline (dict): 'results' of a previously saved run
+        tolerance (float): allowed slowdown as a fraction, 0.5 flags anything more than 50% slower than the baseline
+        noise_floor (float, optional): slowdowns of less than this many milliseconds are noise however large the ratio is, which matters for benchmarks that take microseconds. Defaults to 0.05.
+
+    Returns:
+        list str: names of the benchmarks that regressed
+    """
+    regressions = []
+    for name, timing in results.items():
+        if(name not in baseline):
+            print("  %-58s %10s" % (name, "new"))
+            continue
+        ratio = timing["min_ms"] / baseline[name]["min_ms"]
+        status = ""
+        if(ratio > 1 + tolerance):
+            if(name.startswith(UNGATED)):
+                status = "slower (not gated)"
+            elif(timing["min_ms"] - baseline[name]["min_ms"] < noise_floor):
+                status = "slower (below noise floor)"
+            else:
+                status = "REGRESSION"
+                regressions.append(name)
+        print("  %-58s %9.2fx %s" % (name, ratio, status))
+    return regressions
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Headless benchmarks of the lidar parser, the game physics and the renderers.")
+    arg_parser.add_argument("--filter", "-k", help="Only run benchmarks whose name contains this string.")
+    arg_parser.add_argument("--repeat", type=int, default=7, help="Number of timing samples per benchmark, the median is reported.")
+    arg_parser.add_argument("--min_time", type=float, default=0.05, help="Minimum length of each timing sample in seconds.")
+    arg_parser.add_argument("--output", "-o", help="Write the results to this JSON file.")
+    arg_parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline JSON file the results are compared against. Defaults to benchmark_baseline.json in the repo.")
+    arg_parser.add_argument("--save_baseline", action="store_true", help="Overwrite the baseline with the results of this run instead of comparing against it.")
+    arg_parser.add_argument("--tolerance", type=float, default=0.5, help="Allowed slowdown against the baseline as a fraction before a benchmark counts as a regression.")
+    arg_parser.add_argument("--noise_floor", type=float, default=0.05, help="Slowdowns of less than this many milliseconds never count as a regression.")
+    arg_parser.add_argument("--confirm", type=int, default=2, help="Number of times a regressed benchmark is run again, it only counts as a regression if it is still slower every time.")
+    args = arg_parser.parse_args()
+
+    os.chdir(REPO_FOLDER)
+    pygame.init()
+
+    print("running benchmarks (median time per call)")
+    results = run_benchmarks(args.filter, args.repeat, args.min_time)
+    report = {"time": time.time(), "environment": environment(), "results": results}
+    pygame.quit()
+
+    if(args.output is not None):
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if(args.save_baseline):
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print("saved baseline to '%s'" % args.baseline)
+        return
+
+    if(not os.path.exists(args.baseline)):
+        print("no baseline at '%s', run with --save_baseline to create one" % args.baseline)
+        return
+
+    with open(args.baseline, "r") as f:
+        baseline = json.load(f)
+    print("compared to the baseline from %s (slower than %0.2fx counts as a regression)" % (time.ctime(baseline["time"]), 1 + args.tolerance))
+    regressions = compare(results, baseline["results"], args.tolerance, args.noise_floor)
+
+    #a real slowdown reproduces, noise usually doesn't, so run the regressed benchmarks again and keep the fastest sample of all runs
+    for a in range(args.confirm):
+        if(len(regressions) == 0):
+            break
+        print("running %d regressed benchmark(s) again to confirm" % len(regressions))
+        rerun = run_benchmarks(repeat=args.repeat, min_time=args.min_time, names=regressions)
+        for name, timing in rerun.items():
+            if(timing["min_ms"] < results[name]["min_ms"]):
+                results[name] = timing
+        regressions = compare({name: results[name] for name in regressions}, baseline["results"], args.tolerance, args.noise_floor)
+    if(len(regressions) > 0):
+        print("%d benchmark(s) regressed" % len(regressions))
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+
+import json, argparse
+import numpy as np
+
+def _normalizing_transform(points):
+    #similarity transform that moves the points to the origin with an average distance of sqrt(2), this keeps the DLT well conditioned
+    mean = np.mean(points, axis=0)
+    distance = np.mean(np.hypot(points[:, 0] - mean[0], points[:, 1] - mean[1]))
+    scale = np.sqrt(2) / max(distance, 1e-12)
+    return np.array([[scale, 0, -scale * mean[0]], [0, scale, -scale * mean[1]], [0, 0, 1]])
+
+def _transform(matrix, points):
+    #applies a 3x3 projective transform to (N,2) points
+    projected = points @ matrix[:2, :2].T + matrix[:2, 2]
+    w = points @ matrix[2, :2] + matrix[2, 2]
+    return projected / w[:, None]
+
+def fit_homography(source, destination):
+    """Fits the homography that maps source points onto destination points with the normalized direct linear transform
+
+    Args:
+        source (array like): (N,2) points, N >= 4 and no three of them on a line
+        destination (array like): (N,2) points the source points should map to
+
+    Returns:
+        numpy.ndarray: 3x3 homography, scaled so the bottom right entry is 1
+    """
+    source = np.asarray(source, dtype=np.float64).reshape(-1, 2)
+    destination = np.asarray(destination, dtype=np.float64).reshape(-1, 2)
+    if(len(source) < 4 or len(source) != len(destination)):
+        raise ValueError("A homography needs at least 4 point correspondences, got %d source and %d destination points" % (len(source), len(destination)))
+
+    source_transform = _normalizing_transform(source)
+    destination_transform = _normalizing_transform(destination)
+    x, y = _transform(source_transform, source).T
+    u, v = _transform(destination_transform, destination).T
+
+    #two equations per correspondence, the homography is the null space of the stacked system
+    zeros, ones = np.zeros(len(x)), np.ones(len(x))
+    system = np.empty((2 * len(x), 9))
+    system[0::2] = np.stack((-x, -y, -ones, zeros, zeros, zeros, u * x, u * y, u), axis=1)
+    system[1::2] = np.stack((zeros, zeros, zeros, -x, -y, -ones, v * x, v * y, v), axis=1)
+    normalized = np.linalg.svd(system)[2][-1].reshape(3, 3)
+
+    homography = np.linalg.inv(destination_transform) @ normalized @ source_transform
+    return homography / homography[2, 2]
+
+
+class Calibration():
+    def __init__(self, homography, resolution=(1920, 1080), distortion=(0.0, 0.0)):
+        """Maps floor positions in meters (x, y) to projector pixels with a homography, which handles offset, rotation, scale and keystone,
+            followed by an optional radial lens distortion around the center of the image.
+
+        Args:
+            homography (array like): 3x3 matrix mapping floor meters to undistorted pixels
+            resolution (tuple, optional): pixel resolution the calibration was made at. Defaults to (1920, 1080).
+            distortion (tuple, optional): (k1, k2) radial distortion coefficients, (0, 0) is no distortion. Defaults to (0.0, 0.0).
+        """
+        self.homography = np.asarray(homography, dtype=np.float64).reshape(3, 3)
+        self.homography = self.homography / self.homography[2, 2]
+        self.resolution = (int(resolution[0]), int(resolution[1]))
+        self.distortion = (float(distortion[0]), float(distortion[1]))
+
+        #the inverse is used to map pixels back to the floor, computed once here rather than on every call
+        self.inverse = np.linalg.inv(self.homography)
+
+        #distortion works on coordinates relative to the center, normalized by half the image diagonal
+        self.center = np.array(self.resolution, dtype=np.float64) / 2
+        self.radius = np.hypot(*self.resolution) / 2
+
+    @classmethod
+    def from_field_size(cls, field_size, resolution=(1920, 1080)):
+        """Calibration that stretches the field over the whole image, the same mapping LocationParser uses without a calibration
+
+        Args:
+            field_size (tuple): (width, height) of the projected field in meters
+            resolution (tuple, optional): pixel resolution. Defaults to (1920, 1080).
+        """
+        return cls(np.diag([resolution[0] / field_size[0], resolution[1] / field_size[1], 1.0]), resolution)
+
+    @classmethod
+    def fit(cls, floor_points, pixel_points, resolution=(1920, 1080), distortion=False, iterations=100):
+        """Fits a calibration to measured point correspondences, e.g. someone standing on projected markers
+
+        Args:
+            floor_points (array like): (N,2) positions in meters (x, y) as reported by the lidar
+            pixel_points (array like): (N,2) pixel positions the floor points should be drawn at
+            resolution (tuple, optional): pixel resolution of the pixel points. Defaults to (1920, 1080).
+            distortion (bool, optional): also fit radial lens distortion, needs at least 5 points (more is much better). Defaults to False.
+            iterations (int, optional): maximum number of refinement iterations when fitting distortion. Defaults to 100.
+
+        Returns:
+            Calibration: the fitted calibration
+        """
+        floor_points = np.asarray(floor_points, dtype=np.float64).reshape(-1, 2)
+        pixel_points = np.asarray(pixel_points, dtype=np.float64).reshape(-1, 2)
+        calibration = cls(fit_homography(floor_points, pixel_points), resolution)
+        if(not distortion):
+            return calibration
+
+        if(len(floor_points) < 5):
+            raise ValueError("Fitting lens distortion needs at least 5 point correspondences, got %d" % len(floor_points))
+        return calibration._refine(floor_points, pixel_points, iterations)
+
+    def _refine(self, floor_points, pixel_points, iterations):
+        #Levenberg-Marquardt over the 8 free homography entries and the 2 distortion coefficients, starting from the DLT fit without distortion
+        def project(parameters):
+            return Calibration(np.append(parameters[:8], 1.0), self.resolution, parameters[8:]).apply(floor_points)
+
+        parameters = np.concatenate((self.homography.ravel()[:8], self.distortion))
+        residual = (project(parameters) - pixel_points).ravel()
+        cost = residual @ residual
+        damping = 1e-3
+
+        for a in range(iterations):
+            #numerical jacobian, the parameters differ in magnitude by orders of magnitude so the step is relative to each one
+            jacobian = np.empty((len(residual), len(parameters)))
+            for i in range(len(parameters)):
+                step = 1e-6 * max(abs(parameters[i]), 1e-6)
+                shifted = parameters.copy()
+                shifted[i] += step
+                jacobian[:, i] = ((project(shifted) - pixel_points).ravel() - residual) / step
+
+            normal = jacobian.T @ jacobian
+            gradient = jacobian.T @ residual
+            improved = False
+            while(damping < 1e12):
+                try:
+                    delta = np.linalg.solve(normal + damping * np.diag(np.diag(normal)), -gradient)
+                except np.linalg.LinAlgError:
+                    damping *= 10
+                    continue
+                candidate = parameters + delta
+                candidate_residual = (project(candidate) - pixel_points).ravel()
+                candidate_cost = candidate_residual @ candidate_residual
+                if(candidate_cost < cost):
+                    improved = cost - candidate_cost > 1e-12 * cost
+                    parameters, residual, cost = candidate, candidate_residual, candidate_cost
+                    damping = max(damping / 10, 1e-12)
+                    break
+                damping *= 10
+
+            if(not improved):
+                break
+
+        return Calibration(np.append(parameters[:8], 1.0), self.resolution, parameters[8:])
+
+    def apply(self, meters, out=None):
+        """Maps floor positions to pixels, all positions at once
+
+        Args:
+            meters (array like): (N,2) floor positions in meters (x, y)
+            out (numpy.ndarray, optional): (N,2) array the pixels are written into (e.g. the LocationParser buffer), None allocates a new one. Defaults to None.
+
+        Returns:
+            numpy.ndarray: (N,2) pixel positions
+        """
+        pixels = _transform(self.homography, np.asarray(meters, dtype=np.float64).reshape(-1, 2))
+
+        k1, k2 = self.distortion
+        if(k1 != 0 or k2 != 0):
+            offset = (pixels - self.center) / self.radius
+            r2 = np.sum(offset * offset, axis=1, keepdims=True)
+            pixels = self.center + offset * (1 + k1 * r2 + k2 * r2 * r2) * self.radius
+
+        if(out is None):
+            return pixels
+        out[...] = pixels
+        return out
+
+    def invert(self, pixels, iterations=10):
+        """Maps pixels back to floor positions, the inverse of apply()
+
+        Args:
+            pixels (array like): (N,2) pixel positions
+            iterations (int, optional): fixed point iterations used to undo the lens distortion. Defaults to 10.
+
+        Returns:
+            numpy.ndarray: (N,2) floor positions in meters (x, y)
+        """
+        pixels = np.asarray(pixels, dtype=np.float64).reshape(-1, 2)
+
+        k1, k2 = self.distortion
+        if(k1 != 0 or k2 != 0):
+            #the distortion has no closed form inverse, but it is close to 1 so iterating converges quickly
+            distorted = (pixels - self.center) / self.radius
+            offset = distorted.copy()
+            for a in range(iterations):
+                r2 = np.sum(offset * offset, axis=1, keepdims=True)
+                offset = distorted / (1 + k1 * r2 + k2 * r2 * r2)
+            pixels = self.center + offset * self.radius
+
+        return _transform(self.inverse, pixels)
+
+    def errors(self, floor_points, pixel_points):
+        """Distance in pixels between where each floor point is mapped and where it should be
+
+        Returns:
+            numpy.ndarray: (N,) reprojection error of every point
+        """
+        difference = self.apply(floor_points) - np.asarray(pixel_points, dtype=np.float64).reshape(-1, 2)
+        return np.hypot(difference[:, 0], difference[:, 1])
+
+    def scaled(self, resolution):
+        """Same calibration for a different output resolution, e.g. when a game renders at a lower internal resolution.
+            The distortion carries over exactly as long as the aspect ratio stays the same.
+
+        Args:
+            resolution (tuple): new (width, height) in pixels
+
+        Returns:
+            Calibration: calibration at the new resolution
+        """
+        scale = np.diag([resolution[0] / self.resolution[0], resolution[1] / self.resolution[1], 1.0])
+        return Calibration(scale @ self.homography, resolution, self.distortion)
+
+    def save(self, path):
+        """Writes the calibration to a JSON file"""
+        with open(path, "w") as f:
+            json.dump({"homography": self.homography.tolist(), "resolution": list(self.resolution), "distortion": list(self.distortion)}, f, indent=2)
+
+    @classmethod
+    def load(cls, path):
+        """Reads a calibration written by save()
+
+        Returns:
+            Calibration: the loaded calibration
+        """
+        with open(path, "r") as f:
+            data = json.load(f)
+        return cls(data["homography"], data.get("resolution", (1920, 1080)), data.get("distortion", (0.0, 0.0)))
+
+
+def main():
+    """Fits a calibration from a CSV file of measured points, one 'floor_x,floor_y,pixel_x,pixel_y' correspondence per line (floor in meters)"""
+    arg_parser = argparse.ArgumentParser(description="Fit the floor to projector calibration used by LocationParser(calibration_file=...).")
+    arg_parser.add_argument("points", help="CSV file with one 'floor_x,floor_y,pixel_x,pixel_y' line per measured point, floor positions in meters.")
+    arg_parser.add_argument("--output", "-o", default="calibration.json", help="File the calibration is written to.")
+    arg_parser.add_argument("--resolution", "-r", default="1920:1080", help="Resolution of the pixel positions given in format 'width:height'.")
+    arg_parser.add_argument("--distortion", action="store_true", help="Also fit radial lens distortion (needs at least 5 points).")
+    args = arg_parser.parse_args()
+
+    points = np.loadtxt(args.points, delimiter=",", ndmin=2)
+    resolution = tuple(int(a) for a in args.resolution.split(":"))
+    calibration = Calibration.fit(points[:, :2], points[:, 2:4], resolution, distortion=args.distortion)
+
+    errors = calibration.errors(points[:, :2], points[:, 2:4])
+    print("fitted %d points, reprojection error mean %0.2fpx, max %0.2fpx" % (len(points), np.mean(errors), np.max(errors)))
+    if(args.distortion):
+        print("distortion k1=%0.5f k2=%0.5f" % calibration.distortion)
+    calibration.save(args.output)
+    print("saved calibration to '%s'" % args.output)
+
+if __name__ == "__main__":
+    main()
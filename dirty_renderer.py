@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+import pygame
+
+class DirtyRectRenderer():
+    def __init__(self, screen, background, enabled=True, display=None):
+        """Renders a game by only touching the parts of the screen that changed.
+            Static layers (field lines, borders, etc.) are drawn once onto the background surface, every frame the areas that were drawn on during
+            the last frame are restored from the background and only those areas plus the newly drawn ones are sent to the display.
+
+        Args:
+            screen (pygame.Surface): display surface
+            background (pygame.Surface): pre-rendered static layers, the same size as the screen
+            enabled (bool, optional): when False every frame is a full redraw and flip, handy for comparing the two. Defaults to True.
+            display (GameDisplay, optional): when given frames are sent through display.present() instead of straight to pygame.display. Defaults to None.
+        """
+        self.screen = screen
+        self.background = background
+        self.previous_rects = []
+        self.rects = []
+        self.enabled = enabled
+        self.display = display
+
+        #the whole screen has to be drawn once before only the dirty parts can be updated
+        self.full_redraw = True
+
+    def restore(self):
+        """Erases everything drawn in the last frame by copying the background back over it, call this before drawing the new frame"""
+        if(self.full_redraw or not self.enabled):
+            self.screen.blit(self.background, (0, 0))
+            return
+
+        for a in self.previous_rects:
+            self.screen.blit(self.background, a, a)
+
+    def add(self, rect):
+        """Marks an area as drawn on this frame, pygame.draw.* and Surface.blit both return the rect they touched so their result can be passed straight in
+
+        Args:
+            rect (pygame.Rect): area that was drawn on
+        """
+        self.rects.append(rect)
+        return rect
+
+    def finish(self):
+        """Ends the frame without sending it to the display, for when something else (e.g. the launcher) presents the frame
+
+        Returns:
+            list pygame.Rect: areas of the screen that changed this frame, None if the whole screen has to be sent
+        """
+        if(self.full_redraw or not self.enabled):
+            rects = None
+            self.full_redraw = False
+        else:
+            #the old areas have to be sent too, otherwise whatever was erased from them would stay on the display
+            rects = self.previous_rects + self.rects
+
+        self.previous_rects = self.rects
+        self.rects = []
+        return rects
+
+    def invalidate(self, rect):
+        """Marks an area that was drawn on after finish() (e.g. an overlay drawn on top of the game) so it gets restored on the next frame
+
+        Args:
+            rect (pygame.Rect): area that was drawn on
+        """
+        self.previous_rects.append(rect)
+
+    def present(self):
+        """Sends the changed areas to the display, this replaces pygame.display.flip()"""
+        rects = self.finish()
+        if(self.display is not None):
+            self.display.present(rects)
+        elif(rects is None):
+            pygame.display.flip()
+        else:
+            pygame.display.update(rects)
+
+    def set_background(self, background, screen=None):
+        """Replaces the static layers (and optionally the surface being drawn on), the next frame will be a full redraw"""
+        self.background = background
+        if(screen is not None):
+            self.screen = screen
+        self.previous_rects = []
+        self.rects = []
+        self.full_redraw = True
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+
+import time
+import pygame
+
+class GameDisplay():
+    def __init__(self, output_size=(1920, 1080), render_scale=1.0, auto_quality=False, target_fps=120, quality_levels=(1.0, 0.75, 0.5), fullscreen=True, display_latency=0.0):
+        """Shared display setup for the games. Games draw onto GameDisplay.surface at the internal resolution and the result is scaled up to the projector.
+
+            With a fixed render_scale the display itself is opened at the internal resolution with pygame.SCALED, so SDL does the upscaling on the GPU.
+            With auto_quality the display is opened at the render_scale resolution and the game is drawn onto an offscreen surface whose resolution
+            steps down through quality_levels when frames take longer than the target frame time (and back up when there is headroom), the
+            offscreen surface is then scaled onto the display on the CPU. Register a callback in on_resize to re-layout the game when that happens.
+
+        Args:
+            output_size (tuple, optional): resolution of the projector output. Defaults to (1920, 1080).
+            render_scale (float, optional): internal resolution as a fraction of output_size, 0.5 renders at 960x540 for a 1920x1080 output. Defaults to 1.0.
+            auto_quality (bool, optional): automatically lower/raise the internal resolution to hold target_fps. Defaults to False.
+            target_fps (int, optional): frame rate tick() limits to and auto_quality tries to hold. Defaults to 120.
+            quality_levels (tuple, optional): fractions of the render_scale resolution auto_quality can pick from, highest quality first. Defaults to (1.0, 0.75, 0.5).
+            fullscreen (bool, optional): open the display fullscreen. Defaults to True.
+            display_latency (float, optional): seconds the projector takes to show a frame after it is presented, added to the measured latency. Defaults to 0.0.
+        """
+        self.output_size = output_size
+        self.render_scale = render_scale
+        self.auto_quality = auto_quality
+        self.target_fps = target_fps
+        self.display_latency = display_latency
+        self.quality_levels = quality_levels if auto_quality else (1.0,)
+        self.quality_level = 0
+
+        #called with the new internal size whenever auto_quality changes the resolution
+        self.on_resize = []
+
+        self.display_size = (int(output_size[0] * render_scale), int(output_size[1] * render_scale))
+        flags = pygame.SCALED | (pygame.FULLSCREEN if fullscreen else 0)
+        self.screen = pygame.display.set_mode(self.display_size, flags)
+        self.surface = self.screen
+
+        self.clock = pygame.time.Clock()
+
+        #time spent on each frame excluding the wait in tick(), smoothed so a single slow frame doesn't change the quality
+        self.average_frame_time = 1 / target_fps
+        self.frame_start = None
+        self.frames_since_change = 0
+
+    @property
+    def size(self):
+        """Internal resolution the game is currently drawing at"""
+        return self.surface.get_size()
+
+    def present(self, rects=None):
+        """Sends the finished frame to the projector, this replaces pygame.display.flip()
+
+        Args:
+            rects (list pygame.Rect, optional): only update these areas of the display, ignored when the frame has to be scaled. Defaults to None.
+        """
+        if(self.surface is not self.screen):
+            pygame.transform.scale(self.surface, self.display_size, self.screen)
+            pygame.display.flip()
+        elif(rects is not None):
+            pygame.display.update(rects)
+        else:
+            pygame.display.flip()
+
+    def tick(self):
+        """Waits until it is time for the next frame, this replaces clock.tick(). With auto_quality this also adjusts the internal resolution
+
+        Returns:
+            int: milliseconds since the previous tick, same as pygame.time.Clock.tick
+        """
+        now = time.perf_counter()
+        if(self.frame_start is not None):
+            self.average_frame_time = 0.95 * self.average_frame_time + 0.05 * (now - self.frame_start)
+
+        elapsed = self.clock.tick(self.target_fps)
+        self.frame_start = time.perf_counter()
+
+        if(self.auto_quality):
+            self._adjust_quality()
+        return elapsed
+
+    def _adjust_quality(self):
+        #give the average time to settle after every change so the resolution doesn't oscillate
+        self.frames_since_change += 1
+        if(self.frames_since_change < self.target_fps):
+            return
+
+        budget = 1 / self.target_fps
+        if(self.average_frame_time > budget * 0.9 and self.quality_level < len(self.quality_levels) - 1):
+            self.set_quality(self.quality_level + 1)
+        elif(self.average_frame_time < budget * 0.5 and self.quality_level > 0):
+            self.set_quality(self.quality_level - 1)
+
+    def set_quality(self, level):
+        """Switches to one of the quality_levels and notifies the on_resize callbacks
+
+        Args:
+            level (int): index into quality_levels
+        """
+        self.quality_level = level
+        self.frames_since_change = 0
+
+        scale = self.quality_levels[level]
+        if(scale == 1.0):
+            self.surface = self.screen
+        else:
+            self.surface = pygame.Surface((int(self.display_size[0] * scale), int(self.display_size[1] * scale))).convert()
+
+        for callback in self.on_resize:
+            callback(self.size)
+
+
+def add_display_arguments(arg_parser):
+    """Adds the shared display options to a game's argparse parser"""
+    arg_parser.add_argument("--render_scale", type=float, default=1.0, help="Internal render resolution as a fraction of the projector resolution, e.g. 0.5 renders at 960x540 and scales up to 1920x1080.")
+    arg_parser.add_argument("--auto_quality", action="store_true", help="Automatically lower the internal resolution when the game can't hold its frame rate.")
+    arg_parser.add_argument("--windowed", action="store_true", help="Open a window instead of going fullscreen.")
+    arg_parser.add_argument("--display_latency", type=float, default=0.0, help="Milliseconds the projector takes to show a frame, added to the measured latency that positions are extrapolated by.")
+
+
+def display_from_arguments(args, target_fps=120):
+    """Creates the GameDisplay described by the options added with add_display_arguments"""
+    return GameDisplay(render_scale=args.render_scale, auto_quality=args.auto_quality, target_fps=target_fps, fullscreen=not args.windowed, display_latency=args.display_latency / 1000)
@@ -6,115 +6,201 @@
 import pygame
 import random
 import numpy as np
-import sys
-from location_parser import LocationParser
-           
-lidar_positioner = LocationParser()
-
-pygame.init()
-
-# Set up the drawing window
-# screen = pygame.display.set_mode([1920, 1080])
-
-#render resolution, this will be scaled to the screen
-SCREEN_WIDTH, SCREEN_HEIGHT = 1920 , 1080 
-
-screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.FULLSCREEN | pygame.SCALED)
-
-running = True
-clock = pygame.time.Clock()
-
-class ResponsivePoint(): 
-    def __init__(self, x, y): 
-        self.x = x
-        self.y = y
-
-        self.xd = x
-        self.yd = y
-
-    def draw(self, screen, distortions): 
-        c = pygame.Color(255,255,255)
-        # pygame.draw.line(screen,c, (self.x, 0), (self.x, SCREEN_HEIGHT), 5)
-        
-        #for now just take the first distortion point
-        #calc distance
-        force = 0
-        direction_vector = [0,0]
-        for a in distortions: 
-            force = 1/np.sqrt((a[0] - self.x) ** 2 + (a[1] - self.y) ** 2)
-            # direction_vector += np.array([(distortions_x[0] - self.x), (distortions_y[0] - self.y)]) * force 
-            direction_vector[0] += (a[0] - self.x) * force
-            direction_vector[1] += (a[1] - self.y) * force
-
-        self.xd = self.x -  100*direction_vector[0]
-        self.yd = self.y -  100*direction_vector[1]
-
-        pygame.draw.circle(screen, c, (self.xd, self.yd), 5)    
+from pixel_pipeline import PixelLayer
+from tracker import greedy_assignment
+from launcher import GamePlugin, run_game
 
 class ResponsiveGrid(): 
-    def __init__(self, rows, columns, draw_lines=False):
+    def __init__(self, rows, columns, draw_lines=False, strength=100, antialias=False, point_radius=5, size=(1920, 1080), move_threshold=2.0):
+        """Grid of points that get pushed away from the detected people. 
+            The grid is held as (rows, columns, 2) arrays so the displacement of every point is computed in a single broadcast over all points and all positions. 
+            The push of every person is cached, only people that moved (or arrived or left) since the last update are recomputed, so a calm floor costs next to nothing. 
+
+        Args:
+            rows (int): number of rows of points
+            columns (int): number of columns of points
+            draw_lines (bool, optional): connect neighbouring points with lines. Defaults to False.
+            strength (int, optional): how far the points get pushed by each person. Defaults to 100.
+            antialias (bool, optional): draw the grid lines antialiased. Defaults to False.
+            point_radius (int, optional): radius of the dot drawn on every point, 0 disables the dots. Defaults to 5.
+            size (tuple, optional): size of the area the grid covers in pixels. Defaults to (1920, 1080).
+            move_threshold (float, optional): distance in pixels a person has to move before their push is recomputed, this also hides lidar jitter. Defaults to 2.0.
+        """
         self.rows = rows
         self.columns = columns
         self.draw_lines = draw_lines
-
-        self.points = []
-
-        for r in range(rows): 
-            for c in range(columns):
-                self.points.append(ResponsivePoint(c * (SCREEN_WIDTH / self.columns) + (SCREEN_WIDTH / self.columns) * 0.5, r * (SCREEN_HEIGHT / self.rows) + (SCREEN_HEIGHT / self.rows) * 0.5))
-
-    def draw(self, screen, distortions): 
-        for a in self.points: 
-            a.draw(screen, distortions)
-
+        self.strength = strength
+        self.antialias = antialias
+        self.point_radius = point_radius
+
+        #every point uses the same dot, so render it once and blit copies of it
+        self.dot_sprite = None
+        if(point_radius > 0): 
+            self.dot_sprite = pygame.Surface((2 * point_radius, 2 * point_radius), pygame.SRCALPHA)
+            pygame.draw.circle(self.dot_sprite, (255,255,255), (point_radius, point_radius), point_radius)
+
+        #resting position of every point, each point sits in the center of its cell
+        x = (np.arange(columns) + 0.5) * (size[0] / self.columns)
+        y = (np.arange(rows) + 0.5) * (size[1] / self.rows)
+        self.points = np.empty((rows, columns, 2), dtype=np.float32)
+        self.points[:, :, 0] = x[None, :]
+        self.points[:, :, 1] = y[:, None]
+
+        #displaced position of every point, this is what gets drawn
+        self.displaced = self.points.copy()
+
+        #cached push of every person: where they were when it was computed, their (2, rows, columns) push and the sum of all of them
+        #x and y are kept as separate planes, which is much faster to compute than interleaved (rows, columns, 2) pairs
+        #the sum is kept in float64 so adding and removing people over a long session doesn't drift
+        self.move_threshold = move_threshold
+        self.sources = np.zeros((0, 2), dtype=np.float32)
+        self.contributions = []
+        self.field = np.zeros((2, rows, columns), dtype=np.float64)
+        self.point_planes = np.ascontiguousarray(self.points.transpose(2, 0, 1))
+
+    def _push(self, people): 
+        #unit vector from every point to every person, shape (people, 2, rows, columns)
+        #a person standing exactly on a point doesn't push it
+        dx = people[:, 0, None, None] - self.point_planes[0]
+        dy = people[:, 1, None, None] - self.point_planes[1]
+        distance = np.hypot(dx, dy)
+        force = np.divide(1, distance, out=np.zeros_like(distance), where=distance > 0)
+        dx *= force
+        dy *= force
+        return np.stack((dx, dy), axis=1)
+
+    def update(self, distortions): 
+        """Updates the displaced position of every point 
+
+        Args:
+            distortions (array like): (N,2) positions of the people pushing the grid around
+
+        Returns:
+            bool: True if the grid moved
+        """
+        distortions = np.asarray(distortions, dtype=np.float32).reshape(-1, 2)
+
+        #the lidar usually lists people in the same order, so first check whether nobody moved without matching anyone
+        if(len(distortions) == len(self.sources)): 
+            offset = distortions - self.sources
+            if(np.all(np.sum(offset * offset, axis=1) < self.move_threshold ** 2)): 
+                return False
+
+        #pair every person with a cached push that was computed within move_threshold of where they are now
+        distance = np.hypot(self.sources[:, None, 0] - distortions[None, :, 0], self.sources[:, None, 1] - distortions[None, :, 1])
+        cached, matched = greedy_assignment(distance, self.move_threshold)
+        keep = np.zeros(len(self.sources), dtype=bool)
+        keep[cached] = True
+        new = np.ones(len(distortions), dtype=bool)
+        new[matched] = False
+        removed = np.flatnonzero(~keep)
+        added = np.flatnonzero(new)
+        if(len(removed) == 0 and len(added) == 0): 
+            return False
+
+        if(len(removed) + len(added) > len(distortions)): 
+            #most people moved, rebuilding the sum is cheaper than taking every old push out and putting every new one in
+            contributions = self._push(distortions)
+            self.sources = distortions.copy()
+            self.contributions = list(contributions)
+            np.sum(contributions, axis=0, out=self.field)
+        else: 
+            #take out the people that left or moved, put in the ones that arrived or moved
+            for a in removed.tolist(): 
+                self.field -= self.contributions[a]
+            contributions = self._push(distortions[added])
+            self.field += np.sum(contributions, axis=0)
+
+            self.sources = np.concatenate((self.sources[keep], distortions[added]))
+            self.contributions = [a for a, k in zip(self.contributions, keep.tolist()) if k] + list(contributions)
+
+        if(len(self.sources) == 0): 
+            self.field[:] = 0
+
+        np.subtract(self.points, self.strength * self.field.transpose(1, 2, 0), out=self.displaced, casting="unsafe")
+        return True
+
+    def draw(self, screen, distortions=None): 
+        """Draws the grid
+
+        Args:
+            distortions (array like, optional): positions of the people, when None the grid is drawn as of the last update() call. Defaults to None.
+        """
+        if(distortions is not None): 
+            self.update(distortions)
+
+        #one blit call for all of the dots, the sprite is offset so it is centered on the point
+        if(self.dot_sprite is not None): 
+            corners = (self.displaced - self.point_radius).reshape(-1, 2).tolist()
+            screen.blits([(self.dot_sprite, a) for a in corners], False)
+
+        #each row and each column is a single polyline, so the number of draw calls is rows + columns
         if(self.draw_lines):
-            for index, element in enumerate(self.points): 
-                #connect line to the left dot, and the above dot 
-                
-                left_index = index - 1
-                above_index = index - self.columns
-
-                if(left_index > 0 and above_index > 0 and index % self.columns > 0 ): 
-                    pygame.draw.line(screen, (255,255,255), (element.xd, element.yd), (self.points[left_index].xd, self.points[left_index].yd), 1)
-                    pygame.draw.line(screen, (255,255,255), (element.xd, element.yd), (self.points[above_index].xd, self.points[above_index].yd), 1)
+            draw_polyline = pygame.draw.aalines if self.antialias else pygame.draw.lines
+            rows = self.displaced.tolist()
+            columns = self.displaced.transpose(1, 0, 2).tolist()
+            for a in rows: 
+                draw_polyline(screen, (255,255,255), False, a)
+            for a in columns: 
+                draw_polyline(screen, (255,255,255), False, a)
         
 
 TOTAL_ROWS = 2 * 9 
 TOTAL_COLUMNS = 2 * 16
 
-grid = ResponsiveGrid(TOTAL_ROWS, TOTAL_COLUMNS, draw_lines=True)
-
-screen.fill((255,255,255))
-
-while running:
-
-
-    # Did the user click the window close button?
-
-    for event in pygame.event.get():
-
-        if event.type == pygame.QUIT:
-
-            running = False
-
-
-    # Fill the background with white
-
-    screen.fill((0,0,0, 1))
-
-    positions = lidar_positioner.getPositions()
-    for xy in positions: 
-        pygame.draw.circle(screen, (0,0,255), xy, 10)  
-    grid.draw(screen, positions)
-
-    # Flip the display
-    pygame.display.flip()
-
-    # pygame.display.flip()
-    clock.tick(120)
-
-
-# Done! Time to quit.
-
-pygame.quit()
-sys.exit()
+#when True people leave glowing footprints under the grid that slowly fade away
+FOOTPRINT_TRAILS = False
+
+def create_grid(size): 
+    #the grid was tuned at 1920x1080, scale the push strength and dot size with the internal resolution
+    scale = size[1] / 1080
+    return ResponsiveGrid(TOTAL_ROWS, TOTAL_COLUMNS, draw_lines=True, strength=100 * scale, point_radius=max(1, int(5 * scale)), size=size, move_threshold=2.0 * scale)
+
+class GridGame(GamePlugin): 
+    def __init__(self, runtime): 
+        """Grid of dots that gets pushed away from everyone standing on the field"""
+        super().__init__(runtime)
+        self.positions = np.zeros((0, 2), dtype=np.float32)
+
+    def prepare(self): 
+        #the grid's dot sprite and the trail layer are SDL surfaces, so they are made on the main thread
+        self.grid = create_grid(self.size)
+        self.trail_layer = PixelLayer(self.size) if FOOTPRINT_TRAILS else None
+
+    def resize(self, size): 
+        #the internal resolution changed, rebuild everything that depends on it
+        self.grid = create_grid(size)
+        self.trail_layer = PixelLayer(size) if FOOTPRINT_TRAILS else None
+
+    def update(self, positions, dt): 
+        self.positions = positions
+
+        #the grid computes its displacement field and draws in one go, time them separately
+        with self.runtime.profiler.scope("grid field"): 
+            self.grid.update(positions)
+
+    def draw(self, surface): 
+        profiler = self.runtime.profiler
+
+        # Fill the background with black
+        with profiler.scope("background"): 
+            if(FOOTPRINT_TRAILS): 
+                #the trail layer replaces the background fill
+                self.trail_layer.fade(0.97)
+                self.trail_layer.splat(self.positions, 40, (0, 60, 120))
+                self.trail_layer.blit_to(surface)
+            else: 
+                surface.fill((0,0,0, 1))
+
+        with profiler.scope("draw"): 
+            for xy in self.positions.tolist(): 
+                pygame.draw.circle(surface, (0,0,255), xy, 10 * surface.get_height() / 1080)  
+            self.grid.draw(surface)
+
+GAME = GridGame
+
+def main(): 
+    run_game(GridGame)
+
+if __name__ == "__main__": 
+    main()
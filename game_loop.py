@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+
+import time
+
+class FixedTimestepLoop():
+    def __init__(self, physics_hz=240, max_frame_time=0.25, clock=time.perf_counter):
+        """Fixed timestep accumulator that decouples the physics rate from the render rate.
+            Call advance() once per rendered frame, it returns how many physics steps of length dt have to run to catch up with real time.
+            After stepping, alpha tells how far between the last two physics steps the render time is, so drawing can interpolate.
+
+        Args:
+            physics_hz (int, optional): rate the physics runs at in steps per second. Defaults to 240.
+            max_frame_time (float, optional): longest frame in seconds that is caught up on, anything longer is dropped so a stall (e.g. a slow disk)
+                doesn't turn into a burst of hundreds of physics steps. Defaults to 0.25.
+            clock (function, optional): time source in seconds. Defaults to time.perf_counter.
+        """
+        self.dt = 1 / physics_hz
+        self.max_frame_time = max_frame_time
+        self.clock = clock
+        self.accumulator = 0
+        self.last_time = None
+
+        #real time that was thrown away because frames took longer than max_frame_time
+        self.dropped_time = 0
+
+    def advance(self, frame_time=None):
+        """Measures the time since the last call and works out how many physics steps are due
+
+        Args:
+            frame_time (float, optional): length of the frame in seconds when it is already known (e.g. the dt a launcher passes to a game), 
+                None measures it with the clock. Defaults to None.
+
+        Returns:
+            int: number of physics steps to run this frame
+        """
+        if(frame_time is None):
+            now = self.clock()
+            frame_time = 0 if self.last_time is None else now - self.last_time
+            self.last_time = now
+
+        if(frame_time > self.max_frame_time):
+            self.dropped_time += frame_time - self.max_frame_time
+            frame_time = self.max_frame_time
+
+        self.accumulator += frame_time
+        steps = int(self.accumulator / self.dt)
+        self.accumulator -= steps * self.dt
+        return steps
+
+    @property
+    def alpha(self):
+        """Fraction (0 to 1) of a physics step that has passed since the last step ran, used to interpolate between the previous and current state"""
+        return self.accumulator / self.dt
+
+
+class Interval():
+    def __init__(self, hz, clock=time.perf_counter):
+        """Runs something on its own schedule inside a loop that runs at a different rate, e.g. polling the lidar at 80Hz from a 120Hz render loop
+
+        Args:
+            hz (float): how many times per second the interval is due
+            clock (function, optional): time source in seconds. Defaults to time.perf_counter.
+        """
+        self.period = 1 / hz
+        self.clock = clock
+        self.next_time = None
+
+    def due(self):
+        """Checks whether the interval has come around again
+
+        Returns:
+            bool: True at most once per period
+        """
+        now = self.clock()
+        if(self.next_time is None or now >= self.next_time):
+            #schedule from the previous deadline so the rate doesn't drift, but don't try to catch up on missed periods
+            if(self.next_time is None or now - self.next_time > self.period):
+                self.next_time = now + self.period
+            else:
+                self.next_time += self.period
+            return True
+        return False
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+import time
+from profiler import PhaseStats
+
+class LatencyMonitor():
+    def __init__(self, display_latency=0.0, window=240, max_age=0.5, clock=time.perf_counter, wall_clock=time.time):
+        """Measures the motion-to-photon latency of a game, the time from the lidar measuring a position to the projector showing it,
+            and predicts when the frame that is being drawn will be seen so positions can be extrapolated to that moment.
+
+            Call measured() with LocationParser.frame_timestamp whenever new positions arrive, target_time() when starting to draw a frame
+            and presented() right after the frame is handed to the display.
+
+        Args:
+            display_latency (float, optional): seconds the projector itself takes to show a frame after the flip, this can't be measured from software. Defaults to 0.0.
+            window (int, optional): number of samples the statistics are computed over. Defaults to 240.
+            max_age (float, optional): positions that claim to be older than this (or from the future) are treated as having no usable timestamp,
+                this happens when the writer's clock is off or when a recording is replayed. Defaults to 0.5.
+            clock (function, optional): local time source in seconds, the tracker and game loop should use the same one. Defaults to time.perf_counter.
+            wall_clock (function, optional): time source the writer's timestamps are on. Defaults to time.time.
+        """
+        self.display_latency = display_latency
+        self.max_age = max_age
+        self.clock = clock
+        self.wall_clock = wall_clock
+
+        #age of the positions when the game picked them up, and the full measurement to projector time
+        self.input_age = PhaseStats("input age", window)
+        self.motion_to_photon = PhaseStats("latency", window)
+
+        #smoothed time from starting to draw a frame to presenting it
+        self.render_delay = 0.0
+        self.frame_start = None
+
+        #local time of the newest measurement that hasn't made it onto the projector yet
+        self.pending_measurement = None
+
+        #positions that arrived without a usable timestamp, they aren't part of the statistics
+        self.unknown_timestamps = 0
+
+    def measured(self, timestamp):
+        """Registers newly arrived positions
+
+        Args:
+            timestamp (float): wall clock time the positions were measured, e.g. LocationParser.frame_timestamp
+
+        Returns:
+            float: time the positions were measured on the local clock, pass this on to tracker.PersonTracker.update.
+                Positions without a usable timestamp count as measured now.
+        """
+        local_now = self.clock()
+        age = self.wall_clock() - timestamp
+        if(timestamp <= 0 or age < 0 or age > self.max_age):
+            #recording a made up age would pull the statistics towards zero, so only count it and leave the latency of this frame unmeasured
+            self.unknown_timestamps += 1
+            return local_now
+        self.input_age.record(age)
+
+        self.pending_measurement = local_now - age
+        return self.pending_measurement
+
+    def target_time(self):
+        """Marks the start of a frame
+
+        Returns:
+            float: local time the frame is expected to appear on the projector, positions should be extrapolated to this time
+        """
+        self.frame_start = self.clock()
+        return self.frame_start + self.render_delay + self.display_latency
+
+    def presented(self):
+        """Call right after the frame has been handed to the display"""
+        now = self.clock()
+        if(self.frame_start is not None):
+            self.render_delay = 0.9 * self.render_delay + 0.1 * (now - self.frame_start)
+            self.frame_start = None
+
+        #only the first frame showing a measurement counts towards its latency
+        if(self.pending_measurement is not None):
+            self.motion_to_photon.record(now - self.pending_measurement + self.display_latency)
+            self.pending_measurement = None
+
+    def summary(self):
+        """Gets the latency statistics
+
+        Returns:
+            dict: 'input age' and 'latency' (motion-to-photon) summaries in milliseconds, see profiler.PhaseStats.summary, 
+                and the number of positions that arrived without a usable timestamp under 'unknown timestamps'
+        """
+        return {"input age": self.input_age.summary(), "latency": self.motion_to_photon.summary(), "unknown timestamps": self.unknown_timestamps}
@@ -0,0 +1,396 @@
+#!/usr/bin/env python3
+
+import sys, time, argparse, threading, importlib
+import numpy as np
+import pygame
+from location_parser import LocationParser, add_lidar_arguments, lidar_options_from_arguments
+from latency import LatencyMonitor
+from game_loop import Interval
+from display import add_display_arguments, display_from_arguments
+from profiler import add_profiler_arguments, profiler_from_arguments
+
+#games the launcher cycles through when none are given on the command line, each module exposes its game as GAME
+DEFAULT_GAMES = ["makers_soccer", "distortion_grid", "random_particles"]
+
+
+class AssetCache():
+    def __init__(self):
+        """Images and fonts shared by every game the launcher runs, each file is only loaded once no matter how many games use it
+            (or how many times a game is started). Loading goes through SDL, so only use this on the main thread (e.g. in GamePlugin.prepare).
+        """
+        self.images = {}
+        self.fonts = {}
+
+    def image(self, path, size=None):
+        """Loads an image
+
+        Args:
+            path (str): path of the image, relative to the repo folder like the games use
+            size (tuple, optional): scale the image to this (width, height), None keeps the original size. Defaults to None.
+
+        Returns:
+            pygame.Surface: the cached image, this is shared so don't draw onto it
+        """
+        key = (path, None if size is None else (int(size[0]), int(size[1])))
+        surface = self.images.get(key)
+        if(surface is None):
+            if(size is None):
+                surface = pygame.image.load(path)
+            else:
+                surface = pygame.transform.scale(self.image(path), key[1])
+            self.images[key] = surface
+        return surface
+
+    def font(self, name, size):
+        """Loads a font
+
+        Args:
+            name (str): font file, e.g. 'freesansbold.ttf'
+            size (int): font size
+
+        Returns:
+            pygame.font.Font: the cached font
+        """
+        key = (name, int(size))
+        font = self.fonts.get(key)
+        if(font is None):
+            font = pygame.font.Font(name, int(size))
+            self.fonts[key] = font
+        return font
+
+
+class GamePlugin():
+    #frame rate the display is limited to while the game is running
+    target_fps = 120
+
+    #games that don't react to people can run without a lidar input
+    uses_lidar = True
+
+    def __init__(self, runtime):
+        """Base class of the games the launcher can run. The constructor may run on a background thread while another game is on screen, 
+            so it should only do plain Python and numpy setup. Anything that goes through SDL (surfaces, convert(), images, fonts or the display) 
+            belongs in prepare(), which the launcher calls on the main thread before the game comes on screen. 
+            Then the launcher calls update() and draw() once per frame.
+
+        Args:
+            runtime (GameRuntime): shared display, lidar input, asset cache, profiler and latency monitor
+        """
+        self.runtime = runtime
+
+        #resolution the game is laid out for, the launcher calls resize() when the display resolution changes
+        self.size = runtime.display.size
+
+    def prepare(self):
+        """Builds everything that needs SDL (surfaces, images, fonts, ...), called once on the main thread after the constructor and before start()"""
+        pass
+
+    def start(self):
+        """Called when the game comes on screen"""
+        pass
+
+    def update(self, positions, dt):
+        """Advances the game by one frame
+
+        Args:
+            positions (numpy.ndarray): (N,2) float32 positions of the people in pixels, reused between frames so copy it if you need to keep it.
+                runtime.new_positions is True on the frames where these are new.
+            dt (float): seconds since the previous frame
+        """
+        pass
+
+    def draw(self, surface):
+        """Draws the frame
+
+        Args:
+            surface (pygame.Surface): surface to draw on, the whole frame has to be drawn unless the game keeps track of what changed
+
+        Returns:
+            list pygame.Rect: areas that changed if the game only redrew parts of the surface (see dirty_renderer.py), None if the whole surface was drawn
+        """
+        return None
+
+    def invalidate(self, rect):
+        """Tells the game something was drawn over it (e.g. the profiler overlay), games returning rects from draw() have to restore this area next frame"""
+        pass
+
+    def resize(self, size):
+        """Called when the display resolution changes, re-layout the game for the new (width, height)"""
+        pass
+
+    def handle_event(self, event):
+        """Receives every pygame event the launcher doesn't handle itself"""
+        pass
+
+    def close(self):
+        """Called when the game goes off screen, release anything that isn't shared through the runtime"""
+        pass
+
+
+class GameRuntime():
+    def __init__(self, display, profiler, use_lidar=True, lidar_hz=80, lidar_options=None):
+        """Everything that is shared between games and outlives them: the display, the lidar input, the asset cache, the profiler and the latency monitor
+
+        Args:
+            display (GameDisplay): display the games draw on
+            profiler (FrameProfiler): per frame timings
+            use_lidar (bool, optional): read the lidar positions, without it every game gets an empty set of positions. Defaults to True.
+            lidar_hz (int, optional): how many times per second the lidar input is checked for new positions. Defaults to 80.
+            lidar_options (dict, optional): extra LocationParser keyword arguments, e.g. from location_parser.lidar_options_from_arguments. Defaults to None.
+        """
+        self.display = display
+        self.profiler = profiler
+        self.assets = AssetCache()
+
+        self.latency = LatencyMonitor(display.display_latency)
+        profiler.add_phase(self.latency.input_age)
+        profiler.add_phase(self.latency.motion_to_photon)
+        profiler.add_counter("unknown ts", lambda: self.latency.unknown_timestamps)
+
+        self.lidar = None
+        if(use_lidar):
+            width, height = display.size
+            self.lidar = LocationParser(field_width_pixels=width, field_height_pixels=height, watch_changes=True, **(lidar_options or {}))
+        self.lidar_poll = Interval(lidar_hz)
+
+        #latest positions in pixels, new_positions is only True on the frames where the lidar reported something new
+        self.positions = np.zeros((0, 2), dtype=np.float32)
+        self.new_positions = False
+
+        #local time the latest positions were measured and the time the current frame is expected to reach the projector, see latency.LatencyMonitor
+        self.measurement_time = None
+        self.target_time = None
+
+        #game currently on screen
+        self.game = None
+        display.on_resize.append(self._resize)
+
+    def _resize(self, size):
+        if(self.lidar is not None):
+            self.lidar.setOutputResolution(*size)
+        if(self.game is not None):
+            self.game.resize(size)
+            self.game.size = size
+
+    def activate(self, game):
+        """Puts a game on screen"""
+        if(game.size != self.display.size):
+            game.resize(self.display.size)
+            game.size = self.display.size
+        self.display.target_fps = game.target_fps
+        self.game = game
+        game.start()
+
+    def poll_lidar(self):
+        """Reads new positions when the lidar poll is due"""
+        self.new_positions = False
+        if(self.lidar is None or not self.lidar_poll.due()):
+            return
+
+        self.positions, self.new_positions = self.lidar.getPositionsArray(return_new=True)
+        if(self.new_positions):
+            self.measurement_time = self.latency.measured(self.lidar.frame_timestamp)
+
+    @property
+    def replay_finished(self):
+        """True once a replayed recording has shown its last frame"""
+        return self.lidar is not None and self.lidar.replayFinished()
+
+    def close(self):
+        if(self.lidar is not None):
+            self.lidar.close()
+            self.lidar = None
+
+
+class GamePreloader():
+    def __init__(self, game_class, runtime):
+        """Builds a game on a background thread so it is ready the moment the launcher switches to it. 
+            Only the constructor runs on the thread, the game's SDL work is done by prepare() on the main thread.
+
+        Args:
+            game_class (class): GamePlugin subclass to build
+            runtime (GameRuntime): runtime passed to the game
+        """
+        self.game = None
+        self.error = None
+        self.prepared = False
+        self.thread = threading.Thread(target=self._run, args=(game_class, runtime), name="game-preloader", daemon=True)
+        self.thread.start()
+
+    def _run(self, game_class, runtime):
+        try:
+            self.game = game_class(runtime)
+        except Exception as e:
+            self.error = e
+
+    def get(self):
+        """Gets the game, waiting for it to finish loading if it isn't ready yet
+
+        Returns:
+            GamePlugin: the loaded game
+        """
+        self.thread.join()
+        if(self.error is not None):
+            raise self.error
+        return self.game
+
+    def ready(self):
+        """Checks whether the game has been built and still has to be prepared, this never blocks"""
+        return not self.thread.is_alive() and self.error is None and not self.prepared
+
+    def prepare(self):
+        """Runs the game's prepare() on the calling thread if it hasn't been yet, this has to be the main thread
+
+        Returns:
+            GamePlugin: the loaded and prepared game
+        """
+        game = self.get()
+        if(not self.prepared):
+            game.prepare()
+            self.prepared = True
+        return game
+
+
+def run_games(runtime, game_classes, switch_interval=None, switch_key=pygame.K_TAB):
+    """Runs games one after the other in the same process, the next game is always preloaded so switching is instant
+
+    Args:
+        runtime (GameRuntime): shared runtime
+        game_classes (list class): GamePlugin subclasses to cycle through
+        switch_interval (float, optional): seconds each game stays on screen, None only switches on switch_key. Defaults to None.
+        switch_key (int, optional): pygame key that switches to the next game. Defaults to pygame.K_TAB.
+    """
+    display = runtime.display
+    profiler = runtime.profiler
+
+    index = 0
+    game = game_classes[0](runtime)
+    game.prepare()
+    runtime.activate(game)
+    preloader = GamePreloader(game_classes[1], runtime) if len(game_classes) > 1 else None
+
+    last_switch = time.perf_counter()
+    last_frame = None
+    running = True
+
+    while running:
+        now = time.perf_counter()
+        switch = switch_interval is not None and now - last_switch >= switch_interval
+
+        for event in pygame.event.get():
+            if(profiler.handle_event(event)):
+                continue
+            if(event.type == pygame.QUIT):
+                running = False
+            elif(event.type == pygame.KEYDOWN and event.key == switch_key):
+                switch = True
+            else:
+                game.handle_event(event)
+
+        #the next game's surfaces and fonts are made on this thread as soon as its constructor has finished, SDL can't do that while the display is presenting
+        if(preloader is not None and preloader.ready()):
+            preloader.prepare()
+
+        #swap in the preloaded game and start loading the one after it
+        if(switch and preloader is not None):
+            game.close()
+            index = (index + 1) % len(game_classes)
+            game = preloader.prepare()
+            runtime.activate(game)
+            preloader = GamePreloader(game_classes[(index + 1) % len(game_classes)], runtime)
+            last_switch = now
+
+        #the step is capped so a stall (e.g. loading) doesn't turn into a huge jump
+        dt = 0 if last_frame is None else min(now - last_frame, 0.25)
+        last_frame = now
+
+        with profiler.scope("lidar"):
+            runtime.poll_lidar()
+
+        #a replay without --replay_loop is a fixed workload, stop once the last frame has been shown
+        if(runtime.replay_finished and not runtime.new_positions):
+            running = False
+        runtime.target_time = runtime.latency.target_time()
+
+        game.update(runtime.positions, dt)
+        rects = game.draw(display.surface)
+
+        #timing overlay, only drawn when F3 has been pressed
+        overlay = profiler.draw_overlay(display.surface)
+        if(overlay is not None):
+            game.invalidate(overlay)
+            if(rects is not None):
+                rects.append(overlay)
+
+        #write pixels to the display
+        with profiler.scope("present"):
+            display.present(rects)
+        runtime.latency.presented()
+        profiler.end_frame()
+
+        #wait until next game tick
+        display.tick()
+
+    game.close()
+    if(preloader is not None):
+        preloader.get().close()
+
+def run_game(game_class):
+    """Entry point of a game run on its own, sets up the display and lidar from the command line and runs the game until the window is closed
+
+    Args:
+        game_class (class): GamePlugin subclass to run
+    """
+    arg_parser = argparse.ArgumentParser()
+    add_lidar_arguments(arg_parser)
+    add_display_arguments(arg_parser)
+    add_profiler_arguments(arg_parser)
+    args = arg_parser.parse_args()
+
+    #per phase frame timings, press F3 to show them on screen
+    profiler = profiler_from_arguments(args)
+
+    #start pygame
+    pygame.init()
+
+    #the display renders at the internal resolution (1920x1080 unless --render_scale is given), this will be scaled to the screen
+    display = display_from_arguments(args, target_fps=game_class.target_fps)
+    runtime = GameRuntime(display, profiler, use_lidar=game_class.uses_lidar, lidar_options=lidar_options_from_arguments(args))
+    run_games(runtime, [game_class])
+
+    #exit
+    runtime.close()
+    profiler.finish()
+    pygame.quit()
+    sys.exit()
+
+def load_game(name):
+    """Imports a game module (e.g. 'makers_soccer') and returns the GamePlugin subclass it exposes as GAME"""
+    return importlib.import_module(name).GAME
+
+
+def main():
+    """Runs several games in one process so the projector can switch between them without a black screen or a cold start"""
+    arg_parser = argparse.ArgumentParser()
+    arg_parser.add_argument("--games", "-g", nargs="+", default=DEFAULT_GAMES, help="Game modules to cycle through, in order.")
+    arg_parser.add_argument("--switch_interval", type=float, help="Seconds each game stays on screen before switching to the next one, by default games only switch when Tab is pressed.")
+    arg_parser.add_argument("--lidar_hz", type=int, default=80, help="How many times per second the lidar input is checked for new positions.")
+    add_lidar_arguments(arg_parser)
+    add_display_arguments(arg_parser)
+    add_profiler_arguments(arg_parser)
+    args = arg_parser.parse_args()
+
+    game_classes = [load_game(a) for a in args.games]
+    profiler = profiler_from_arguments(args)
+
+    pygame.init()
+    display = display_from_arguments(args, target_fps=game_classes[0].target_fps)
+    runtime = GameRuntime(display, profiler, use_lidar=any(a.uses_lidar for a in game_classes), lidar_hz=args.lidar_hz, lidar_options=lidar_options_from_arguments(args))
+    run_games(runtime, game_classes, switch_interval=args.switch_interval)
+
+    runtime.close()
+    profiler.finish()
+    pygame.quit()
+    sys.exit()
+
+if __name__ == "__main__":
+    main()
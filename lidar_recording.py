@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+
+import os, time, struct, argparse
+import numpy as np
+
+#binary layout of a recording (all little endian), the file is append only so a recording that was cut off still reads up to its last complete frame
+#
+#  header (16 bytes):  magic 'ARCL' | version u32 | padding
+#  one record per frame:
+#      timestamp f64 | count u32 | count * (x, y) float32 positions in meters
+#
+#like the shared memory ring the positions are stored in (x, y) order, not the 'y,x' order of lidar_output.txt
+MAGIC = b"ARCL"
+VERSION = 1
+HEADER_SIZE = 16
+RECORD_HEADER = struct.Struct("<dI")
+
+
+class LidarRecorder():
+    def __init__(self, path, append=False):
+        """Records timestamped frames of lidar positions into a compact binary log that LidarRecording can read back with a memory map
+
+        Args:
+            path (str): path of the recording
+            append (bool, optional): add frames to the end of an existing recording instead of starting a new one. Defaults to False.
+        """
+        self.path = path
+        self.frame_count = 0
+
+        if(append and os.path.exists(path)):
+            self.file = open(path, "ab")
+        else:
+            self.file = open(path, "wb")
+            self.file.write(MAGIC + struct.pack("<I", VERSION) + bytes(HEADER_SIZE - 8))
+
+    def write(self, positions, timestamp=None):
+        """Appends one frame to the recording
+
+        Args:
+            positions (array like): (N,2) positions in meters in (x, y) order
+            timestamp (float, optional): time the positions were measured, time.time() is used when None. Defaults to None.
+        """
+        positions = np.ascontiguousarray(positions, dtype="<f4").reshape(-1, 2)
+        self.file.write(RECORD_HEADER.pack(time.time() if timestamp is None else timestamp, len(positions)))
+        self.file.write(positions.tobytes())
+        self.frame_count += 1
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class LidarRecording():
+    def __init__(self, path):
+        """Memory mapped view of a recording written by LidarRecorder, frames are read straight out of the file without copying
+
+        Args:
+            path (str): path of the recording
+        """
+        self.path = path
+        self.data = np.memmap(path, dtype=np.uint8, mode="r")
+        if(len(self.data) < HEADER_SIZE or bytes(self.data[:4]) != MAGIC or struct.unpack_from("<I", self.data, 4)[0] != VERSION):
+            raise ValueError("'%s' is not a lidar recording" % path)
+
+        #walk the record headers once to find where every frame starts, an incomplete record at the end (recorder still running or killed) is ignored
+        timestamps, offsets, counts = [], [], []
+        offset = HEADER_SIZE
+        while(offset + RECORD_HEADER.size <= len(self.data)):
+            timestamp, count = RECORD_HEADER.unpack_from(self.data, offset)
+            end = offset + RECORD_HEADER.size + count * 8
+            if(end > len(self.data)):
+                break
+            timestamps.append(timestamp)
+            offsets.append(offset + RECORD_HEADER.size)
+            counts.append(count)
+            offset = end
+
+        self.timestamps = np.array(timestamps, dtype=np.float64)
+        self.offsets = np.array(offsets, dtype=np.int64)
+        self.counts = np.array(counts, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    @property
+    def duration(self):
+        """Seconds between the first and the last frame"""
+        if(len(self) == 0):
+            return 0.0
+        return float(self.timestamps[-1] - self.timestamps[0])
+
+    def frame(self, index):
+        """Gets the positions of one frame
+
+        Args:
+            index (int): frame number, 0 is the first frame
+
+        Returns:
+            numpy.ndarray: (N,2) float32 read only view of the positions in meters in (x, y) order
+        """
+        offset = int(self.offsets[index])
+        return np.ndarray((int(self.counts[index]), 2), dtype="<f4", buffer=self.data, offset=offset)
+
+
+class LidarPlayer():
+    def __init__(self, recording, speed=1.0, loop=False, clock=time.perf_counter):
+        """Plays a recording back with the same read() interface as shared_positions.SharedPositionReader, so it can stand in for the live lidar
+
+        Args:
+            recording (LidarRecording): recording to play
+            speed (float, optional): playback speed, 1 is real time and 4 is four times faster. 0 plays as fast as possible, every read() returns the next frame. Defaults to 1.0.
+            loop (bool, optional): start again from the beginning after the last frame. Defaults to False.
+            clock (function, optional): time source in seconds. Defaults to time.perf_counter.
+        """
+        self.recording = recording
+        self.speed = speed
+        self.loop = loop
+        self.clock = clock
+
+        #frame times relative to the first frame, playback time is compared against these
+        self.relative_times = recording.timestamps - (recording.timestamps[0] if len(recording) > 0 else 0)
+
+        #the last frame is shown for an average frame interval before the recording counts as finished
+        self.end_time = self.relative_times[-1] + recording.duration / (len(recording) - 1) if len(recording) > 1 else 0.0
+        self.start_time = None
+        self.index = -1
+        self.loops = 0
+        self.finished = len(recording) == 0
+
+    def restart(self):
+        self.start_time = None
+        self.index = -1
+        self.loops = 0
+        self.finished = len(self.recording) == 0
+
+    def _due_index(self):
+        #index of the frame that should be showing right now
+        if(self.speed <= 0):
+            return self.index + 1
+
+        now = self.clock()
+        if(self.start_time is None):
+            self.start_time = now
+        playback_time = (now - self.start_time) * self.speed
+        if(playback_time >= self.end_time):
+            return len(self.recording)
+        return int(np.searchsorted(self.relative_times, playback_time, side="right")) - 1
+
+    def read(self):
+        """Gets the frame that is due at the current playback time
+
+        Returns:
+            Tuple: (frame, timestamp, positions), frame increases every time a different frame is returned and is 0 before the first frame is due.
+                timestamp is the time the frame was originally recorded and positions is an (N,2) float32 view in meters in (x, y) order.
+        """
+        if(len(self.recording) == 0):
+            return 0, 0.0, np.zeros((0, 2), dtype=np.float32)
+
+        index = self._due_index()
+        if(index >= len(self.recording)):
+            if(self.loop):
+                #start the next pass from the first frame, the frame count keeps going up so readers see it as new data
+                self.loops += 1
+                self.start_time = self.clock()
+                index = 0
+            else:
+                self.finished = True
+                index = len(self.recording) - 1
+
+        if(index < 0):
+            return 0, 0.0, np.zeros((0, 2), dtype=np.float32)
+
+        self.index = index
+        frame = self.loops * len(self.recording) + index + 1
+        return frame, float(self.recording.timestamps[index]), self.recording.frame(index)
+
+    def close(self):
+        pass
+
+
+def write_text_frame(path, positions, timestamp=None):
+    """Writes positions to a lidar_output.txt style file, through a temporary file so readers always see a complete frame
+
+    Args:
+        path (str): path of the text file
+        positions (array like): (N,2) positions in meters in (x, y) order
+        timestamp (float, optional): measurement time written to the '#t=' line, time.time() is used when None. Defaults to None.
+    """
+    values = np.asarray(positions)[:, ::-1].ravel().tolist()
+    temp_path = path + ".tmp"
+    with open(temp_path, "w") as f:
+        f.write("#t=%0.6f\n" % (time.time() if timestamp is None else timestamp))
+        f.write(("%0.6f,%0.6f\n" * len(positions)) % tuple(values))
+    os.replace(temp_path, path)
+
+
+def record(args):
+    from location_parser import LocationParser, FileChangeWatcher
+
+    #the parser does the reading, its recorder hook writes every new frame
+    parser = LocationParser(lidar_file_path_file=args.pointer_file, transport=args.transport, record_path=args.recording)
+    print("recording to '%s', ctrl + c to stop" % args.recording)
+
+    #the text file is only read when it has been rewritten, the shared ring is cheap enough to poll
+    watcher = FileChangeWatcher(parser.file_location) if args.transport == "text" else None
+    start = time.monotonic()
+    try:
+        while(args.duration is None or time.monotonic() - start < args.duration):
+            if(watcher is None):
+                parser.getPositionsArray()
+                time.sleep(0.002)
+            elif(watcher.wait(0.1)):
+                parser.getPositionsArray()
+    except KeyboardInterrupt:
+        pass
+    print("recorded %d frames" % parser.recorder.frame_count)
+    if(watcher is not None):
+        watcher.close()
+    parser.close()
+
+def play(args):
+    from shared_positions import SharedPositionWriter
+
+    recording = LidarRecording(args.recording)
+    player = LidarPlayer(recording, speed=args.speed, loop=args.loop)
+    print("playing %d frames (%0.1fs) from '%s' at %s speed" % (len(recording), recording.duration, args.recording, "maximum" if args.speed <= 0 else "%gx" % args.speed))
+
+    writer = None
+    if(args.output == "shared"):
+        writer = SharedPositionWriter(args.output_path, max_points=max(int(recording.counts.max(initial=0)), 64))
+
+    last_frame = 0
+    try:
+        while(not player.finished or args.loop):
+            frame, timestamp, positions = player.read()
+            if(frame != last_frame):
+                last_frame = frame
+                if(writer is not None):
+                    writer.write(positions)
+                else:
+                    write_text_frame(args.output_path, positions)
+            if(args.speed > 0):
+                time.sleep(0.001)
+    except KeyboardInterrupt:
+        pass
+
+    if(writer is not None):
+        writer.close()
+
+def info(args):
+    recording = LidarRecording(args.recording)
+    print("%s: %d frames over %0.2fs" % (args.recording, len(recording), recording.duration))
+    if(len(recording) > 1):
+        intervals = np.diff(recording.timestamps)
+        print("  frame interval: mean %0.2fms, max %0.2fms" % (np.mean(intervals) * 1000, np.max(intervals) * 1000))
+    if(len(recording) > 0):
+        print("  points per frame: mean %0.1f, max %d" % (np.mean(recording.counts), np.max(recording.counts)))
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Record lidar sessions and replay them into the games.")
+    commands = arg_parser.add_subparsers(dest="command", required=True)
+
+    record_parser = commands.add_parser("record", help="Record the lidar input the games would read.")
+    record_parser.add_argument("recording", help="Path of the recording to write.")
+    record_parser.add_argument("--pointer_file", default="lidar_input_file_location.txt", help="File holding the path of the lidar input, same as the games use.")
+    record_parser.add_argument("--transport", choices=["text", "shared"], default="text", help="Read lidar_output.txt or the shared memory file written by movement_simulation.py -o shared.")
+    record_parser.add_argument("--duration", type=float, help="Stop after this many seconds, by default records until ctrl + c.")
+
+    play_parser = commands.add_parser("play", help="Replay a recording into lidar_output.txt (or the shared memory file) for any game to read.")
+    play_parser.add_argument("recording", help="Path of the recording to play.")
+    play_parser.add_argument("--speed", type=float, default=1.0, help="Playback speed, 1 is real time, 0 writes frames as fast as possible.")
+    play_parser.add_argument("--loop", action="store_true", help="Start again from the beginning after the last frame.")
+    play_parser.add_argument("--output", "-o", choices=["text", "shared"], default="text", help="Write a lidar_output.txt style text file or a shared memory file.")
+    play_parser.add_argument("--output_path", default="lidar_output.txt", help="Path the frames are written to.")
+
+    info_parser = commands.add_parser("info", help="Print a summary of a recording.")
+    info_parser.add_argument("recording", help="Path of the recording.")
+
+    args = arg_parser.parse_args()
+    {"record": record, "play": play, "info": info}[args.command](args)
+
+if __name__ == "__main__":
+    main()
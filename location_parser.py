@@ -1,9 +1,212 @@
 #!/usr/bin/env python3
 
-import sys
+import sys, os, struct, select, time, threading, collections, warnings
+import ctypes, ctypes.util
+import numpy as np
+from shared_positions import SharedPositionReader
+from lidar_recording import LidarRecorder, LidarRecording, LidarPlayer
+from calibration import Calibration
+
+class FileChangeWatcher(): 
+    #inotify event flags, see 'man inotify'
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+
+    def __init__(self, file_path, use_inotify=True): 
+        """Watches a single file for changes so that readers only re-parse it when the contents have actually been rewritten. 
+            On linux this uses inotify on the containing folder (so files that are replaced with os.replace are still seen), 
+            everywhere else (or if inotify is unavailable) it falls back to polling the mtime/size/inode of the file. 
+
+        Args:
+            file_path (str): path of the file to watch
+            use_inotify (bool, optional): use inotify when it is available, when False the mtime/size poll is always used. Defaults to True.
+        """
+        self.file_path = file_path
+        self.file_name = os.path.basename(file_path).encode()
+        self.inotify_fd = None
+        self.last_signature = None
+
+        #the first call to changed() always reports a change so the file gets read at least once
+        self.pending = True
+
+        if(use_inotify and sys.platform.startswith("linux")): 
+            try:
+                self.inotify_fd = self._open_inotify(os.path.dirname(os.path.abspath(file_path)))
+            except OSError: 
+                self.inotify_fd = None
+
+    def _open_inotify(self, folder): 
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        fd = libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if(fd < 0): 
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        mask = self.IN_MODIFY | self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE
+        if(libc.inotify_add_watch(fd, folder.encode(), mask) < 0): 
+            err = ctypes.get_errno()
+            os.close(fd)
+            raise OSError(err, "inotify_add_watch failed on '%s'" % folder)
+        return fd
+
+    def _drain_inotify(self): 
+        """Reads every queued inotify event and returns True if any of them refer to the watched file
+        """
+        changed = False
+        while True: 
+            try:
+                buffer = os.read(self.inotify_fd, 4096)
+            except BlockingIOError: 
+                break
+
+            #each event is struct inotify_event {int wd; uint32 mask; uint32 cookie; uint32 len; char name[len];}
+            offset = 0
+            while offset < len(buffer): 
+                _, _, _, name_length = struct.unpack_from("iIII", buffer, offset)
+                offset += 16
+                name = buffer[offset:offset + name_length].rstrip(b"\0")
+                offset += name_length
+                if(name == self.file_name): 
+                    changed = True
+        return changed
+
+    def _poll_signature(self): 
+        try:
+            stat = os.stat(self.file_path)
+        except FileNotFoundError: 
+            return False
+
+        signature = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        changed = signature != self.last_signature
+        self.last_signature = signature
+        return changed
+
+    def changed(self): 
+        """Checks whether the file has been modified since the last call, this never blocks. 
+
+        Returns:
+            bool: True if the file has changed (or this is the first call)
+        """
+        if(self.inotify_fd is not None): 
+            changed = self._drain_inotify()
+        else: 
+            changed = self._poll_signature()
+
+        changed = changed or self.pending
+        self.pending = False
+        return changed
+
+    def wait(self, timeout): 
+        """Blocks until the file changes or the timeout runs out. 
+
+        Args:
+            timeout (float): maximum time to wait in seconds
+
+        Returns:
+            bool: True if the file has changed
+        """
+        if(self.inotify_fd is not None): 
+            if(not self.pending): 
+                select.select([self.inotify_fd], [], [], timeout)
+            return self.changed()
+
+        #without inotify all we can do is poll the file signature at a short interval
+        deadline = time.monotonic() + timeout
+        while True: 
+            if(self.changed()): 
+                return True
+            remaining = deadline - time.monotonic()
+            if(remaining <= 0): 
+                return False
+            time.sleep(min(0.002, remaining))
+
+    def close(self): 
+        if(self.inotify_fd is not None): 
+            os.close(self.inotify_fd)
+            self.inotify_fd = None
+
+
+#immutable snapshot of the lidar positions published by ThreadedLocationReader
+PositionSnapshot = collections.namedtuple("PositionSnapshot", ["sequence", "timestamp", "positions"])
+
+
+class ThreadedLocationReader(): 
+    def __init__(self, parser, poll_timeout=0.05): 
+        """Background thread that owns all of the file I/O and parsing for a LocationParser. Every time the lidar file changes a new 
+            PositionSnapshot is published by swapping a single reference, so the game loop can grab the latest snapshot without 
+            ever blocking on the disk and without taking a lock. 
+
+        Args:
+            parser (LocationParser): parser used to read and convert the lidar file
+            poll_timeout (float, optional): maximum time in seconds the thread waits for a change before re-checking if it should stop. Defaults to 0.05.
+        """
+        self.parser = parser
+        self.poll_timeout = poll_timeout
+        self.watcher = FileChangeWatcher(parser.file_location)
+
+        #the latest snapshot, only ever replaced (never modified) so reading it from another thread is safe
+        self.latest = PositionSnapshot(0, 0.0, ())
+
+        #snapshots that were replaced by a newer one before the game loop got to read them
+        self.dropped_snapshots = 0
+        self.last_read_sequence = 0
+
+        self.running = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="lidar-reader", daemon=True)
+
+    def start(self): 
+        self.running.set()
+        self.thread.start()
+
+    def _run(self): 
+        sequence = 0
+        while self.running.is_set(): 
+            if(not self.watcher.wait(self.poll_timeout)): 
+                continue
+
+            try:
+                text = self.parser.readFile()
+                positions = tuple(self.parser.parsePositions(text))
+            except OSError as e: 
+                if(self.parser.debug_print): 
+                    print("Lidar reader failed to read \'%s\': %s" % (self.parser.file_location, e))
+                continue
+            except Exception as e: 
+                #a torn or malformed file must not end the thread, drop this frame and wait for the next one
+                if(self.parser.debug_print): 
+                    print("Lidar reader failed to parse \'%s\': %s" % (self.parser.file_location, e))
+                continue
+
+            sequence += 1
+            self.latest = PositionSnapshot(sequence, self.parser.parseTimestamp(text), positions)
+
+    def getSnapshot(self): 
+        """Gets the most recently published snapshot, this is O(1) and never blocks
+
+        Returns:
+            PositionSnapshot: latest snapshot in format (sequence, timestamp, positions)
+        """
+        snapshot = self.latest
+
+        #any sequence numbers we skipped over were overwritten before anyone read them
+        if(snapshot.sequence > self.last_read_sequence + 1): 
+            self.dropped_snapshots += snapshot.sequence - self.last_read_sequence - 1
+        self.last_read_sequence = max(self.last_read_sequence, snapshot.sequence)
+        return snapshot
+
+    def stop(self): 
+        """Stops the reader thread and waits for it to exit"""
+        self.running.clear()
+        if(self.thread.is_alive()): 
+            self.thread.join()
+        self.watcher.close()
+
 
 class LocationParser(): 
-    def __init__(self, field_width_pixels = 1920, field_height_pixels =1080, field_width_meters = 4.2, field_height_meters = 2.5, debug_print=False, lidar_file_path_file = "lidar_input_file_location.txt"):
+    def __init__(self, field_width_pixels = 1920, field_height_pixels =1080, field_width_meters = 4.2, field_height_meters = 2.5, debug_print=False, lidar_file_path_file = "lidar_input_file_location.txt", watch_changes=False, threaded=False, transport="text", lidar_path=None, replay_speed=1.0, replay_loop=False, record_path=None, calibration_file=None):
         """LOCATION PARSER, if you're creating new games copy this entire class and the two lines directly after it
             you need to indicate the location of the file that is generated by the ROS system. This class will map that position to the 
             pixel coordinates and give you a list of the read points
@@ -15,34 +218,54 @@ class LocationParser():
             field_height_meters (int, optional): resolution height of the output game . Defaults to 2.
             debug_print (bool, optional): prints parsed information to the terminal for debugging when True. Defaults to False.
             lidar_file_path_file (str, optional): Location of the file which points to the 'lidar_output.txt' file that is going to be used. If using the movement_simulation.py file then place the file path of the lidar_output.txt file that is in the repo folder. . Defaults to "lidar_input_file_location.txt".
+            watch_changes (bool, optional): only re-read lidar_output.txt when it has actually changed (inotify on linux, mtime/size polling elsewhere) and return the cached positions otherwise. Defaults to False.
+            threaded (bool, optional): read and parse the file on a background thread, getPositions() then returns the latest snapshot without doing any I/O. 
+                Call close() when the game exits to stop the thread. Defaults to False.
+            transport (str, optional): "text" reads the lidar_output.txt text file, "shared" reads the binary ring written by shared_positions.SharedPositionWriter, 
+                in which case the pointer file should hold the path of the shared file. "replay" plays back a recording made with lidar_recording.py, the pointer file then holds 
+                the path of the recording. watch_changes and threaded only apply to the text transport. Defaults to "text".
+            lidar_path (str, optional): path of the lidar input (text file, shared file or recording depending on the transport), this overrides the pointer file. 
+                None reads the path from lidar_file_path_file. Defaults to None.
+            replay_speed (float, optional): playback speed of the "replay" transport, 1 is real time and 0 returns the next recorded frame on every call. Defaults to 1.0.
+            replay_loop (bool, optional): start the "replay" transport again from the beginning after the last frame. Defaults to False.
+            record_path (str, optional): record every new frame into this file with lidar_recording.LidarRecorder, None disables recording. Defaults to None.
+            calibration_file (str, optional): calibration made with calibration.py, positions are then mapped to pixels with its homography (and lens distortion) 
+                instead of stretching the field size over the output resolution. None uses the field size. Defaults to None.
         """
-        try:
-            with open(lidar_file_path_file, 'r') as f: 
-                self.file_location = f.read().replace("\n", "").replace("\r", "")
-                print("ARC-Projector-Games LocationParser operating on lidar position information located in \"%s\"" % self.file_location)
-                try:
-                    with open(self.file_location, 'r') as f2: 
-                        data = f2.read()
-                        print("Found lidar_output.txt file")
-                except FileNotFoundError: 
-                    print("information contained in '%s' does not point to a usable lidar_output.txt file, double check the path entered into this file and re-run the program" % lidar_file_path_file)
-                    sys.exit()
+        if(lidar_path is not None): 
+            self.file_location = lidar_path
+            print("ARC-Projector-Games LocationParser operating on lidar position information located in \"%s\"" % self.file_location)
+            if(not os.path.exists(self.file_location)): 
+                print("'%s' does not exist, start the lidar system (or movement_simulation.py) first and re-run the program" % self.file_location)
+                sys.exit()
+        else: 
+            try:
+                with open(lidar_file_path_file, 'r') as f: 
+                    self.file_location = f.read().replace("\n", "").replace("\r", "")
+                    print("ARC-Projector-Games LocationParser operating on lidar position information located in \"%s\"" % self.file_location)
+                    try:
+                        with open(self.file_location, 'rb') as f2: 
+                            data = f2.read()
+                            print("Found lidar_output.txt file")
+                    except FileNotFoundError: 
+                        print("information contained in '%s' does not point to a usable lidar_output.txt file, double check the path entered into this file and re-run the program" % lidar_file_path_file)
+                        sys.exit()
 
-        except FileNotFoundError: 
-            with open(lidar_file_path_file, 'w') as f: 
-                f.write("")
-
-            #big long help string to explain whats gone wrong 
-            print("LocationParser was unable to find the location file pointing to 'lidar_output.txt' a pointer file was created in the same folder as this python script with the name '%s'" % lidar_file_path_file)
-            print("Please open the '%s' text file and input the path to the lidar_output.txt data file used to communicate tracked objects to the python games" % lidar_file_path_file)
-            print("if you are on linux you can find the full path to a file by right clicking on the folder and selecting 'open in terminal' then typing 'readlink -f <your file>")
-            print("Example: ")
-            print("If you were running the games using the movement_simulation.py file and the repo were cloned to your documents (on linux) then the full contents of the '%s' file should be:" % lidar_file_path_file)
-            print("/home/matthew/Documents/ARC-Projector-Games/lidar_output.txt")
-            print("")
-            print("Note: LocationParser was unable to obtain input file, the program will now exit")
-            print("Please read the above information to correct this problem")
-            sys.exit()
+            except FileNotFoundError: 
+                with open(lidar_file_path_file, 'w') as f: 
+                    f.write("")
+
+                #big long help string to explain whats gone wrong 
+                print("LocationParser was unable to find the location file pointing to 'lidar_output.txt' a pointer file was created in the same folder as this python script with the name '%s'" % lidar_file_path_file)
+                print("Please open the '%s' text file and input the path to the lidar_output.txt data file used to communicate tracked objects to the python games" % lidar_file_path_file)
+                print("if you are on linux you can find the full path to a file by right clicking on the folder and selecting 'open in terminal' then typing 'readlink -f <your file>")
+                print("Example: ")
+                print("If you were running the games using the movement_simulation.py file and the repo were cloned to your documents (on linux) then the full contents of the '%s' file should be:" % lidar_file_path_file)
+                print("/home/matthew/Documents/ARC-Projector-Games/lidar_output.txt")
+                print("")
+                print("Note: LocationParser was unable to obtain input file, the program will now exit")
+                print("Please read the above information to correct this problem")
+                sys.exit()
 
         self.debug_print = debug_print
 
@@ -54,46 +277,368 @@ class LocationParser():
         self.field_width_pixels = field_width_pixels
         self.field_height_pixels = field_height_pixels
 
+        #reusable (N,2) output buffer for getPositionsArray(), it only gets reallocated when more points arrive than it can hold
+        self.position_array = np.zeros((16, 2), dtype=np.float32)
+        self.position_count = 0
+        self.pixel_scale = np.array([self.field_width_pixels/self.field_width_meters, self.field_height_pixels/self.field_height_meters], dtype=np.float64)
+
+        #measured floor to projector mapping, kept at the resolution it was made at and scaled to the output resolution
+        self.loaded_calibration = Calibration.load(calibration_file) if calibration_file is not None else None
+        self.calibration = None
+        if(self.loaded_calibration is not None): 
+            self.calibration = self.loaded_calibration.scaled((self.field_width_pixels, self.field_height_pixels))
+
+        #binary shared memory transport, frames are read straight out of the ring so there is no text to parse
+        #a replayed recording has the same read() as the shared ring so it goes through the same path
+        self.shared = None
+        self.shared_frame = 0
+        if(transport == "shared"): 
+            self.shared = SharedPositionReader(self.file_location)
+            watch_changes, threaded = False, False
+        elif(transport == "replay"): 
+            self.shared = LidarPlayer(LidarRecording(self.file_location), speed=replay_speed, loop=replay_loop)
+            watch_changes, threaded = False, False
+        elif(transport != "text"): 
+            raise ValueError("Unknown LocationParser transport '%s', expected 'text', 'shared' or 'replay'" % transport)
+
+        #wall clock time the latest positions were measured, see parseTimestamp() for the text file
+        self.frame_timestamp = 0.0
+        self.file_mtime = 0.0
+
+        #session recording, every new frame is written in meters so it can be replayed at any resolution
+        self.recorder = LidarRecorder(record_path) if record_path is not None else None
+
+        #change detection, when enabled getPositions() returns the cached list until the file is rewritten
+        self.watcher = FileChangeWatcher(self.file_location) if watch_changes else None
+        self.cached_positions = []
+
+        #every new frame fetched into the position buffer gets the next frame number, getPositions() and getPositionsArray() 
+        #each remember the last one they returned so using both on one parser never hides a new frame from either of them
+        self.frame_number = 0
+        self.list_frame = 0
+        self.array_frame = 0
+
+        #without a watcher the file is read on every call, it only counts as a new frame when its contents or timestamp changed
+        self.last_text = None
+
+        #background reader, when enabled getPositions() only hands over the latest snapshot
+        self.reader = None
+        self.reader_sequence = 0
+        if(threaded): 
+            self.reader = ThreadedLocationReader(self)
+            self.reader.start()
+
+
+    def setOutputResolution(self, field_width_pixels, field_height_pixels): 
+        """Changes the pixel resolution positions are mapped to, e.g. when the game changes its internal render resolution. 
+            Positions that have already been read are converted on the next change of the lidar data.
+
+        Args:
+            field_width_pixels (int): new width of the game in pixels
+            field_height_pixels (int): new height of the game in pixels
+        """
+        self.field_width_pixels = field_width_pixels
+        self.field_height_pixels = field_height_pixels
+        self.pixel_scale[:] = (self.field_width_pixels/self.field_width_meters, self.field_height_pixels/self.field_height_meters)
+        if(self.loaded_calibration is not None): 
+            self.calibration = self.loaded_calibration.scaled((self.field_width_pixels, self.field_height_pixels))
+
+    def metersToPixels(self, meters, out=None): 
+        """Maps floor positions to pixels the same way the lidar positions are mapped, all positions in one batched operation
+
+        Args:
+            meters (array like): (N,2) floor positions in meters in (x, y) order
+            out (numpy.ndarray, optional): (N,2) array the pixels are written into, None allocates a new one. Defaults to None.
 
-    def getPositions(self): 
+        Returns:
+            numpy.ndarray: (N,2) positions in pixels
+        """
+        if(self.calibration is not None): 
+            return self.calibration.apply(meters, out=out)
+        if(out is None): 
+            return np.asarray(meters, dtype=np.float64).reshape(-1, 2) * self.pixel_scale
+        return np.multiply(meters, self.pixel_scale, out=out, casting="unsafe")
+
+    def pixelsToMeters(self, pixels): 
+        """Maps pixels back to floor positions, e.g. to place something at a spot on the floor or to log where something happened
+
+        Args:
+            pixels (array like): (N,2) positions in pixels
+
+        Returns:
+            numpy.ndarray: (N,2) floor positions in meters in (x, y) order
+        """
+        if(self.calibration is not None): 
+            return self.calibration.invert(pixels)
+        return np.asarray(pixels, dtype=np.float64).reshape(-1, 2) / self.pixel_scale
+
+    def getPositions(self, return_new=False): 
         """Reads the lidar_output.txt file and parses the file contents into an array of positions 
 
+        Args:
+            return_new (bool, optional): when True a tuple of (positions, is_new) is returned, is_new is False when the positions 
+                are the cached result from a previous call because the file has not changed. getPositions() and getPositionsArray() 
+                each report new frames relative to their own previous call, so both can be used on the same parser. Defaults to False.
+
         Returns:
             List (Tuple (float)): positions contained in the lidar_output.txt file generated by the ROS lidar system.
         """
 
+        self._fetch()
+        is_new = self.list_frame != self.frame_number
+        if(is_new): 
+            self.list_frame = self.frame_number
+            self.cached_positions = [tuple(a) for a in self.position_array[:self.position_count].tolist()]
+
+        if(return_new): 
+            return self.cached_positions, is_new
+        return self.cached_positions
+
+    def getPositionsArray(self, return_new=False): 
+        """Same as getPositions() but returns the positions as an (N,2) float32 numpy array of pixel positions. 
+            The array is a view into a buffer that is reused between calls, copy it if you need to keep it past the next call. 
+
+        Args:
+            return_new (bool, optional): when True a tuple of (positions, is_new) is returned. Defaults to False.
+
+        Returns:
+            numpy.ndarray: (N,2) float32 array of positions in pixels
+        """
+        self._fetch()
+        is_new = self.array_frame != self.frame_number
+        self.array_frame = self.frame_number
+        positions = self.position_array[:self.position_count]
+
+        if(return_new): 
+            return positions, is_new
+        return positions
+
+    def _fetch(self): 
+        #gets the latest frame into the position buffer, in threaded mode the reader thread has already done the work
+        #in watch mode the read is skipped entirely if the file hasn't been rewritten since the last call
+        if(self.shared is not None): 
+            is_new = self._readShared()
+        elif(self.reader is not None): 
+            snapshot = self.reader.getSnapshot()
+            is_new = snapshot.sequence != self.reader_sequence
+            self.reader_sequence = snapshot.sequence
+            if(is_new): 
+                self._storePositions(snapshot.positions)
+                self.frame_timestamp = snapshot.timestamp
+        elif(self.watcher is not None and not self.watcher.changed()): 
+            is_new = False
+        else: 
+            text = self.readFile()
+            timestamp = self.parseTimestamp(text)
+            is_new = text != self.last_text or timestamp != self.frame_timestamp
+            if(is_new): 
+                self.last_text = text
+                self.frame_timestamp = timestamp
+                self.parsePositionsArray(text)
+
+        if(is_new): 
+            self.frame_number += 1
+            if(self.recorder is not None): 
+                self._record(self.position_array[:self.position_count])
+
+    def parsePositionsArray(self, position_string): 
+        """Parses the contents of a lidar_output.txt file into the reusable position buffer in a single vectorized pass. 
+            If the text contains a malformed line (for example a half written file) this falls back to the line by line parser. 
+
+        Args:
+            position_string (str): file contents, one 'y,x' position in meters per line
+
+        Returns:
+            numpy.ndarray: (N,2) float32 array of positions in pixels
+        """
+        #the optional '#t=' timestamp line isn't a position
+        if(position_string.startswith("#")): 
+            newline = position_string.find("\n")
+            position_string = "" if newline < 0 else position_string[newline + 1:]
+
+        #every valid line is two numbers separated by exactly one comma, so the commas and newlines have to alternate and there can't be any other whitespace. 
+        #then every line holds at most two values, and if the number of values doesn't line up with the number of commas at least one line is broken. 
+        #checking the lines and not just the totals keeps two broken lines (e.g. '3.0' and '4.0,') from adding up to a phantom position
+        characters = np.frombuffer(position_string.encode(), dtype=np.uint8)
+        separators = characters[(characters == 44) | (characters == 10)]
+        if(' ' in position_string or '\t' in position_string or '\r' in position_string or 
+                not np.all(separators[0::2] == 44) or not np.all(separators[1::2] == 10)): 
+            self._storePositions(self.parsePositions(position_string))
+            return self.position_array[:self.position_count]
+
+        try:
+            with warnings.catch_warnings(): 
+                warnings.simplefilter("ignore", DeprecationWarning)
+                values = np.fromstring(position_string.replace(',', ' '), dtype=np.float64, sep=' ')
+        except ValueError: 
+            values = None
+
+        if(values is None or values.size != 2 * position_string.count(',')): 
+            self._storePositions(self.parsePositions(position_string))
+            return self.position_array[:self.position_count]
+
+        #the file is in 'y,x' order so flip the columns while mapping meters to pixels
+        meters = values.reshape(-1, 2)[:, ::-1]
+        self._reserve(len(meters))
+        self.metersToPixels(meters, out=self.position_array[:len(meters)])
+        self.position_count = len(meters)
+
+        if(self.debug_print):
+            print(self.position_array[:self.position_count])
+
+        return self.position_array[:self.position_count]
+
+    def _readShared(self): 
+        #copies the latest frame of the shared ring into the position buffer, returns True if it is a new frame
+        frame, timestamp, meters = self.shared.read()
+        if(frame == 0 or frame == self.shared_frame): 
+            return False
+        self.shared_frame = frame
+        self.frame_timestamp = timestamp
+
+        #shared records are already in (x, y) order, only the meters to pixels mapping is needed
+        self._reserve(len(meters))
+        self.metersToPixels(meters, out=self.position_array[:len(meters)])
+        self.position_count = len(meters)
+        return True
+
+    def _record(self, pixel_positions): 
+        #recordings are kept in meters
+        self.recorder.write(self.pixelsToMeters(pixel_positions), self.frame_timestamp)
+
+    def _reserve(self, count): 
+        if(count > len(self.position_array)): 
+            self.position_array = np.zeros((max(count, 2 * len(self.position_array)), 2), dtype=np.float32)
+
+    def _storePositions(self, positions): 
+        #copies already converted pixel positions into the reusable buffer
+        self._reserve(len(positions))
+        if(len(positions) > 0): 
+            self.position_array[:len(positions)] = positions
+        self.position_count = len(positions)
+
+    def readFile(self): 
+        """Reads the raw contents of the lidar_output.txt file
+
+        Returns:
+            str: contents of the file
+        """
         #open the file in read mode
         with open(self.file_location, 'r') as f:
 
+            #the modification time stands in for the measurement time of files that don't carry a timestamp
+            self.file_mtime = os.fstat(f.fileno()).st_mtime
+
             #read file as string
-            position_string = f.read()
-
-            #list of positions that we will be returning 
-            position_list = []
-
-            #split the read in string by line, this gives us one string per line of text generated by the ROS system
-            xy_position_lines= position_string.split('\n')
-
-            #loop through each line of text
-            for a in xy_position_lines: 
-
-                #now we do the conversion from string to float
-                #the conversion is read_value * output_unit/input_unit 
-                #the ros system publishes locations in meters, based on the field size we can map it to a position with this. 
-                try:
-                    position = (float(a.split(',')[1]) * self.field_width_pixels/self.field_width_meters, float(a.split(',')[0]) * self.field_height_pixels/self.field_height_meters)        
-
-                    #if we were able to parse the point, add it to the list
-                    position_list.append(position)
-                except IndexError: 
-                    if(self.debug_print):
-                        print("Failed to parse position from \'%s\'" % a)
-                    else:
-                        pass
-            
-            #terminal spam, can be commented out
-            if(self.debug_print):
-                print(position_list)
-           
-            # return positions
-            return position_list
+            return f.read()
+
+    def parseTimestamp(self, position_string): 
+        """Gets the time the positions in a lidar_output.txt file were measured. Writers that know it (like movement_simulation.py) 
+            start the file with a '#t=<unix time>' line, files without one (like the ROS output) use the time the file was last modified. 
+
+        Args:
+            position_string (str): file contents as returned by readFile()
+
+        Returns:
+            float: wall clock (time.time()) measurement time of the positions
+        """
+        if(position_string.startswith("#t=")): 
+            try:
+                return float(position_string.split("\n", 1)[0][3:])
+            except ValueError: 
+                pass
+        return self.file_mtime
+
+    def parsePositions(self, position_string): 
+        """Parses the contents of a lidar_output.txt file into pixel positions
+
+        Args:
+            position_string (str): file contents, one 'y,x' position in meters per line
+
+        Returns:
+            List (Tuple (float)): parsed positions in pixels
+        """
+
+        #list of positions that we will be returning 
+        position_list = []
+
+        #split the read in string by line, this gives us one string per line of text generated by the ROS system
+        xy_position_lines= position_string.split('\n')
+
+        #loop through each line of text
+        for a in xy_position_lines: 
+
+            #comment lines like the '#t=' timestamp aren't positions
+            if(a.startswith("#")): 
+                continue
+
+            #now we do the conversion from string to float
+            #the conversion is read_value * output_unit/input_unit 
+            #the ros system publishes locations in meters, based on the field size we can map it to a position with this. 
+            #a line that isn't exactly two values (e.g. half written) raises ValueError and is skipped
+            try:
+                y, x = a.split(',')
+                if(self.calibration is None): 
+                    position = (float(x) * self.field_width_pixels/self.field_width_meters, float(y) * self.field_height_pixels/self.field_height_meters)        
+                else: 
+                    #calibrated positions are mapped all at once after the loop
+                    position = (float(x), float(y))
+
+                #if we were able to parse the point, add it to the list
+                position_list.append(position)
+            except (IndexError, ValueError): 
+                if(self.debug_print):
+                    print("Failed to parse position from \'%s\'" % a)
+                else:
+                    pass
+
+        if(self.calibration is not None and len(position_list) > 0): 
+            position_list = [tuple(a) for a in self.calibration.apply(position_list).tolist()]
+        
+        #terminal spam, can be commented out
+        if(self.debug_print):
+            print(position_list)
+       
+        # return positions
+        return position_list
+
+    def replayFinished(self): 
+        """Checks whether the "replay" transport has played the last frame of the recording, this is never True when it loops
+
+        Returns:
+            bool: True once a replay has finished, always False for the other transports
+        """
+        return isinstance(self.shared, LidarPlayer) and self.shared.finished
+
+    def close(self): 
+        """Stops the reader thread and releases the file watcher, shared memory and recorder, if any are in use"""
+        if(self.shared is not None): 
+            self.shared.close()
+            self.shared = None
+        if(self.reader is not None): 
+            self.reader.stop()
+            self.reader = None
+        if(self.watcher is not None): 
+            self.watcher.close()
+        if(self.recorder is not None): 
+            self.recorder.close()
+            self.recorder = None
+
+
+def add_lidar_arguments(arg_parser):
+    """Adds the lidar input options to a game's argparse parser"""
+    arg_parser.add_argument("--calibration", help="Floor to projector calibration file made with calibration.py.")
+    arg_parser.add_argument("--transport", choices=["text", "shared"], default="text", help="Read the lidar positions from lidar_output.txt ('text') or from the binary shared memory file written by movement_simulation.py -o shared ('shared').")
+    arg_parser.add_argument("--lidar_path", help="Path of the lidar input (e.g. /dev/shm/arc_lidar.bin for the shared transport), by default the path in lidar_input_file_location.txt is used.")
+    arg_parser.add_argument("--threaded", action="store_true", help="Read and parse lidar_output.txt on a background thread (text transport only).")
+    arg_parser.add_argument("--replay", help="Play back a recording made with lidar_recording.py instead of reading the live lidar, the game exits when the recording ends.")
+    arg_parser.add_argument("--replay_speed", type=float, default=1.0, help="Playback speed of --replay, 1 is real time, 4 is four times faster and 0 hands the game the next frame on every lidar poll so no frame is skipped.")
+    arg_parser.add_argument("--replay_loop", action="store_true", help="Play --replay again from the start after the last frame instead of exiting.")
+
+
+def lidar_options_from_arguments(args):
+    """Gets the LocationParser keyword arguments described by the options added with add_lidar_arguments"""
+    options = {"calibration_file": args.calibration, "transport": args.transport, "lidar_path": args.lidar_path, "threaded": args.threaded}
+    if(args.replay is not None): 
+        options.update(transport="replay", lidar_path=args.replay, replay_speed=args.replay_speed, replay_loop=args.replay_loop)
+    return options
@@ -3,11 +3,21 @@
 import pygame
 import random
 import numpy as np
-import sys
-from location_parser import LocationParser
+from spatial_index import SpatialIndex
+from tracker import PersonTracker
+from sprite_cache import RotatedSpriteCache
+from dirty_renderer import DirtyRectRenderer
+from game_loop import FixedTimestepLoop
+from launcher import GamePlugin, run_game
+
+#the ball velocities are in pixels per frame of the original 120Hz loop, physics steps are scaled relative to this rate
+REFERENCE_RATE = 120
+
+#how much of a player's own movement carries over into the direction of a kick, 0 always bounces the ball straight away from the players
+KICK_TRANSFER = 1.0
 
 class SoccerBall(): 
-    def __init__(self, max_velocity = 5,  radius=50, bounds=(0,0, 1920,1080), initial_position=(1920/2,1080/2), initial_velocitiy=None):
+    def __init__(self, max_velocity = 5,  radius=50, bounds=(0,0, 1920,1080), initial_position=(1920/2,1080/2), initial_velocitiy=None, rotation_steps=360, sprite=None):
         """Soccer ball object that interacts with the players 
 
         Args:
@@ -15,6 +25,8 @@ class SoccerBall():
             bounds (tuple, optional): bounds of where the ball can move on the playing field as tuple in form of (xmin, ymin, xmax, ymax). Defaults to (0,0, 1920,1080).
             initial_position (tuple, optional): initial position of the soccer ball on screen. Defaults to (1920/2,1080/2).
             initial_velocitiy (tuple, optional): intial velocity of the ball, if None the inital velocity of the ball will be randomly determined. Defaults to None.
+            rotation_steps (int, optional): number of distinct rotations of the sprite that get cached. Defaults to 360.
+            sprite (pygame.Surface, optional): already loaded ball image (e.g. from the launcher's asset cache), None loads images/gear.png. Defaults to None.
         """
         
         self.bounds = bounds
@@ -23,9 +35,10 @@ class SoccerBall():
         self.radius = radius
         self.max_velocity = max_velocity
 
-        self.sprite = pygame.image.load("images/gear.png")
+        self.sprite = pygame.image.load("images/gear.png") if sprite is None else sprite
         self.sprite = pygame.transform.scale(self.sprite, (2*self.radius, 2*self.radius))
         self.sprite_size = self.sprite.get_rect()
+        self.rotated_sprites = RotatedSpriteCache(self.sprite, steps=rotation_steps)
 
         if(initial_velocitiy is None): 
             self.vx = random.random() * max_velocity
@@ -36,23 +49,34 @@ class SoccerBall():
 
         self.theta = 0
         self.radial_velocity = 0.1
+
+        #state before the last physics step, used to interpolate when drawing between steps
+        self.previous_x, self.previous_y, self.previous_theta = self.x, self.y, self.theta
     
-    def move(self, players): 
+    def move(self, players, player_index=None, dt=1/REFERENCE_RATE, player_velocities=None): 
         """Moves the soccer ball and interacts with player positions on the field
 
         Args:
             players (list Vector2d): Point positions of all the players who are currently detected on the field
+            player_index (SpatialIndex, optional): spatial index built over the players, when given only the players near the ball are checked. Defaults to None.
+            dt (float, optional): length of the physics step in seconds. Defaults to 1/120.
+            player_velocities (array like, optional): (N,2) velocity of every player in pixels per second (see tracker.PersonTracker), 
+                when given the ball is kicked in the direction the players are moving instead of just bouncing off them. Defaults to None.
         """
+        self.previous_x, self.previous_y, self.previous_theta = self.x, self.y, self.theta
+
+        #velocities are per 120Hz frame, so scale them to the length of this step
+        step = dt * REFERENCE_RATE
 
         #first just move the ball
-        self.x += self.vx
-        self.y += self.vy
-        self.theta += self.radial_velocity
+        self.x += self.vx * step
+        self.y += self.vy * step
+        self.theta += self.radial_velocity * step
 
         #little bit of damping on the ball
         self.vx *= 1
         self.vy *= 1
-        self.radial_velocity *= 0.99
+        self.radial_velocity *= 0.99 ** step
 
         if (self.x < self.bounds[0] + self.radius):
             self.vx *= -1
@@ -69,17 +93,30 @@ class SoccerBall():
         self.vx = self.constrain(self.vx, -self.max_velocity, self.max_velocity)
         self.vy = self.constrain(self.vy, -self.max_velocity, self.max_velocity)
 
-        for a in players: 
-            dist = self.calc_distance((self.x, self.y), a)
-            if(dist < self.radius + 25): 
-                magnitude = max(np.sqrt(self.vx**2 + self.vy**2), 0.1)
-
-                diff = (a[0] - self.x, a[1] - self.y)  
-                bounce_direction = np.arctan2(diff[1], diff[0])
-                self.vx = self.max_velocity * np.cos(np.pi + bounce_direction)
-                self.vy = self.max_velocity * np.sin(np.pi + bounce_direction)
-                
-                self.radial_velocity = random.random() * 20 - 10
+        #find every player touching the ball
+        if(player_index is not None): 
+            touching_index = player_index.query((self.x, self.y), self.radius + 25)
+            touching = player_index.positions[touching_index]
+        else: 
+            touching_index = [i for i, a in enumerate(players) if self.calc_distance((self.x, self.y), a) < self.radius + 25]
+            touching = [players[i] for i in touching_index]
+
+        if(len(touching) > 0): 
+            #bounce away from the average position of everyone touching the ball, rather than whichever player happened to be checked last
+            touching = np.asarray(touching, dtype=np.float64)
+            diff = (np.mean(touching[:, 0]) - self.x, np.mean(touching[:, 1]) - self.y)  
+            bounce_direction = np.arctan2(diff[1], diff[0])
+            kick = self.max_velocity * np.array((np.cos(np.pi + bounce_direction), np.sin(np.pi + bounce_direction)))
+
+            #players running into the ball push it along the way they're going, velocities are converted to pixels per 120Hz frame like the ball's
+            if(player_velocities is not None): 
+                kick += KICK_TRANSFER * np.mean(np.asarray(player_velocities, dtype=np.float64)[touching_index], axis=0) / REFERENCE_RATE
+
+            #the kick only changes the direction, the ball always leaves at max_velocity
+            kick *= self.max_velocity / max(np.hypot(kick[0], kick[1]), 1e-9)
+            self.vx, self.vy = kick[0], kick[1]
+            
+            self.radial_velocity = random.random() * 20 - 10
 
     def reset(self): 
         self.x = (self.bounds[2] + self.bounds[0])/2
@@ -87,6 +124,9 @@ class SoccerBall():
         self.vx = (random.random() - 0.5) * self.max_velocity 
         self.vy = (random.random() - 0.5) * self.max_velocity
 
+        #the ball teleports, so don't interpolate from where it was
+        self.previous_x, self.previous_y, self.previous_theta = self.x, self.y, self.theta
+
     def calc_distance(self, p1, p2): 
         return np.sqrt((p1[0] - p2[0])**2 + (p1[1] - p2[1])**2)
 
@@ -98,22 +138,35 @@ class SoccerBall():
             ret = upper 
         return ret
 
-    def draw(self, screen): 
-        pygame.draw.circle(screen, (255,255,255), (self.x, self.y), self.radius + 10, 30)
+    def draw(self, screen, alpha=1): 
+        """Draws the ball
+
+        Args:
+            alpha (float, optional): how far between the previous and the current physics step to draw the ball, 1 draws the current state. Defaults to 1.
+
+        Returns:
+            pygame.Rect: area of the screen that was drawn on
+        """
+        x = self.previous_x + (self.x - self.previous_x) * alpha
+        y = self.previous_y + (self.y - self.previous_y) * alpha
+        theta = self.previous_theta + (self.theta - self.previous_theta) * alpha
+
+        ring = pygame.draw.circle(screen, (255,255,255), (x, y), self.radius + 10, 30)
     
-        rotated_sprite = pygame.transform.rotate(self.sprite, int(self.theta))
+        rotated_sprite = self.rotated_sprites.get(theta)
         pos = rotated_sprite.get_rect()
-        pos.center = (self.x, self.y)
-        screen.blit(rotated_sprite, pos)
+        pos.center = (x, y)
+        return ring.union(screen.blit(rotated_sprite, pos))
 
 class SoccerField: 
-    def __init__(self, size=(1920, 1080), line_color=(255,255,255), field_color=(0,180,0)): 
+    def __init__(self, size=(1920, 1080), line_color=(255,255,255), field_color=(0,180,0), font=None): 
         """Soccer field object to draw to the screen
 
         Args:
             size (tuple, optional): size (tuple, optional): resolution of the display. Defaults to (1920, 1080).. Defaults to (1920, 1080).
             line_color (tuple, optional): color of the lines on the field. Defaults to (255,255,255).
             field_color (tuple, optional): background fill color of the field. Defaults to (0,180,0).
+            font (pygame.font.Font, optional): font used for text on the field, None loads freesansbold.ttf. Defaults to None.
         """
 
 
@@ -125,7 +178,7 @@ class SoccerField:
 
         self.scores = [0,0]
 
-        self.font = pygame.font.Font('freesansbold.ttf', 32)
+        self.font = pygame.font.Font('freesansbold.ttf', 32) if font is None else font
 
     def draw(self, screen): 
         #screen.fill(self.field_color)
@@ -143,50 +196,108 @@ class SoccerField:
         screen.blit(text, textRect)
 
 
-#start pygame
-pygame.init()
-SCREEN_WIDTH, SCREEN_HEIGHT = 1920 , 1080 #render resolution, this will be scaled to the screen
-screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.FULLSCREEN | pygame.SCALED)
+#when True only the parts of the screen the ball and players touched are redrawn and sent to the display each frame
+DIRTY_RECTS = True
 
+#extrapolate the players to the moment the frame reaches the projector, using the measured latency
+LATENCY_COMPENSATION = True
 
-#lidar positioner that handles the parsing of the file into a tuple array. 
-#see location_parser.py for parameter description.
-lidar_positioner = LocationParser()
-soccer_ball = SoccerBall(radius=125)
-soccer_field = SoccerField()
+def draw_background(size, soccer_field): 
+    """The field lines and border never change, so they are drawn once onto a background surface"""
+    background = pygame.Surface(size).convert()
+    background.fill((0,0,0))
+    soccer_field.draw(background)
+    pygame.draw.rect(background, (255,255,255), pygame.Rect(0,0,size[0],size[1]), max(1, int(10 * size[1] / 1080)))
+    return background
 
-running = True #indicates the game is currently running
-clock = pygame.time.Clock() #used to moduleate the frame rate and keep successive actions constant
+class SoccerGame(GamePlugin): 
+    def __init__(self, runtime): 
+        """Soccer with a spinning gear for a ball, players kick it around by walking into it"""
+        super().__init__(runtime)
+        width, height = self.size
 
-while running:
+        #everything was laid out for 1920x1080, so sizes and speeds are scaled to the internal resolution
+        self.scale = height / 1080
 
-    #check whether the user quit the game 
-    # if so set running to False so we can close on the next iteration
-    for event in pygame.event.get():
-        if event.type == pygame.QUIT:
-            running = False
+        #spatial index over the player positions, shared by everything on the field that interacts with the players
+        self.player_index = SpatialIndex(cell_size=150 * self.scale)
 
-    # Fill the background with black
-    screen.fill((0,0,0, 1))
-    soccer_field.draw(screen)
+        #tracks the players between lidar updates, this gives every player a velocity and smooth positions at the render rate
+        self.tracker = PersonTracker(gate_distance=150 * self.scale, max_prediction=0.15)
+        self.positions = np.zeros((0, 2))
+        self.velocities = np.zeros((0, 2))
 
-    pygame.draw.rect(screen, (255,255,255), pygame.Rect(0,0,1920,1080), 10)
+        #physics runs at a fixed 240Hz no matter how fast frames are drawn
+        self.physics_loop = FixedTimestepLoop(physics_hz=240)
 
-    #get positions from the LocationParser
-    positions = lidar_positioner.getPositions()
-    for xy in positions: 
-       pygame.draw.circle(screen, (0,0,255), xy, 10) 
+    def prepare(self): 
+        #the ball sprite, the field font and the pre-rendered background are SDL surfaces, so they are made on the main thread
+        width, height = self.size
+        self.soccer_ball = SoccerBall(max_velocity=5 * self.scale, radius=int(125 * self.scale), bounds=(0, 0, width, height), initial_position=(width/2, height/2), sprite=self.runtime.assets.image("images/gear.png"))
+        self.soccer_field = SoccerField(self.size, font=self.runtime.assets.font('freesansbold.ttf', 32))
+        self.renderer = DirtyRectRenderer(self.runtime.display.surface, draw_background(self.size, self.soccer_field), enabled=DIRTY_RECTS)
 
-    soccer_ball.move(positions)
-    soccer_ball.draw(screen)
-    
+    def start(self): 
+        #whatever the previous game left on the screen has to be covered by a full redraw
+        self.renderer.set_background(self.renderer.background, self.runtime.display.surface)
 
-    #write pixels to the display
-    pygame.display.flip()
-    
-    #wait until next game tick
-    clock.tick(120)
+    def resize(self, size): 
+        #the internal resolution changed, rebuild everything that depends on it and carry the ball over to the same spot
+        ratio = size[1] / (1080 * self.scale)
+        self.scale = size[1] / 1080
+
+        self.positions = self.positions * ratio
+        self.velocities = self.velocities * ratio
+        self.tracker.rescale(ratio)
+        self.player_index.cell_size = 150 * self.scale
+        self.player_index.rebuild(self.positions)
+
+        old_ball = self.soccer_ball
+        self.soccer_ball = SoccerBall(max_velocity=5 * self.scale, radius=int(125 * self.scale), bounds=(0, 0, size[0], size[1]), initial_position=(old_ball.x * ratio, old_ball.y * ratio), initial_velocitiy=(old_ball.vx * ratio, old_ball.vy * ratio), sprite=self.runtime.assets.image("images/gear.png"))
+        self.soccer_ball.theta, self.soccer_ball.radial_velocity = old_ball.theta, old_ball.radial_velocity
+
+        self.soccer_field = SoccerField(size, font=self.runtime.assets.font('freesansbold.ttf', 32))
+        self.renderer.set_background(draw_background(size, self.soccer_field), self.runtime.display.surface)
+
+    def update(self, positions, dt): 
+        runtime = self.runtime
+        profiler = runtime.profiler
+
+        #the players are predicted forward to when this frame will be seen, so they move smoothly even though the lidar updates slower than the display
+        #and the ball reacts to where their feet are rather than where they were when the lidar saw them
+        with profiler.scope("tracking"): 
+            if(runtime.new_positions): 
+                self.tracker.update(positions, runtime.measurement_time)
+            ids, self.positions, self.velocities = self.tracker.predict(runtime.target_time if LATENCY_COMPENSATION else None)
+            self.player_index.rebuild(self.positions)
+
+        #catch the physics up to real time
+        with profiler.scope("physics"): 
+            for step in range(self.physics_loop.advance(dt)): 
+                self.soccer_ball.move(self.positions, self.player_index, self.physics_loop.dt, self.velocities)
+
+    def draw(self, surface): 
+        profiler = self.runtime.profiler
+
+        # Put the background (black with the field lines and border) back
+        with profiler.scope("restore"): 
+            self.renderer.restore()
+
+        #draw the players and the ball interpolated between the last two steps
+        with profiler.scope("draw"): 
+            for xy in self.positions.tolist(): 
+               self.renderer.add(pygame.draw.circle(surface, (0,0,255), xy, 10 * self.scale))
+            self.renderer.add(self.soccer_ball.draw(surface, self.physics_loop.alpha))
+
+        return self.renderer.finish()
+
+    def invalidate(self, rect): 
+        self.renderer.invalidate(rect)
 
-#exit
-pygame.quit()
-sys.exit()
+GAME = SoccerGame
+
+def main(): 
+    run_game(SoccerGame)
+
+if __name__ == "__main__": 
+    main()
@@ -1,25 +1,33 @@
 #!/usr/bin/ python3
 
 #Imports
-import argparse, random, time
+import argparse, random, time, os, signal, multiprocessing
+from multiprocessing import shared_memory
 import numpy as np
+from shared_positions import SharedPositionWriter
+from game_loop import FixedTimestepLoop
+
+#the simulated velocities are in meters per 25ms tick, physics steps are scaled relative to this rate
+REFERENCE_RATE = 40
 
 #Walking person class
 class WalkingPerson: 
     """Object designed to imitate the motion of a person in the playing area of the projector game. 
     """
-    def __init__(self, field_resolution, field_size): 
+    def __init__(self, field_resolution, field_size, debug_print=False): 
         """Creation of the WalkingPerson Object
 
         Args:
             field_resolution (Tuple Int): Resolution of the playing area, this is the resolution of the game itself
             field_size (Tuple Float): Size of the real-world play area in meters, this is the size of the projection on the floor. 
+            debug_print (bool, optional): print a line every time the person changes direction. Defaults to False.
         """
         self.field_resolution = field_resolution
         self.field_size = field_size
         self.position = [random.random() * field_size[0], random.random() * field_size[1]]
         self.direction = 0
         self.velocity = 1
+        self.debug_print = debug_print
 
     def get_position(self): 
         """Gets the position of the walking person 
@@ -45,7 +53,8 @@ class WalkingPerson:
 
             self.velocity = np.random.normal() * 0.025
 
-            print("Object updated to direction %0.2f, with velocity %0.2f" % (self.direction, self.velocity))
+            if(self.debug_print): 
+                print("Object updated to direction %0.2f, with velocity %0.2f" % (self.direction, self.velocity))
 
         self.position[0] += self.velocity * np.cos(self.direction)
         self.position[1] += self.velocity * np.sin(self.direction)
@@ -67,41 +76,456 @@ class WalkingPerson:
         
 
 class LocationGenerator: 
-    """LocationGenerator handles the generation of locations of objects and writing those objects to a file that can act as simulation of the lidar output
+    """LocationGenerator handles the generation of locations of objects and writing those objects to a file that can act as simulation of the lidar output. 
+        The simulated people follow the same random walk as WalkingPerson, but every person is stored as a row in numpy arrays so the whole crowd is moved with batched array operations. 
     """
-    def __init__(self, field_resolution, field_size, num_people):
+    def __init__(self, field_resolution, field_size, num_people, shared_path=None, output_path="lidar_output.txt", fsync_interval=0, debug_print=False, seed=None):
         """Constructor of LocationGenerator
 
         Args:
             field_resolution (Tuple (int)): Resolution in pixels of the python game (width,height). 
             field_size (Tuple (Float)): Size of the real-world projector field in meters in format (width, height)
             num_people (int): number of people to simulate
+            shared_path (str, optional): path of the shared memory file written by write_to_shared_memory(), None disables the shared output. Defaults to None.
+            output_path (str, optional): path of the text file written by write_to_file(). Defaults to "lidar_output.txt".
+            fsync_interval (int, optional): fsync the text file every this many writes, 0 never fsyncs. Defaults to 0.
+            debug_print (bool, optional): print a line every time a person changes direction. Defaults to False.
+            seed (int, optional): seed of the random generator, None picks a random seed. Defaults to None.
         """
         self.field_resolution = field_resolution
         self.field_size = field_size
         self.num_people = num_people
+        self.debug_print = debug_print
         print("Creating LocationGenerator with field resolution of (%d, %d) and field size of (%0.2fm, %0.2fm) with %d people in the playing field" % (self.field_resolution[0], self.field_resolution[1], self.field_size[0], self.field_size[1], self.num_people))
 
-        self.people = []
-        for a in range(0, num_people): 
-            self.people.append(WalkingPerson(field_resolution, field_size))
+        self.rng = np.random.default_rng(seed)
+
+        #state of every person, one row per person
+        self.size = np.array(field_size, dtype=np.float64)
+        self.positions = self.rng.random((num_people, 2)) * self.size
+        self.directions = np.zeros(num_people)
+        self.headings = np.stack((np.cos(self.directions), np.sin(self.directions)), axis=1)
+        self.velocities = np.ones(num_people)
+
+        self._open_outputs(shared_path, output_path, fsync_interval)
+
+    def _open_outputs(self, shared_path, output_path, fsync_interval): 
+        self.output_path = output_path
+        self.fsync_interval = fsync_interval
+        self.write_count = 0
+
+        self.shared_writer = None
+        if(shared_path is not None): 
+            self.shared_writer = SharedPositionWriter(shared_path, max_points=max(self.num_people, 64))
+
+    def get_positions(self): 
+        """Gets the position of every simulated person
+
+        Returns:
+            numpy.ndarray: (N,2) array of positions in meters in format (x,y)
+        """
+        return self.positions
         
-    def move(self): 
-        """Moves all WalkingPerson objects that available in the LocationGenerator
+    def move(self, dt=1/REFERENCE_RATE): 
+        """Moves every simulated person by one step, this is the batched equivalent of calling WalkingPerson.move() on each person
+
+        Args:
+            dt (float, optional): length of the step in seconds. Defaults to 0.025.
         """
-        for a in self.people: 
-            a.move()
+        step = dt * REFERENCE_RATE
+
+        #each person has a small chance of picking a new direction and velocity, usually along the line through the center of the field
+        changed = np.flatnonzero(self.rng.random(self.num_people) < 1 - 0.975 ** step)
+        if(len(changed) > 0): 
+            diff = self.positions[changed] - self.size/2
+            direction_to_center = np.arctan2(diff[:, 1], diff[:, 0])
+            random_direction = self.rng.uniform(-np.pi, np.pi, len(changed))
+            self.directions[changed] = np.where(self.rng.random(len(changed)) < 0.9, direction_to_center, random_direction)
+            self.velocities[changed] = self.rng.standard_normal(len(changed)) * 0.025
+
+            #the heading only has to be recomputed for people whose direction changed
+            self.headings[changed, 0] = np.cos(self.directions[changed])
+            self.headings[changed, 1] = np.sin(self.directions[changed])
+
+            if(self.debug_print): 
+                for a in changed: 
+                    print("Object updated to direction %0.2f, with velocity %0.2f" % (self.directions[a], self.velocities[a]))
+
+        self.positions += self.velocities[:, None] * self.headings * step
+        self.velocities *= 0.99 ** step
+
+        #reflect off the walls, each axis that went out of bounds flips the velocity once
+        outside = (self.positions < 0) | (self.positions > self.size)
+        np.clip(self.positions, 0, self.size, out=self.positions)
+        flips = np.count_nonzero(outside, axis=1)
+        self.velocities[flips == 1] *= -1
 
     def write_to_file(self):
-        """Writes the position of each tracked object in a text file that mirrors the output of the lidar tracker""" 
+        """Writes the position of each tracked object in a text file that mirrors the output of the lidar tracker. 
+            The frame is written to a temporary file which then replaces the output file, so readers always see a complete frame.""" 
+
+        #format the whole frame in one go, the file is in 'y,x' order
+        #the first line is the time the positions were generated, so the games can measure their latency
+        positions = self.get_positions()
+        values = positions[:, ::-1].ravel().tolist()
+        output_string = ("#t=%0.6f\n" % time.time()) + ("%0.6f,%0.6f\n" * len(positions)) % tuple(values)
+
+        #the temporary file has to be in the same folder so os.replace is an atomic rename
+        temp_path = self.output_path + ".tmp"
+        with open(temp_path, "w") as f: 
+            f.write(output_string)
+
+            self.write_count += 1
+            if(self.fsync_interval > 0 and self.write_count % self.fsync_interval == 0): 
+                f.flush()
+                os.fsync(f.fileno())
+
+        os.replace(temp_path, self.output_path)
+
+    def write_to_shared_memory(self): 
+        """Binary counterpart of write_to_file, publishes the positions of each tracked object as one frame in the shared memory ring""" 
+        self.shared_writer.write(self.get_positions())
+
+    def close(self): 
+        """Closes the shared memory output, if it is in use"""
+        if(self.shared_writer is not None): 
+            self.shared_writer.close()
+            self.shared_writer = None
+
+
+#behaviors of the people simulated by ShardedLocationGenerator, stored as one int8 per person
+WANDER, CLUSTER, RUN, CHASE, WAYPOINTS = range(5)
+BEHAVIORS = {"wander": WANDER, "cluster": CLUSTER, "run": RUN, "chase": CHASE, "waypoints": WAYPOINTS}
 
-        output_string = ""
-        for a in self.people: 
-            output_string += "%0.6f,%0.6f\n" % (a.get_position()[1], a.get_position()[0])
+#speeds in meters per second
+WALK_SPEED = 1.4
+CLUSTER_SPEED = 1.0
+RUN_SPEED = 4.0
+CHASE_SPEED = 2.5
 
-        f = open("lidar_output.txt", "w")
-        f.write(output_string)
-        f.close()
+#the simulated ball the chasers go after, it gets kicked away by whoever reaches it first
+KICK_RADIUS = 0.25
+KICK_SPEED = 4.0
+
+#layout of the crowd state in shared memory, one row per person (plus the ball), every array is a view into the same block
+SHARED_STATE = [("positions", np.float64, 2), ("velocities", np.float64, 2), ("targets", np.float64, 2), ("behaviors", np.int8, 1), ("active", np.bool_, 1)]
+
+def shared_state_size(num_people): 
+    #the ball (x, y, vx, vy) goes first so every float64 array stays aligned
+    return 4 * 8 + sum(np.dtype(dtype).itemsize * width * num_people for name, dtype, width in SHARED_STATE)
+
+def shared_state_arrays(buffer, num_people): 
+    """Builds the numpy views of the crowd state in a shared memory block, the main process and every worker build the same views
+
+    Args:
+        buffer (buffer): memory of at least shared_state_size(num_people) bytes
+        num_people (int): number of people the block holds
+
+    Returns:
+        dict: 'ball' (4,) array of x, y, vx, vy and one array per entry of SHARED_STATE, (num_people, width) or (num_people,) for width 1
+    """
+    arrays = {"ball": np.ndarray((4,), dtype=np.float64, buffer=buffer)}
+    offset = arrays["ball"].nbytes
+    for name, dtype, width in SHARED_STATE: 
+        shape = (num_people, width) if width > 1 else (num_people,)
+        arrays[name] = np.ndarray(shape, dtype=dtype, buffer=buffer, offset=offset)
+        offset += arrays[name].nbytes
+    return arrays
+
+def step_shard(state, start, stop, rng, dt, field_size): 
+    """Moves the people in rows start to stop by one step, each shard only ever touches its own rows so shards can run in parallel
+
+    Args:
+        state (dict): crowd state from shared_state_arrays()
+        start (int): first row of the shard
+        stop (int): row after the last row of the shard
+        rng (numpy.random.Generator): random generator of the shard
+        dt (float): length of the step in seconds
+        field_size (numpy.ndarray): (width, height) of the field in meters
+
+    Returns:
+        Tuple (float): (distance, x, y) of the active person of the shard closest to the ball, distance is inf when the shard has nobody
+    """
+    positions = state["positions"][start:stop]
+    velocities = state["velocities"][start:stop]
+    targets = state["targets"][start:stop]
+    behaviors = state["behaviors"][start:stop]
+    active = state["active"][start:stop]
+    ball = state["ball"][:2]
+    step = dt * REFERENCE_RATE
+
+    #every person has the same small chance per step of making a new decision as the original random walk, runners decide twice as often
+    chance = rng.random(len(positions))
+    decide = chance < 1 - 0.975 ** step
+
+    #wander: the LocationGenerator random walk, a new direction (usually along the line through the center) and speed every now and then
+    wander = behaviors == WANDER
+    turn = np.flatnonzero(decide & wander)
+    if(len(turn) > 0): 
+        diff = positions[turn] - field_size/2
+        direction = np.where(rng.random(len(turn)) < 0.9, np.arctan2(diff[:, 1], diff[:, 0]), rng.uniform(-np.pi, np.pi, len(turn)))
+        speed = rng.standard_normal(len(turn)) * 0.025 * REFERENCE_RATE
+        velocities[turn, 0] = speed * np.cos(direction)
+        velocities[turn, 1] = speed * np.sin(direction)
+    velocities *= np.where(wander, 0.99 ** step, 1.0)[:, None]
+
+    #run: straight lines at a sprint, changing direction more often than walkers
+    run = np.flatnonzero((behaviors == RUN) & (chance < 1 - 0.95 ** step))
+    if(len(run) > 0): 
+        direction = rng.uniform(-np.pi, np.pi, len(run))
+        speed = RUN_SPEED * rng.uniform(0.8, 1.2, len(run))
+        velocities[run, 0] = speed * np.cos(direction)
+        velocities[run, 1] = speed * np.sin(direction)
+
+    #cluster, waypoints and chase steer towards a point, the group's meeting point, the next waypoint or the ball (plus a personal offset so chasers don't stack up)
+    for behavior, speed, rate in ((CLUSTER, CLUSTER_SPEED, 3.0), (WAYPOINTS, WALK_SPEED, 3.0), (CHASE, CHASE_SPEED, 4.0)): 
+        steer = np.flatnonzero(behaviors == behavior)
+        if(len(steer) == 0): 
+            continue
+        goal = ball + targets[steer] if behavior == CHASE else targets[steer]
+        to_goal = goal - positions[steer]
+        distance = np.hypot(to_goal[:, 0], to_goal[:, 1])[:, None]
+
+        #slow down on arrival and keep shuffling around a little
+        desired = to_goal / np.maximum(distance, 1e-9) * speed * np.minimum(distance / 0.5, 1)
+        desired += rng.normal(0, 0.3 * speed, desired.shape)
+        velocities[steer] += (desired - velocities[steer]) * min(rate * dt, 1)
+
+    positions += velocities * dt
+
+    #bounce off the walls, every axis that went out of bounds flips that part of the velocity
+    #only a handful of people are outside on any step, so only those get clipped
+    to_ball = positions - ball
+    half = field_size / 2
+    rows, axes = np.nonzero(np.abs(positions - half) > half)
+    if(len(rows) > 0): 
+        positions[rows, axes] = np.clip(positions[rows, axes], 0, field_size[axes])
+        velocities[rows, axes] *= -1
+        to_ball[rows, axes] = positions[rows, axes] - ball[axes]
+
+    #report who is closest to the ball so the main process can decide who kicks it
+    distance = np.einsum("ij,ij->i", to_ball, to_ball)
+    if(not np.all(active)): 
+        distance[~active] = np.inf
+    if(len(distance) == 0): 
+        return (np.inf, 0.0, 0.0)
+    nearest = np.argmin(distance)
+    return (float(np.sqrt(distance[nearest])), float(positions[nearest, 0]), float(positions[nearest, 1]))
+
+#crowd state of a pool worker, attached once when the worker starts
+_worker_memory = None
+_worker_state = None
+
+def _attach_worker(name, num_people): 
+    #ctrl + c reaches every process, only the main process should react to it and then shut the pool down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    global _worker_memory, _worker_state
+    _worker_memory = shared_memory.SharedMemory(name=name)
+    _worker_state = shared_state_arrays(_worker_memory.buf, num_people)
+
+def _step_worker(task): 
+    start, stop, seed, step_count, dt, field_size = task
+    return step_shard(_worker_state, start, stop, np.random.default_rng([seed, step_count]), dt, field_size)
+
+
+class ShardedLocationGenerator(LocationGenerator): 
+    """LocationGenerator for very large crowds. The state of every person lives in shared memory and the crowd is split into shards that 
+        a multiprocessing pool moves in parallel, every step all shards write their rows in place so the merged frame is simply the shared positions array. 
+        People also follow scripted behaviors (see BEHAVIORS) on top of the original random walk. 
+    """
+    def __init__(self, field_resolution, field_size, num_people, processes=None, shards=None, seeds=None, behaviors=None, shared_path=None, output_path="lidar_output.txt", fsync_interval=0, seed=None):
+        """Constructor of ShardedLocationGenerator
+
+        Args:
+            field_resolution (Tuple (int)): Resolution in pixels of the python game (width,height). 
+            field_size (Tuple (Float)): Size of the real-world projector field in meters in format (width, height)
+            num_people (int): number of people to simulate
+            processes (int, optional): number of worker processes, 0 steps every shard in this process. None uses one per CPU. Defaults to None.
+            shards (int, optional): number of shards the crowd is split into, None uses one per process. Defaults to None.
+            seeds (list int, optional): seed of every shard, None derives them from seed. Defaults to None.
+            behaviors (dict, optional): fraction of the crowd following each behavior, e.g. {"wander": 0.8, "chase": 0.2}, None makes everyone wander. 
+                An empty dict starts with an empty field, people then only appear through spawn(). Defaults to None.
+            shared_path (str, optional): path of the shared memory file written by write_to_shared_memory(), None disables the shared output. Defaults to None.
+            output_path (str, optional): path of the text file written by write_to_file(). Defaults to "lidar_output.txt".
+            fsync_interval (int, optional): fsync the text file every this many writes, 0 never fsyncs. Defaults to 0.
+            seed (int, optional): seed of the starting positions and of the shard seeds, the same seed and number of shards always give the same movements. 
+                None picks a random seed. Defaults to None.
+        """
+        self.field_resolution = field_resolution
+        self.field_size = field_size
+        self.num_people = num_people
+        self.debug_print = False
+        self.size = np.array(field_size, dtype=np.float64)
+
+        if(processes is None): 
+            processes = os.cpu_count() or 1
+        if(shards is None): 
+            shards = max(processes, 1)
+        if(seeds is None): 
+            seeds = np.random.SeedSequence(seed).generate_state(shards).tolist()
+        if(len(seeds) != shards): 
+            raise ValueError("ShardedLocationGenerator needs one seed per shard, got %d seeds for %d shards" % (len(seeds), shards))
+        print("Creating ShardedLocationGenerator with field resolution of (%d, %d) and field size of (%0.2fm, %0.2fm) with %d people in %d shards on %d processes" % (field_resolution[0], field_resolution[1], field_size[0], field_size[1], num_people, shards, processes))
+
+        #one block of shared memory holds the whole crowd, the workers attach to it by name
+        self.memory = shared_memory.SharedMemory(create=True, size=shared_state_size(num_people))
+        self.state = shared_state_arrays(self.memory.buf, num_people)
+        self.positions = self.state["positions"]
+        self.velocities = self.state["velocities"]
+        self.behaviors = self.state["behaviors"]
+        self.active = self.state["active"]
+        self.ball = self.state["ball"]
+
+        #every shard is a contiguous range of rows with its own seed
+        bounds = np.linspace(0, num_people, shards + 1).astype(int).tolist()
+        self.shards = list(zip(bounds[:-1], bounds[1:], seeds))
+        self.step_count = 0
+
+        self.rng = np.random.default_rng(seed)
+        self._populate({"wander": 1.0} if behaviors is None else behaviors)
+
+        self.pool = None
+        if(processes > 0): 
+            self.pool = multiprocessing.Pool(processes, initializer=_attach_worker, initargs=(self.memory.name, num_people))
+
+        self._open_outputs(shared_path, output_path, fsync_interval)
+
+    def _populate(self, behaviors): 
+        #starting positions, behaviors and targets
+        self.positions[:] = self.rng.random((self.num_people, 2)) * self.size
+        self.velocities[:] = 0
+        self.active[:] = len(behaviors) > 0
+        self.ball[:] = (self.size[0] / 2, self.size[1] / 2, 0, 0)
+        if(len(behaviors) == 0): 
+            return
+
+        names = list(behaviors)
+        weights = np.array([behaviors[a] for a in names], dtype=np.float64)
+        assigned = self.rng.choice(len(names), self.num_people, p=weights / np.sum(weights))
+        for i, name in enumerate(names): 
+            self.set_behavior(np.flatnonzero(assigned == i), name)
+
+    def set_behavior(self, rows, behavior, target=None): 
+        """Changes what some of the people are doing
+
+        Args:
+            rows (array like): rows of the people
+            behavior (str): new behavior, one of BEHAVIORS
+            target (tuple, optional): point in meters cluster and waypoints people head to, None lets clusters pick meeting points 
+                (groups of about 8) and keeps waypoint walkers where they are. Defaults to None.
+        """
+        if(behavior not in BEHAVIORS): 
+            raise ValueError("Unknown behavior '%s', expected one of %s" % (behavior, ", ".join(BEHAVIORS)))
+        rows = np.asarray(rows, dtype=np.intp)
+        code = BEHAVIORS[behavior]
+        self.behaviors[rows] = code
+
+        targets = self.state["targets"]
+        if(code in (CLUSTER, WAYPOINTS) and target is not None): 
+            targets[rows] = target
+        elif(code == CLUSTER): 
+            meeting_points = self.rng.uniform(0.15, 0.85, (max(1, len(rows) // 8), 2)) * self.size
+            targets[rows] = meeting_points[self.rng.integers(len(meeting_points), size=len(rows))]
+        elif(code == WAYPOINTS): 
+            targets[rows] = self.positions[rows]
+        elif(code == CHASE): 
+            #chasers each keep a small offset from the ball
+            targets[rows] = self.rng.normal(0, 0.2, (len(rows), 2))
+
+    def spawn(self, count, behavior="wander", area=None, target=None): 
+        """Brings people onto the field, they take rows that aren't in use
+
+        Args:
+            count (int): number of people
+            behavior (str, optional): behavior of the new people, one of BEHAVIORS. Defaults to "wander".
+            area (tuple, optional): (x0, y0, x1, y1) area in meters the people appear in, None uses the whole field. Defaults to None.
+            target (tuple, optional): point in meters, see set_behavior(). Defaults to None.
+
+        Returns:
+            numpy.ndarray: rows of the new people
+        """
+        free = np.flatnonzero(~self.active)
+        if(count > len(free)): 
+            raise ValueError("Can't spawn %d people, only %d of the %d rows are free" % (count, len(free), self.num_people))
+
+        #random free rows, so people spread over the shards instead of piling into the first one
+        rows = np.sort(self.rng.choice(free, count, replace=False))
+        low, high = (np.zeros(2), self.size) if area is None else (np.array(area[:2], dtype=np.float64), np.array(area[2:], dtype=np.float64))
+        self.positions[rows] = np.clip(self.rng.uniform(low, high, (count, 2)), 0, self.size)
+        self.velocities[rows] = 0
+        self.active[rows] = True
+        self.set_behavior(rows, behavior, target)
+        return rows
+
+    def despawn(self, rows): 
+        """Takes people off the field, their rows are free to be reused by spawn()
+
+        Args:
+            rows (array like): rows of the people
+        """
+        rows = np.asarray(rows, dtype=np.intp)
+        self.active[rows] = False
+        self.velocities[rows] = 0
+
+    def get_positions(self): 
+        """Gets the position of every active simulated person
+
+        Returns:
+            numpy.ndarray: (N,2) array of positions in meters in format (x,y)
+        """
+        return self.positions[self.active]
+
+    def move(self, dt=1/REFERENCE_RATE): 
+        """Moves every simulated person by one step, every shard is stepped in parallel and the call returns once all of them are done
+
+        Args:
+            dt (float, optional): length of the step in seconds. Defaults to 0.025.
+        """
+        #the random generator of a shard is rebuilt from its seed and the step count, so the movements don't depend on which worker runs which shard
+        tasks = [(start, stop, seed, self.step_count, dt, self.size) for start, stop, seed in self.shards]
+        if(self.pool is not None): 
+            closest = self.pool.map(_step_worker, tasks, chunksize=1)
+        else: 
+            closest = [step_shard(self.state, start, stop, np.random.default_rng([seed, step_count]), dt, size) for start, stop, seed, step_count, dt, size in tasks]
+        self.step_count += 1
+        self._move_ball(dt, min(closest))
+
+    def _move_ball(self, dt, closest): 
+        #whoever got closest to the ball kicks it away from themselves
+        distance, x, y = closest
+        if(distance < KICK_RADIUS): 
+            direction = np.array([self.ball[0] - x, self.ball[1] - y])
+            if(distance == 0): 
+                direction = self.rng.standard_normal(2)
+            self.ball[2:] = direction / np.linalg.norm(direction) * KICK_SPEED
+
+        self.ball[:2] += self.ball[2:] * dt
+        self.ball[2:] *= 0.98 ** (dt * REFERENCE_RATE)
+        for a in range(2): 
+            if(self.ball[a] < 0 or self.ball[a] > self.size[a]): 
+                self.ball[a] = min(max(self.ball[a], 0), self.size[a])
+                self.ball[a + 2] *= -1
+
+    def close(self): 
+        """Stops the worker processes and releases the shared memory"""
+        super().close()
+        if(self.pool is not None): 
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+        if(self.memory is not None): 
+            self.state = self.positions = self.velocities = self.behaviors = self.active = self.ball = None
+            self.memory.close()
+            self.memory.unlink()
+            self.memory = None
+
+def parse_behaviors(text): 
+    """Parses a behavior mix in format 'wander=0.7,chase=0.3' into a dict of fractions"""
+    behaviors = {}
+    for a in text.split(","): 
+        name, _, fraction = a.partition("=")
+        behaviors[name.strip()] = float(fraction) if fraction else 1.0
+    return behaviors
 
 
 def main(): 
@@ -115,6 +539,15 @@ def main():
     arg_parser.add_argument("--field_resolution", "-r", help="Resolution of the playing field in pixels given in format 'width:height'")
     arg_parser.add_argument("--field_size", "-s", help="Real-world size of the projected field in meters given in format 'width:height'")
     arg_parser.add_argument("--num_people", "-n", help="Number of people to simulate interacting with the game.")
+    arg_parser.add_argument("--debug", "-d", action="store_true", help="Print a line every time a simulated person changes direction.")
+    arg_parser.add_argument("--output", "-o", choices=["text", "shared", "both"], default="text", help="Where positions are written, 'text' writes lidar_output.txt, 'shared' writes the binary shared memory file read by LocationParser(transport=\"shared\").")
+    arg_parser.add_argument("--fsync_interval", type=int, default=0, help="fsync lidar_output.txt every this many writes, 0 (the default) never fsyncs.")
+    arg_parser.add_argument("--shared_path", default="lidar_output.bin", help="Path of the shared memory file used by the 'shared' output, use a path in /dev/shm to keep it in memory.")
+    arg_parser.add_argument("--seed", type=int, help="Seed of the random generator so the same movements can be generated again, by default every run is different.")
+    arg_parser.add_argument("--processes", "-p", type=int, help="Simulate the crowd on this many worker processes (for very large crowds), by default everything runs in this process.")
+    arg_parser.add_argument("--shards", type=int, help="Number of shards the crowd is split into when using --processes or --behaviors, defaults to one per process.")
+    arg_parser.add_argument("--behaviors", "-b", help="Mix of behaviors given in format 'wander=0.6,cluster=0.2,run=0.1,chase=0.1', behaviors are " + ", ".join(BEHAVIORS) + ".")
+    arg_parser.add_argument("--scenario", help="Play a scenario file (see the scenarios folder) instead of a random crowd, the field size and the people come from the scenario. Exits when the scenario ends.")
     
     #parse arguments
     args = arg_parser.parse_args()
@@ -139,21 +572,58 @@ def main():
         num_people = int(args.num_people)
 
     #Create the location generator object 
-    gen = LocationGenerator(field_resolution, field_size, num_people)
+    write_text = args.output in ("text", "both")
+    write_shared = args.output in ("shared", "both")
+    shared_path = args.shared_path if write_shared else None
+    if(args.scenario is not None): 
+        #scenario.py builds on this module, so it is only imported when it is needed
+        from scenario import Scenario, ScenarioGenerator
+        gen = ScenarioGenerator(Scenario.load(args.scenario), field_resolution, processes=args.processes or 0, shards=args.shards, shared_path=shared_path, fsync_interval=args.fsync_interval)
+    elif(args.processes is not None or args.behaviors is not None): 
+        #scripted behaviors and big crowds need the sharded generator, with only --behaviors the shards run in this process
+        behaviors = parse_behaviors(args.behaviors) if args.behaviors is not None else None
+        gen = ShardedLocationGenerator(field_resolution, field_size, num_people, processes=args.processes or 0, shards=args.shards, behaviors=behaviors, shared_path=shared_path, fsync_interval=args.fsync_interval, seed=args.seed)
+    else: 
+        gen = LocationGenerator(field_resolution, field_size, num_people, shared_path=shared_path, fsync_interval=args.fsync_interval, debug_print=args.debug, seed=args.seed)
+
+    #output period, the next tick is scheduled from the previous deadline so the time spent moving and writing doesn't slow the output rate
+    period = 0.025
+    next_tick = time.monotonic()
+
+    #the simulation steps at a fixed rate, if a tick runs late the people are moved by however many steps were missed
+    physics_loop = FixedTimestepLoop(physics_hz=REFERENCE_RATE)
 
     #infinite loop (unless someone does ctrl + c)
     try: 
         while(True): 
             #move the objects
-            gen.move()
+            for step in range(physics_loop.advance()): 
+                gen.move(physics_loop.dt)
+
+            if(args.scenario is not None and gen.finished): 
+                print("Scenario finished")
+                break
 
             #write the objects to a file
-            gen.write_to_file()
+            if(write_text): 
+                gen.write_to_file()
+            if(write_shared): 
+                gen.write_to_shared_memory()
 
-            #sleep for 25ms so we're not running at a million miles an hour. 
-            time.sleep(0.025)
+            #sleep until the next 25ms tick so we're not running at a million miles an hour. 
+            #if we've fallen more than a tick behind skip ahead instead of trying to catch up
+            next_tick += period
+            delay = next_tick - time.monotonic()
+            if(delay > 0): 
+                time.sleep(delay)
+            elif(delay < -period): 
+                next_tick = time.monotonic()
     except KeyboardInterrupt: 
         print("Exiting...")
+    finally: 
+        #a second ctrl + c while shutting down would leave the worker processes and the shared memory behind
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        gen.close()
 
 if __name__ == "__main__": 
     main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+
+import numpy as np
+import pygame
+
+def hue_lookup_table(resolution=10):
+    """Builds a table of fully saturated, full brightness RGB colors for every hue
+
+    Args:
+        resolution (int, optional): number of entries per degree of hue. Defaults to 10.
+
+    Returns:
+        numpy.ndarray: (360 * resolution, 3) uint8 table, entry i is the color of hue i / resolution degrees
+    """
+    hue = np.arange(360 * resolution) / resolution
+
+    #standard hsv to rgb conversion with saturation and value fixed at 1, done for each channel at once
+    channels = []
+    for n in (5, 3, 1):
+        k = (n + hue / 60) % 6
+        channels.append(1 - np.clip(np.minimum(k, 4 - k), 0, 1))
+    return np.round(np.stack(channels, axis=1) * 255).astype(np.uint8)
+
+
+class ParticleSystem():
+    def __init__(self, count, bounds=(1920, 1080), reference_rate=60, seed=None):
+        """Structure of arrays version of the random_particles line_object, every particle is a row in a set of numpy arrays
+            so the whole system is moved, bounced off the walls and recolored with a handful of array operations.
+
+        Args:
+            count (int): number of particles
+            bounds (tuple, optional): size of the area the particles move in, they bounce off its edges. Defaults to (1920, 1080).
+            reference_rate (int, optional): velocities are in pixels per frame at this rate, update() scales them to the step length. Defaults to 60.
+            seed (int, optional): seed of the random generator, None picks a random seed. Defaults to None.
+        """
+        self.count = count
+        self.bounds = np.array(bounds, dtype=np.float32)
+        self.reference_rate = reference_rate
+        self.rng = np.random.default_rng(seed)
+
+        #same starting conditions as line_object, everything starts in the center heading in a random direction
+        self.positions = np.tile(self.bounds / 2, (count, 1))
+        self.theta = (self.rng.random(count) * 2 * np.pi).astype(np.float32)
+        self.velocity = (self.rng.random(count) * 5 + 1).astype(np.float32)
+        self.hue = (self.rng.random(count) * 360).astype(np.float32)
+
+        self.hue_resolution = 10
+        self.hue_table = hue_lookup_table(self.hue_resolution)
+        self.mapped_hue_table = None
+        self.mapped_format = None
+
+    def update(self, dt=None):
+        """Moves every particle by one physics step
+
+        Args:
+            dt (float, optional): length of the physics step in seconds, None is one frame at the reference rate. Defaults to None.
+        """
+        step = 1 if dt is None else dt * self.reference_rate
+
+        #random walk of the heading, scaled by sqrt(step) so it wanders at the same rate for any step length
+        self.theta += (self.rng.random(self.count, dtype=np.float32) - 0.5) * np.float32(np.sqrt(step))
+
+        self.positions[:, 0] += self.velocity * np.cos(self.theta) * step
+        self.positions[:, 1] += self.velocity * np.sin(self.theta) * step
+
+        #particles that went past a wall get put back on it and turned around, once per wall hit
+        over = self.positions > self.bounds
+        under = self.positions < 0
+        self.theta += np.pi * (np.count_nonzero(under, axis=1) - np.count_nonzero(over, axis=1)).astype(np.float32)
+        np.clip(self.positions, 0, self.bounds, out=self.positions)
+
+        self.hue += self.rng.random(self.count, dtype=np.float32) / 100 * step
+        np.mod(self.hue, 360, out=self.hue)
+
+    def resize(self, bounds):
+        """Moves the particles into a new area, positions and speeds are scaled so the effect looks the same at the new size
+
+        Args:
+            bounds (tuple): new (width, height) of the area
+        """
+        ratio = np.array(bounds, dtype=np.float32) / self.bounds
+        self.positions *= ratio
+        self.velocity *= ratio[1]
+        self.bounds = np.array(bounds, dtype=np.float32)
+
+    def colors(self):
+        """Gets the current color of every particle
+
+        Returns:
+            numpy.ndarray: (N,3) uint8 RGB colors
+        """
+        return self.hue_table[(self.hue * self.hue_resolution).astype(np.intp) % len(self.hue_table)]
+
+    def draw(self, surface, radius=1):
+        """Draws every particle as a small square directly into the pixels of the surface
+
+        Args:
+            surface (pygame.Surface): surface to draw on, usually the screen
+            radius (int, optional): particles are drawn as (2 * radius + 1) pixel squares. Defaults to 1.
+        """
+        #the hue table has to be converted to the pixel format of the surface, only redo it if the format changes
+        pixel_format = (surface.get_bitsize(), surface.get_masks())
+        if(self.mapped_format != pixel_format):
+            self.mapped_hue_table = np.array([surface.map_rgb(a) for a in self.hue_table.tolist()], dtype=np.uint32)
+            self.mapped_format = pixel_format
+
+        width, height = surface.get_size()
+        x = self.positions[:, 0].astype(np.intp)
+        y = self.positions[:, 1].astype(np.intp)
+        colors = self.mapped_hue_table[(self.hue * self.hue_resolution).astype(np.intp) % len(self.hue_table)]
+
+        pixels = pygame.surfarray.pixels2d(surface)
+        for dx in range(-radius, radius + 1):
+            for dy in range(-radius, radius + 1):
+                pixels[np.clip(x + dx, 0, width - 1), np.clip(y + dy, 0, height - 1)] = colors
+
+        #the surface stays locked while the pixel array exists
+        del pixels
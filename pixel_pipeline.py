@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+
+import os, sys, time, contextlib
+import numpy as np
+import pygame
+
+@contextlib.contextmanager
+def surface_pixels(surface):
+    """Gives zero-copy (width, height, 3) uint8 access to the pixels of a surface, anything written to the array shows up on the surface.
+        The surface is locked while the array is in use, so don't blit or draw on it inside the with block.
+
+    Args:
+        surface (pygame.Surface): surface to access
+
+    Yields:
+        numpy.ndarray: (width, height, 3) view of the surface pixels
+    """
+    pixels = pygame.surfarray.pixels3d(surface)
+    try:
+        yield pixels
+    finally:
+        del pixels
+
+
+def gaussian_stamp(radius, color, intensity=1.0):
+    """Pre-computes a soft round footprint, in surfarray (x, y) order so it can also be added straight into surface_pixels
+
+    Args:
+        radius (int): radius of the stamp in pixels
+        color (tuple): RGB color at the center of the stamp
+        intensity (float, optional): brightness multiplier. Defaults to 1.0.
+
+    Returns:
+        numpy.ndarray: (2 * radius + 1, 2 * radius + 1, 3) uint16 stamp
+    """
+    offsets = np.arange(-radius, radius + 1)
+    distance_squared = offsets[:, None] ** 2 + offsets[None, :] ** 2
+    falloff = np.exp(-distance_squared / (2 * (radius / 2.5) ** 2))
+    falloff[distance_squared > radius * radius] = 0
+    return np.round(falloff[:, :, None] * np.array(color) * intensity).astype(np.uint16)
+
+
+class PixelLayer():
+    def __init__(self, size):
+        """Full screen RGB layer that effects are written into with numpy operations, then composited onto a surface in one go.
+            The pixels are a contiguous (height, width, 3) uint8 array that is shared (not copied) with a pygame surface, so
+            compositing is a single SDL blit rather than a per pixel copy through numpy.
+
+        Args:
+            size (tuple): (width, height) of the layer in pixels
+        """
+        self.width, self.height = size
+        self.buffer = np.zeros((self.height, self.width, 3), dtype=np.uint8)
+
+        #surface that shares the memory of the buffer, anything written to the buffer is immediately visible through it
+        self.surface = pygame.image.frombuffer(self.buffer, size, "RGB")
+
+        #wider scratch space for the operations that would overflow a uint8, allocated once
+        self.scratch = np.zeros(self.buffer.shape, dtype=np.uint16)
+
+        #stamps are cached by (radius, color, intensity) since splat is usually called with the same few every frame
+        self.stamps = {}
+
+    def clear(self):
+        self.buffer.fill(0)
+
+    def fade(self, factor):
+        """Multiplies the whole layer by factor, calling this every frame gives trails that decay over time
+
+        Args:
+            factor (float): 0 clears the layer, 1 leaves it unchanged
+        """
+        #fixed point multiply, 255 * 256 still fits in a uint16
+        np.multiply(self.buffer, np.uint16(round(factor * 256)), out=self.scratch)
+        np.right_shift(self.scratch, 8, out=self.buffer, casting="unsafe")
+
+    def splat(self, positions, radius, color, intensity=1.0):
+        """Additively adds a soft round footprint at every position
+
+        Args:
+            positions (array like): (N,2) positions in pixels
+            radius (int): radius of each footprint in pixels
+            color (tuple): RGB color of the footprint
+            intensity (float, optional): brightness multiplier. Defaults to 1.0.
+        """
+        key = (radius, tuple(color), intensity)
+        stamp = self.stamps.get(key)
+        if(stamp is None):
+            #stamps are stored in (y, x) order to match the buffer
+            stamp = gaussian_stamp(radius, color, intensity).transpose(1, 0, 2).copy()
+            self.stamps[key] = stamp
+
+        for x, y in np.asarray(positions, dtype=np.float64).reshape(-1, 2).astype(np.intp).tolist():
+            #clip the stamp to the edges of the layer
+            x0, x1 = max(x - radius, 0), min(x + radius + 1, self.width)
+            y0, y1 = max(y - radius, 0), min(y + radius + 1, self.height)
+            if(x0 >= x1 or y0 >= y1):
+                continue
+
+            #saturating add, done in the wider scratch space so bright spots clip at 255 instead of wrapping around
+            target = self.buffer[y0:y1, x0:x1]
+            total = self.scratch[y0:y1, x0:x1]
+            np.add(target, stamp[y0 - y + radius:y1 - y + radius, x0 - x + radius:x1 - x + radius], out=total)
+            np.minimum(total, 255, out=total)
+            target[...] = total
+
+    def add(self, other):
+        """Additively blends another layer into this one
+
+        Args:
+            other (PixelLayer): layer of the same size
+        """
+        np.add(self.buffer, other.buffer, out=self.scratch)
+        np.minimum(self.scratch, 255, out=self.scratch)
+        self.buffer[...] = self.scratch
+
+    def blit_to(self, surface, additive=False):
+        """Composites the layer onto a surface
+
+        Args:
+            surface (pygame.Surface): destination surface, usually the screen
+            additive (bool, optional): add the layer on top of what is already on the surface instead of replacing it. Defaults to False.
+
+        Returns:
+            pygame.Rect: area of the surface that was drawn on
+        """
+        return surface.blit(self.surface, (0, 0), special_flags=pygame.BLEND_RGB_ADD if additive else 0)
+
+
+def benchmark(size=(1920, 1080), players=30, frames=60):
+    """Measures the per frame cost of each pixel pipeline operation at the given resolution
+
+    Returns:
+        dict: average milliseconds per frame for each operation
+    """
+    surface = pygame.Surface(size, 0, 32)
+    layer = PixelLayer(size)
+    other = PixelLayer(size)
+    rng = np.random.default_rng(0)
+    positions = rng.random((players, 2)) * size
+
+    operations = {
+        "fade": lambda: layer.fade(0.95),
+        "splat %d players" % players: lambda: layer.splat(positions, 40, (255, 120, 0)),
+        "add layer": lambda: layer.add(other),
+        "blit replace": lambda: layer.blit_to(surface),
+        "blit additive": lambda: layer.blit_to(surface, additive=True),
+    }
+
+    results = {}
+    for name, operation in operations.items():
+        operation()
+        start = time.perf_counter()
+        for a in range(frames):
+            operation()
+        results[name] = (time.perf_counter() - start) / frames * 1000
+    return results
+
+
+if __name__ == "__main__":
+    #the benchmark only needs offscreen surfaces, so don't require a real display
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    pygame.init()
+
+    width, height = 1920, 1080
+    if(len(sys.argv) > 1):
+        width, height = [int(a) for a in sys.argv[1].split(":")]
+
+    results = benchmark((width, height))
+    print("pixel pipeline cost per frame at %dx%d" % (width, height))
+    for name, ms in results.items():
+        print("  %-20s %7.2f ms" % (name, ms))
+
+    #a typical trail effect is one fade, one splat and one blit per frame
+    trail = results["fade"] + results["splat 30 players"] + results["blit replace"]
+    print("  %-20s %7.2f ms (%.0f FPS budget)" % ("trail frame total", trail, 1000 / trail))
+    pygame.quit()
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+
+import time, json, os
+import numpy as np
+import pygame
+
+class NullScope():
+    """Timing scope that does nothing, handed out when the profiler is off so instrumented code costs next to nothing"""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+NULL_SCOPE = NullScope()
+
+
+class TimingScope():
+    def __init__(self, phase):
+        self.phase = phase
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.phase.record(time.perf_counter() - self.start)
+        return False
+
+
+class PhaseStats():
+    def __init__(self, name, window):
+        """Ring buffer of the most recent durations of one phase of the game loop
+
+        Args:
+            name (str): name of the phase
+            window (int): number of samples kept
+        """
+        self.name = name
+        self.samples = np.zeros(window)
+        self.count = 0
+        self.scope = TimingScope(self)
+
+    def record(self, duration):
+        self.samples[self.count % len(self.samples)] = duration
+        self.count += 1
+
+    def summary(self):
+        """Gets the statistics of the samples in the window
+
+        Returns:
+            dict: mean, p95, p99 and max duration in milliseconds, and the number of samples they were computed from
+        """
+        samples = self.samples[:min(self.count, len(self.samples))] * 1000
+        if(len(samples) == 0):
+            return {"mean": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0, "samples": 0}
+        p95, p99 = np.percentile(samples, [95, 99])
+        return {"mean": float(np.mean(samples)), "p95": float(p95), "p99": float(p99), "max": float(np.max(samples)), "samples": len(samples)}
+
+
+class FrameProfiler():
+    def __init__(self, enabled=False, window=240, log_path=None, log_interval=5.0, overlay_key=pygame.K_F3):
+        """Per frame timing of the phases of a game loop (reading the lidar, physics, drawing, flipping the display, ...)
+
+            Wrap each phase in 'with profiler.scope("name"):' and call end_frame() once per frame. When the profiler is off scope() returns a
+            shared do-nothing object, so the instrumentation can stay in the games permanently.
+
+        Args:
+            enabled (bool, optional): record timings from the start, otherwise recording only starts when the overlay is opened. Defaults to False.
+            window (int, optional): number of frames the statistics are computed over. Defaults to 240.
+            log_path (str, optional): file the statistics are periodically written to, '.json' files get one JSON object per line and anything else
+                gets CSV rows. None disables logging. Defaults to None.
+            log_interval (float, optional): seconds between log writes. Defaults to 5.0.
+            overlay_key (int, optional): pygame key that toggles the on screen overlay. Defaults to pygame.K_F3.
+        """
+        self.always_enabled = enabled
+        self.enabled = enabled
+        self.window = window
+        self.log_path = log_path
+        self.log_interval = log_interval
+        self.overlay_key = overlay_key
+        self.overlay_visible = False
+
+        self.phases = {}
+        self.counters = {}
+        self.frame_phase = PhaseStats("frame", window)
+        self.last_frame_end = None
+        self.last_log_time = time.perf_counter()
+
+        #the overlay text is only re-rendered a few times a second
+        self.font = None
+        self.overlay_surface = None
+        self.last_overlay_time = 0
+
+    def scope(self, name):
+        """Times the code inside a with block as the phase 'name'
+
+        Returns:
+            context manager: timing scope for the phase
+        """
+        if(not self.enabled):
+            return NULL_SCOPE
+
+        phase = self.phases.get(name)
+        if(phase is None):
+            phase = PhaseStats(name, self.window)
+            self.phases[name] = phase
+        return phase.scope
+
+    def add_phase(self, phase):
+        """Shows statistics that are recorded elsewhere (e.g. by latency.LatencyMonitor) in the overlay and the log alongside the timed phases
+
+        Args:
+            phase (PhaseStats): statistics to show, listed under phase.name
+        """
+        self.phases[phase.name] = phase
+
+    def add_counter(self, name, get_value):
+        """Shows a running count (e.g. frames without a usable timestamp) under the phases in the overlay and in JSON logs
+
+        Args:
+            name (str): name the count is listed under
+            get_value (function): returns the current count
+        """
+        self.counters[name] = get_value
+
+    def end_frame(self):
+        """Marks the end of a frame, records the total frame time and writes the log when it is due"""
+        if(not self.enabled):
+            self.last_frame_end = None
+            return
+
+        now = time.perf_counter()
+        if(self.last_frame_end is not None):
+            self.frame_phase.record(now - self.last_frame_end)
+        self.last_frame_end = now
+
+        if(self.log_path is not None and now - self.last_log_time >= self.log_interval):
+            self.last_log_time = now
+            self.write_log()
+
+    def stats(self):
+        """Gets the statistics of every phase
+
+        Returns:
+            dict: phase name to the summary dict of PhaseStats.summary, the whole frame is under 'frame'
+        """
+        stats = {name: phase.summary() for name, phase in self.phases.items()}
+        stats["frame"] = self.frame_phase.summary()
+        return stats
+
+    def write_log(self):
+        """Appends the current statistics to the log file"""
+        timestamp = time.time()
+        stats = self.stats()
+
+        if(self.log_path.endswith(".json")):
+            with open(self.log_path, "a") as f:
+                f.write(json.dumps({"time": timestamp, "phases": stats, "counters": {name: get_value() for name, get_value in self.counters.items()}}) + "\n")
+            return
+
+        new_file = not os.path.exists(self.log_path)
+        with open(self.log_path, "a") as f:
+            if(new_file):
+                f.write("time,phase,mean_ms,p95_ms,p99_ms,max_ms,samples\n")
+            for name, a in stats.items():
+                f.write("%0.3f,%s,%0.3f,%0.3f,%0.3f,%0.3f,%d\n" % (timestamp, name, a["mean"], a["p95"], a["p99"], a["max"], a["samples"]))
+
+    def finish(self):
+        """Writes the final statistics to the log, call this when the game exits"""
+        if(self.log_path is not None and self.enabled):
+            self.write_log()
+
+    def handle_event(self, event):
+        """Pass every pygame event through here so the overlay key works
+
+        Returns:
+            bool: True if the event was the overlay key
+        """
+        if(event.type == pygame.KEYDOWN and event.key == self.overlay_key):
+            self.overlay_visible = not self.overlay_visible
+
+            #opening the overlay turns recording on, closing it goes back to whatever was asked for at startup
+            self.enabled = self.overlay_visible or self.always_enabled
+            return True
+        return False
+
+    def draw_overlay(self, surface, position=(10, 10)):
+        """Draws the statistics table in the corner of the screen if the overlay is open
+
+        Returns:
+            pygame.Rect: area that was drawn on, or None if the overlay is closed
+        """
+        if(not self.overlay_visible):
+            return None
+
+        now = time.perf_counter()
+        if(self.overlay_surface is None or now - self.last_overlay_time > 0.25):
+            self.last_overlay_time = now
+            self.overlay_surface = self._render_overlay()
+        return surface.blit(self.overlay_surface, position)
+
+    def _render_overlay(self):
+        if(self.font is None):
+            self.font = pygame.font.SysFont("monospace", 18)
+
+        lines = ["%-10s %7s %7s %7s %7s" % ("phase ms", "mean", "p95", "p99", "max")]
+        for name, a in self.stats().items():
+            lines.append("%-10s %7.2f %7.2f %7.2f %7.2f" % (name[:10], a["mean"], a["p95"], a["p99"], a["max"]))
+        for name, get_value in self.counters.items():
+            lines.append("%-10s %7d" % (name[:10], get_value()))
+
+        rendered = [self.font.render(a, True, (255, 255, 255)) for a in lines]
+        height = sum(a.get_height() for a in rendered)
+        width = max(a.get_width() for a in rendered)
+
+        overlay = pygame.Surface((width + 10, height + 10))
+        overlay.fill((0, 0, 0))
+        y = 5
+        for a in rendered:
+            overlay.blit(a, (5, y))
+            y += a.get_height()
+        return overlay
+
+
+def add_profiler_arguments(arg_parser):
+    """Adds the shared profiling options to a game's argparse parser"""
+    arg_parser.add_argument("--profile", action="store_true", help="Record per frame timings from the start (F3 shows them on screen at any time).")
+    arg_parser.add_argument("--profile_log", help="Periodically write the timing statistics to this file, .json for JSON lines, anything else for CSV.")
+
+
+def profiler_from_arguments(args):
+    """Creates the FrameProfiler described by the options added with add_profiler_arguments"""
+    return FrameProfiler(enabled=args.profile or args.profile_log is not None, log_path=args.profile_log)
@@ -6,39 +6,37 @@
 import pygame
 import random
 import numpy as np
-import sys
+from game_loop import FixedTimestepLoop
+from particles import ParticleSystem
+from launcher import GamePlugin, run_game
 
-pygame.init()
+#particle velocities are in pixels per frame of the original 60Hz loop, physics steps are scaled relative to this rate
+REFERENCE_RATE = 60
 
-# Set up the drawing window
-
-# screen = pygame.display.set_mode([1920, 1080])
-
-#render resolution, this will be scaled to the screen
+#area line_object particles move in
 SCREEN_WIDTH, SCREEN_HEIGHT = 1920 , 1080 
 
-screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.FULLSCREEN | pygame.SCALED)
-
-
-
-running = True
-clock = pygame.time.Clock()
-
 class line_object(): 
     def __init__(self, vel):
         self.x, self.y = SCREEN_WIDTH /2, SCREEN_HEIGHT /2
+        self.previous_x, self.previous_y = self.x, self.y
         self.velocity = vel
         self.hue = random.random() * 360
         self.theta = random.random() * 2*np.pi
 
-    def move(self, draw_screen): 
-        self.theta += random.random() - 0.5
-        
-        previous_x = self.x
-        previous_y = self.y 
+    def update(self, dt=1/REFERENCE_RATE): 
+        """Moves the particle by one physics step
 
-        self.x += self.velocity * np.cos(self.theta)
-        self.y += self.velocity * np.sin(self.theta)
+        Args:
+            dt (float, optional): length of the physics step in seconds. Defaults to 1/60.
+        """
+        step = dt * REFERENCE_RATE
+
+        #the heading does a random walk, scaling by sqrt(step) keeps it wandering at the same rate for any step length
+        self.theta += (random.random() - 0.5) * np.sqrt(step)
+
+        self.x += self.velocity * np.cos(self.theta) * step
+        self.y += self.velocity * np.sin(self.theta) * step
         
         if(self.x > SCREEN_WIDTH):
             self.x =  SCREEN_WIDTH
@@ -54,53 +52,63 @@ class line_object():
             self.y = 0
             self.theta += np.pi
         
-        
-        self.hue += random.random() / 100
+        self.hue += random.random() / 100 * step
+
+    def draw(self, draw_screen): 
+        """Draws the particle with a tail back to where it was the last time it was drawn"""
         c = pygame.Color(0)
         c.hsva = (self.hue % 360, 100, 100, 100)
 
-        # print("previous xy (%0.2f, %0.2f) new xy (%0.2f, %0.2f)" % (previous_x, previous_y, self.x, self.y))
+        # print("previous xy (%0.2f, %0.2f) new xy (%0.2f, %0.2f)" % (self.previous_x, self.previous_y, self.x, self.y))
 
-        pygame.draw.line(draw_screen,c, (previous_x, previous_y), (self.x, self.y), 5)
+        pygame.draw.line(draw_screen,c, (self.previous_x, self.previous_y), (self.x, self.y), 5)
         pygame.draw.circle(draw_screen, c, (self.x, self.y), 5)
 
-lines = []
-
-for a in range(100): 
-    lines.append(line_object(random.random() * 5 + 1))
-
-screen.fill((255,255,255))
-
-while running:
-
+        self.previous_x = self.x
+        self.previous_y = self.y
 
-    # Did the user click the window close button?
-
-    for event in pygame.event.get():
-
-        if event.type == pygame.QUIT:
-
-            running = False
-
-
-    # Fill the background with white
-
-    screen.fill((0,0,0, 1))
-    for line in lines: 
-        line.move(screen)
-
-
-    # Draw a solid blue circle in the center
-
-
-    # Flip the display
-    pygame.display.flip()
-
-    # pygame.display.flip()
-    clock.tick(60)
-
-
-# Done! Time to quit.
-
-pygame.quit()
-sys.exit()
+    def move(self, draw_screen): 
+        """Moves the particle by one 60Hz frame and draws it"""
+        self.update()
+        self.draw(draw_screen)
+
+#the particles are held in a numpy backed ParticleSystem which can move tens of thousands of them per frame
+#line_object above is the original one object per particle version, it draws nicer tails but only scales to a few hundred particles
+NUM_PARTICLES = 20000
+
+class ParticlesGame(GamePlugin): 
+    #the particles don't react to people, so this game runs at 60FPS without a lidar input
+    target_fps = 60
+    uses_lidar = False
+
+    def __init__(self, runtime): 
+        """Thousands of colorful particles wandering around the screen"""
+        super().__init__(runtime)
+        self.particles = ParticleSystem(NUM_PARTICLES, bounds=self.size, reference_rate=REFERENCE_RATE)
+        self.particles.velocity *= self.size[1] / 1080
+
+        #physics runs at a fixed 120Hz so a slow frame doesn't slow the particles down
+        self.physics_loop = FixedTimestepLoop(physics_hz=120)
+
+    def resize(self, size): 
+        #move the particles into the new area
+        self.particles.resize(size)
+
+    def update(self, positions, dt): 
+        with self.runtime.profiler.scope("physics"): 
+            for step in range(self.physics_loop.advance(dt)): 
+                self.particles.update(self.physics_loop.dt)
+
+    def draw(self, surface): 
+        # Fill the background with black
+        with self.runtime.profiler.scope("draw"): 
+            surface.fill((0,0,0, 1))
+            self.particles.draw(surface)
+
+GAME = ParticlesGame
+
+def main(): 
+    run_game(ParticlesGame)
+
+if __name__ == "__main__": 
+    main()
@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+
+import json, time, argparse
+import numpy as np
+from movement_simulation import ShardedLocationGenerator, BEHAVIORS, WAYPOINTS, REFERENCE_RATE
+from lidar_recording import LidarRecorder
+
+#distance in meters at which a waypoint walker counts as having reached a waypoint
+WAYPOINT_RADIUS = 0.4
+
+#keys that decide what an event does, every event needs one of them
+EVENT_ACTIONS = ("spawn", "despawn", "ramp", "behavior", "noise", "dropout")
+
+
+class Scenario():
+    def __init__(self, events, field_size=(4.2, 2.5), duration=60.0, seed=None, noise=0.0, dropout=0.0, max_people=None, name="scenario"):
+        """Declarative description of what happens on the floor, see scenarios/ for examples. Events are dicts that happen at 'time' (seconds, default 0):
+
+            {"spawn": 30, "group": "crowd", "behavior": "chase", "area": [x0, y0, x1, y1], "target": [x, y]}   people walk onto the field
+            {"spawn": 2, "every": 0.5, "until": 20, ...}                                          any spawn or despawn can repeat
+            {"spawn": 5, "behavior": "waypoints", "waypoints": [[x, y], ...], "loop": false}      walk a route, leaving at the end unless it loops
+            {"despawn": 10, "group": "crowd"}                                                   random members of a group leave, "all" empties it
+            {"ramp": [0, 500], "until": 20, "group": "ramp", "behavior": "wander"}              group size goes linearly from 0 to 500 by 'until'
+            {"group": "crowd", "behavior": "cluster", "target": [x, y]}                          a group changes behavior
+            {"noise": 0.05, "dropout": 0.8, "until": 8}                                         sensor noise (meters) and dropout (chance a point is missing) until 'until'
+
+            The group of spawn and ramp events defaults to the behavior name.
+
+        Args:
+            events (list dict): timeline of the scenario
+            field_size (tuple, optional): (width, height) of the field in meters. Defaults to (4.2, 2.5).
+            duration (float, optional): length of the scenario in seconds. Defaults to 60.0.
+            seed (int, optional): seed of the simulation and the sensor noise, None picks a random seed. Defaults to None.
+            noise (float, optional): standard deviation in meters of the noise added to every position outside noise events. Defaults to 0.0.
+            dropout (float, optional): chance that a position is missing from a frame outside dropout events. Defaults to 0.0.
+            max_people (int, optional): number of rows the simulation reserves, None works out the most people the events can put on the field. Defaults to None.
+            name (str, optional): name shown in the output. Defaults to "scenario".
+        """
+        self.events = [dict(a) for a in events]
+        self.field_size = (float(field_size[0]), float(field_size[1]))
+        self.duration = float(duration)
+        self.seed = seed
+        self.noise = float(noise)
+        self.dropout = float(dropout)
+        self.name = name
+
+        routes = set(a.get("group", a.get("behavior", "wander")) for a in self.events if "waypoints" in a)
+        for a in self.events:
+            self._check_event(a, routes)
+        self.max_people = self.capacity() if max_people is None else int(max_people)
+
+    def _check_event(self, event, routes):
+        actions = [a for a in EVENT_ACTIONS if a in event]
+        if(len(actions) == 0):
+            raise ValueError("Scenario event %s doesn't do anything, it needs one of %s" % (event, ", ".join(EVENT_ACTIONS)))
+        if(event.get("behavior", "wander") not in BEHAVIORS):
+            raise ValueError("Unknown behavior '%s' in scenario event %s, expected one of %s" % (event["behavior"], event, ", ".join(BEHAVIORS)))
+        if(event.get("behavior") == "waypoints" and event.get("group", "waypoints") not in routes and "target" not in event):
+            raise ValueError("Scenario event %s uses the waypoints behavior without any waypoints" % event)
+        if(("every" in event or "ramp" in event) and "until" not in event):
+            raise ValueError("Scenario event %s repeats or ramps but has no 'until'" % event)
+        if("despawn" in event and "group" not in event):
+            raise ValueError("Scenario event %s despawns without a group" % event)
+
+    def capacity(self):
+        """Most people the events can have on the field at once (counting every spawn as if nobody ever leaves)
+
+        Returns:
+            int: number of rows the simulation needs
+        """
+        total = 0
+        for a in self.events:
+            if("spawn" in a):
+                repeats = 1
+                if("every" in a):
+                    repeats += int((a["until"] - a.get("time", 0)) // a["every"])
+                total += int(a["spawn"]) * repeats
+            elif("ramp" in a):
+                total += int(max(a["ramp"]))
+        return max(total, 1)
+
+    @classmethod
+    def load(cls, path):
+        """Reads a scenario from a JSON file
+
+        Args:
+            path (str): path of the scenario file
+
+        Returns:
+            Scenario: the loaded scenario
+        """
+        with open(path, "r") as f:
+            data = json.load(f)
+        return cls(data["events"], field_size=data.get("field_size", (4.2, 2.5)), duration=data.get("duration", 60.0), seed=data.get("seed"),
+            noise=data.get("noise", 0.0), dropout=data.get("dropout", 0.0), max_people=data.get("max_people"), name=data.get("name", path))
+
+
+class ScenarioGenerator(ShardedLocationGenerator):
+    """Plays a Scenario on the sharded crowd simulation. Every move() advances the scenario clock and applies the events that are due,
+        get_positions() returns what the lidar would report, with the scenario's noise and dropout applied, so it can stand in for LocationGenerator.
+    """
+    def __init__(self, scenario, field_resolution=(1920, 1080), processes=0, shards=None, shared_path=None, output_path="lidar_output.txt", fsync_interval=0):
+        """Constructor of ScenarioGenerator
+
+        Args:
+            scenario (Scenario): scenario to play
+            field_resolution (Tuple (int), optional): Resolution in pixels of the python game (width,height). Defaults to (1920, 1080).
+            processes (int, optional): number of worker processes, 0 steps the crowd in this process. Defaults to 0.
+            shards (int, optional): number of shards the crowd is split into, None uses one per process. Defaults to None.
+            shared_path (str, optional): path of the shared memory file written by write_to_shared_memory(), None disables the shared output. Defaults to None.
+            output_path (str, optional): path of the text file written by write_to_file(). Defaults to "lidar_output.txt".
+            fsync_interval (int, optional): fsync the text file every this many writes, 0 never fsyncs. Defaults to 0.
+        """
+        super().__init__(field_resolution, scenario.field_size, scenario.max_people, processes=processes, shards=shards, behaviors={},
+            shared_path=shared_path, output_path=output_path, fsync_interval=fsync_interval, seed=scenario.seed)
+        self.scenario = scenario
+        self.time = 0.0
+
+        #the sensor gets its own generator so adding noise doesn't change how people move
+        self.sensor_rng = np.random.default_rng(None if scenario.seed is None else [scenario.seed, 1])
+        self.measured = None
+
+        #rows of every group, the route of every waypoint group and how far along it each row is
+        self.groups = {}
+        self.routes = {}
+        self.route_index = np.zeros(self.num_people, dtype=np.intp)
+
+        #when each event fires next, None once it is done
+        self.next_time = [float(a.get("time", 0)) for a in scenario.events]
+        self._apply_events()
+
+    @property
+    def finished(self):
+        return self.time >= self.scenario.duration
+
+    def move(self, dt=1/REFERENCE_RATE):
+        """Moves every simulated person by one step and advances the scenario clock by dt
+
+        Args:
+            dt (float, optional): length of the step in seconds. Defaults to 0.025.
+        """
+        super().move(dt)
+        self.time += dt
+        self._follow_routes()
+        self._apply_events()
+        self.measured = None
+
+    def get_positions(self):
+        """Gets what the lidar would report for the current step: every active person, minus dropped points, plus sensor noise
+
+        Returns:
+            numpy.ndarray: (N,2) array of positions in meters in format (x,y)
+        """
+        #the text and shared outputs both ask for the frame, they have to get the same one
+        if(self.measured is not None):
+            return self.measured
+
+        positions = self.positions[self.active]
+        noise, dropout = self.scenario.noise, self.scenario.dropout
+        for event in self.scenario.events:
+            if(("noise" in event or "dropout" in event) and event.get("time", 0) <= self.time < event.get("until", np.inf)):
+                noise, dropout = event.get("noise", noise), event.get("dropout", dropout)
+
+        if(dropout > 0):
+            positions = positions[self.sensor_rng.random(len(positions)) >= dropout]
+        if(noise > 0):
+            positions = np.clip(positions + self.sensor_rng.normal(0, noise, positions.shape), 0, self.size)
+        self.measured = positions
+        return positions
+
+    def _apply_events(self):
+        for i, event in enumerate(self.scenario.events):
+            while(self.next_time[i] is not None and self.next_time[i] <= self.time):
+                self._apply_event(event)
+
+                #repeating events and ramps come back until their 'until', everything else happens once
+                if("every" in event and self.next_time[i] + event["every"] <= event["until"]):
+                    self.next_time[i] += event["every"]
+                elif("ramp" in event and self.time < event["until"]):
+                    break
+                else:
+                    self.next_time[i] = None
+
+    def _apply_event(self, event):
+        behavior = event.get("behavior", "wander")
+        group = event.get("group", behavior)
+        target = event.get("target")
+        if("waypoints" in event):
+            self.routes[group] = (np.array(event["waypoints"], dtype=np.float64).reshape(-1, 2), event.get("loop", False))
+        route = self.routes.get(group)
+        if(behavior == "waypoints" and route is not None):
+            target = route[0][0]
+
+        if("spawn" in event):
+            self._spawn(group, int(event["spawn"]), behavior, event.get("area"), target, route)
+        elif("despawn" in event):
+            members = self.groups.get(group, np.zeros(0, dtype=np.intp))
+            count = len(members) if event["despawn"] == "all" else min(int(event["despawn"]), len(members))
+            self._despawn(group, self.rng.choice(members, count, replace=False))
+        elif("ramp" in event):
+            start, end = event["ramp"]
+            progress = min(max((self.time - event.get("time", 0)) / max(event["until"] - event.get("time", 0), 1e-9), 0), 1)
+            change = int(round(start + (end - start) * progress)) - len(self.groups.get(group, ()))
+            if(change > 0):
+                self._spawn(group, change, behavior, event.get("area"), target, route)
+            elif(change < 0):
+                self._despawn(group, self.rng.choice(self.groups[group], -change, replace=False))
+        elif("behavior" in event):
+            members = self.groups.get(group, np.zeros(0, dtype=np.intp))
+            self.set_behavior(members, behavior, target)
+            self.route_index[members] = 0
+
+    def _spawn(self, group, count, behavior, area, target, route):
+        #waypoint walkers enter at the start of their route unless the event says where
+        if(area is None and behavior == "waypoints" and route is not None):
+            x, y = route[0][0]
+            area = (x - 0.25, y - 0.25, x + 0.25, y + 0.25)
+        rows = self.spawn(count, behavior, area, target)
+        self.route_index[rows] = 0
+        self.groups[group] = np.concatenate((self.groups.get(group, np.zeros(0, dtype=np.intp)), rows))
+
+    def _despawn(self, group, rows):
+        self.despawn(rows)
+        self.groups[group] = np.setdiff1d(self.groups[group], rows)
+
+    def _follow_routes(self):
+        #waypoint walkers that reached their waypoint head to the next one, at the end of a route that doesn't loop they leave the field
+        targets = self.state["targets"]
+        for group, (waypoints, loop) in self.routes.items():
+            members = self.groups.get(group)
+            if(members is None or len(members) == 0):
+                continue
+            walking = members[self.behaviors[members] == WAYPOINTS]
+            offset = self.positions[walking] - targets[walking]
+            arrived = walking[np.einsum("ij,ij->i", offset, offset) < WAYPOINT_RADIUS ** 2]
+            if(len(arrived) == 0):
+                continue
+
+            index = self.route_index[arrived] + 1
+            if(loop):
+                index %= len(waypoints)
+            else:
+                done = index >= len(waypoints)
+                if(np.any(done)):
+                    self._despawn(group, arrived[done])
+                arrived, index = arrived[~done], index[~done]
+            self.route_index[arrived] = index
+            targets[arrived] = waypoints[index]
+
+
+def scenario_frames(scenario, rate=REFERENCE_RATE, processes=0):
+    """Plays a scenario as fast as possible
+
+    Args:
+        scenario (Scenario): scenario to play
+        rate (int, optional): frames per second of scenario time. Defaults to 40.
+        processes (int, optional): number of worker processes. Defaults to 0.
+
+    Yields:
+        Tuple: (scenario time, (N,2) positions in meters) of every frame, the positions are a copy
+    """
+    generator = ScenarioGenerator(scenario, processes=processes)
+    try:
+        while True:
+            yield generator.time, generator.get_positions().copy()
+            if(generator.finished):
+                break
+            generator.move(1 / rate)
+    finally:
+        generator.close()
+
+def record_scenario(scenario, path, rate=REFERENCE_RATE, processes=0):
+    """Renders a whole scenario into a lidar recording, the recording can then be replayed into any game (see lidar_recording.py) as a repeatable workload
+
+    Args:
+        scenario (Scenario): scenario to render
+        path (str): path of the recording
+        rate (int, optional): frames per second of the recording. Defaults to 40.
+        processes (int, optional): number of worker processes. Defaults to 0.
+
+    Returns:
+        int: number of frames written
+    """
+    recorder = LidarRecorder(path)
+    start = time.time()
+    try:
+        for t, positions in scenario_frames(scenario, rate, processes):
+            recorder.write(positions, start + t)
+    finally:
+        recorder.close()
+    return recorder.frame_count
+
+
+def main():
+    """Renders a scenario file into a lidar recording, use movement_simulation.py --scenario to play one live"""
+    arg_parser = argparse.ArgumentParser(description="Render a scenario into a lidar recording that can be replayed into the games with lidar_recording.py.")
+    arg_parser.add_argument("scenario", help="Scenario JSON file, see the scenarios folder.")
+    arg_parser.add_argument("recording", help="Path of the recording to write.")
+    arg_parser.add_argument("--rate", type=int, default=REFERENCE_RATE, help="Frames per second of the recording.")
+    arg_parser.add_argument("--processes", "-p", type=int, default=0, help="Number of worker processes used to simulate the crowd.")
+    args = arg_parser.parse_args()
+
+    scenario = Scenario.load(args.scenario)
+    started = time.perf_counter()
+    frames = record_scenario(scenario, args.recording, args.rate, args.processes)
+    print("rendered '%s' (%0.1fs, up to %d people) into %d frames in %0.1fs" % (scenario.name, scenario.duration, scenario.max_people, frames, time.perf_counter() - started))
+
+if __name__ == "__main__":
+    main()
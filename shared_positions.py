@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+
+import os, mmap, time
+import numpy as np
+
+#binary layout of the shared position file (all little endian)
+#
+#  header (64 bytes):  magic 'ARCP' | version u32 | slot_count u32 | max_points u32 | latest_frame u64 | padding
+#  slot_count slots, each:
+#      seq u64 | frame u64 | timestamp f64 | count u32 | padding u32 | max_points * (x, y) float32 records in meters
+#
+#every slot is protected by a seqlock, the writer makes seq odd while it is writing and even again once the slot is complete.
+#readers copy the slot and only accept the copy if seq was even and unchanged on both sides of the copy.
+#unlike lidar_output.txt the records are stored in (x, y) order.
+MAGIC = b"ARCP"
+VERSION = 1
+HEADER_SIZE = 64
+SLOT_HEADER_SIZE = 32
+
+HEADER_DTYPE = np.dtype([("magic", "S4"), ("version", "<u4"), ("slot_count", "<u4"), ("max_points", "<u4"), ("latest_frame", "<u8")])
+SLOT_HEADER_DTYPE = np.dtype([("seq", "<u8"), ("frame", "<u8"), ("timestamp", "<f8"), ("count", "<u4"), ("padding", "<u4")])
+
+
+def slot_size(max_points):
+    return SLOT_HEADER_SIZE + max_points * 2 * 4
+
+
+class SharedPositionWriter():
+    def __init__(self, path, max_points=1024, slot_count=4):
+        """Writes frames of tracked positions into a memory mapped ring of fixed size slots.
+            This is the binary replacement for rewriting lidar_output.txt, readers never see a half written frame.
+
+        Args:
+            path (str): path of the shared file, placing it in /dev/shm keeps it entirely in memory on linux
+            max_points (int, optional): maximum number of positions in a single frame, extra positions are dropped. Defaults to 1024.
+            slot_count (int, optional): number of frames kept in the ring. Defaults to 4.
+        """
+        self.path = path
+        self.max_points = max_points
+        self.slot_count = slot_count
+        size = HEADER_SIZE + slot_count * slot_size(max_points)
+
+        #the ring is laid out in a new file that replaces the old one in a single rename, a game that still has the old file mapped 
+        #keeps its inode (and its size) instead of having the file truncated under it, which would crash it with SIGBUS
+        temp_path = path + ".tmp"
+        with open(temp_path, "w+b") as f:
+            f.truncate(size)
+            self.mm = mmap.mmap(f.fileno(), size)
+
+        self.header = np.ndarray((), dtype=HEADER_DTYPE, buffer=self.mm)
+        self.slot_headers = []
+        self.slot_records = []
+        for a in range(slot_count):
+            offset = HEADER_SIZE + a * slot_size(max_points)
+            self.slot_headers.append(np.ndarray((), dtype=SLOT_HEADER_DTYPE, buffer=self.mm, offset=offset))
+            self.slot_records.append(np.ndarray((max_points, 2), dtype="<f4", buffer=self.mm, offset=offset + SLOT_HEADER_SIZE))
+
+        self.frame = 0
+
+        #the header is written last so readers never pick up a file that is still being laid out
+        self.header["version"] = VERSION
+        self.header["slot_count"] = slot_count
+        self.header["max_points"] = max_points
+        self.header["latest_frame"] = 0
+        self.header["magic"] = MAGIC
+        os.replace(temp_path, path)
+
+    def write(self, positions, timestamp=None):
+        """Publishes a new frame of positions
+
+        Args:
+            positions (array like): (N,2) positions in meters in (x, y) order
+            timestamp (float, optional): time the positions were measured, time.time() is used when None. Defaults to None.
+        """
+        positions = np.asarray(positions, dtype=np.float32).reshape(-1, 2)
+        count = min(len(positions), self.max_points)
+
+        self.frame += 1
+        index = self.frame % self.slot_count
+        slot = self.slot_headers[index]
+
+        #odd sequence number marks the slot as being written
+        slot["seq"] += 1
+        slot["frame"] = self.frame
+        slot["timestamp"] = time.time() if timestamp is None else timestamp
+        slot["count"] = count
+        self.slot_records[index][:count] = positions[:count]
+        slot["seq"] += 1
+
+        self.header["latest_frame"] = self.frame
+
+    def close(self):
+        self.header = None
+        self.slot_headers = []
+        self.slot_records = []
+        self.mm.close()
+
+
+class SharedPositionReader():
+    def __init__(self, path, retries=16):
+        """Reads the latest complete frame from a file written by SharedPositionWriter
+
+        Args:
+            path (str): path of the shared file
+            retries (int, optional): how many times a read is retried when it races with the writer. Defaults to 16.
+        """
+        self.path = path
+        self.retries = retries
+
+        #frame numbers start over with every writer, the frames of earlier writers are added so the numbers readers see keep going up
+        self.frame_offset = 0
+        self._open()
+
+    def _open(self):
+        with open(self.path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            if(stat.st_size < HEADER_SIZE):
+                raise ValueError("'%s' is not a shared position file" % self.path)
+            self.mm = mmap.mmap(f.fileno(), stat.st_size, access=mmap.ACCESS_READ)
+
+        #a restarted writer replaces the file, the inode tells when to map the new one
+        self.inode = stat.st_ino
+        self.last_frame = 0
+
+        self.header = np.ndarray((), dtype=HEADER_DTYPE, buffer=self.mm)
+        if(bytes(self.header["magic"]) != MAGIC or int(self.header["version"]) != VERSION):
+            raise ValueError("'%s' is not a shared position file" % self.path)
+
+        self.slot_count = int(self.header["slot_count"])
+        self.max_points = int(self.header["max_points"])
+        self.slot_headers = []
+        self.slot_records = []
+        for a in range(self.slot_count):
+            offset = HEADER_SIZE + a * slot_size(self.max_points)
+            self.slot_headers.append(np.ndarray((), dtype=SLOT_HEADER_DTYPE, buffer=self.mm, offset=offset))
+            self.slot_records.append(np.ndarray((self.max_points, 2), dtype="<f4", buffer=self.mm, offset=offset + SLOT_HEADER_SIZE))
+
+        #reusable destination for the copied records
+        self.positions = np.zeros((self.max_points, 2), dtype=np.float32)
+
+    def read(self):
+        """Copies the latest complete frame out of the ring
+
+        Returns:
+            Tuple: (frame, timestamp, positions) where positions is an (N,2) float32 view in meters in (x, y) order that is reused between calls.
+                frame is 0 if nothing has been written yet or if every retry raced with the writer.
+        """
+        #the ring only stops moving when the writer is idle or gone, only then check whether a new writer replaced the file
+        if(int(self.header["latest_frame"]) == self.last_frame and self._replaced()):
+            self.frame_offset += self.last_frame
+            self.close()
+            self._open()
+
+        for a in range(self.retries):
+            frame = int(self.header["latest_frame"])
+            if(frame == 0):
+                break
+
+            index = frame % self.slot_count
+            slot = self.slot_headers[index]
+            seq = int(slot["seq"])
+            if(seq % 2 == 1):
+                continue
+
+            count = min(int(slot["count"]), self.max_points)
+            timestamp = float(slot["timestamp"])
+            slot_frame = int(slot["frame"])
+            self.positions[:count] = self.slot_records[index][:count]
+
+            #only accept the copy if the writer didn't touch the slot while we were reading it
+            if(int(slot["seq"]) == seq and slot_frame == frame):
+                self.last_frame = frame
+                return frame + self.frame_offset, timestamp, self.positions[:count]
+
+        return 0, 0.0, self.positions[:0]
+
+    def _replaced(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        return stat.st_ino != self.inode and stat.st_size >= HEADER_SIZE
+
+    def close(self):
+        self.header = None
+        self.slot_headers = []
+        self.slot_records = []
+        self.mm.close()
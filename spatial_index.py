@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+import numpy as np
+
+class SpatialIndex():
+    def __init__(self, cell_size=100):
+        """Uniform grid over a set of positions (usually the lidar positions) that answers 'which positions are within r of this point' queries
+            by only checking the cells that overlap the query circle. Rebuild it whenever new positions arrive and share the same index between
+            every object in the game that needs to interact with the players.
+
+        Args:
+            cell_size (int, optional): size of a grid cell in pixels, something close to the usual query radius works best. Defaults to 100.
+        """
+        self.cell_size = cell_size
+        self.positions = np.zeros((0, 2), dtype=np.float32)
+
+        #maps (cell_x, cell_y) to the indices of the positions inside that cell
+        self.cells = {}
+
+    def rebuild(self, positions):
+        """Replaces the indexed positions
+
+        Args:
+            positions (array like): (N,2) positions in pixels
+        """
+        self.positions = np.array(positions, dtype=np.float32).reshape(-1, 2)
+        self.cells = {}
+        if(len(self.positions) == 0):
+            return
+
+        #sort the positions by cell so each cell is one contiguous run of indices
+        cells = np.floor(self.positions / self.cell_size).astype(np.int64)
+        order = np.lexsort((cells[:, 1], cells[:, 0]))
+        sorted_cells = cells[order]
+        starts = np.flatnonzero(np.any(np.diff(sorted_cells, axis=0) != 0, axis=1)) + 1
+        for run, cell in zip(np.split(order, starts), sorted_cells[np.concatenate(([0], starts))].tolist()):
+            self.cells[tuple(cell)] = run
+
+    def query(self, point, radius):
+        """Finds every position within radius of a point
+
+        Args:
+            point (Tuple (float)): center of the query in pixels
+            radius (float): query radius in pixels
+
+        Returns:
+            numpy.ndarray: indices into self.positions of the positions that are strictly closer than radius
+        """
+        if(len(self.cells) == 0):
+            return np.zeros(0, dtype=np.int64)
+
+        min_x = int(np.floor((point[0] - radius) / self.cell_size))
+        max_x = int(np.floor((point[0] + radius) / self.cell_size))
+        min_y = int(np.floor((point[1] - radius) / self.cell_size))
+        max_y = int(np.floor((point[1] + radius) / self.cell_size))
+
+        #gather the candidates from every overlapping cell, then do the exact distance check on just those
+        candidates = []
+        if((max_x - min_x + 1) * (max_y - min_y + 1) > len(self.cells)):
+            candidates = list(self.cells.values())
+        else:
+            for cx in range(min_x, max_x + 1):
+                for cy in range(min_y, max_y + 1):
+                    run = self.cells.get((cx, cy))
+                    if(run is not None):
+                        candidates.append(run)
+
+        if(len(candidates) == 0):
+            return np.zeros(0, dtype=np.int64)
+
+        candidates = np.concatenate(candidates)
+        diff = self.positions[candidates] - np.asarray(point, dtype=np.float32)
+        return candidates[np.sum(diff * diff, axis=1) < radius * radius]
+
+    def query_points(self, point, radius):
+        """Same as query() but returns the positions instead of their indices
+
+        Returns:
+            numpy.ndarray: (M,2) positions within radius of the point
+        """
+        return self.positions[self.query(point, radius)]
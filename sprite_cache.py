@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+
+import collections
+import pygame
+
+class RotatedSpriteCache():
+    def __init__(self, sprite, steps=360, max_bytes=64 * 1024 * 1024):
+        """Cache of rotated copies of a sprite, so spinning objects don't allocate a new rotated surface every frame.
+            Angles are rounded to one of 'steps' evenly spaced rotations and each rotation is rendered the first time it is asked for.
+            The least recently used rotations are thrown away once the cache holds more than max_bytes of pixel data.
+
+        Args:
+            sprite (pygame.Surface): sprite to rotate, it should already be scaled to its final size
+            steps (int, optional): number of distinct rotations over a full turn, 360 gives one degree steps. Defaults to 360.
+            max_bytes (int, optional): memory budget for the cached surfaces in bytes. Defaults to 64MB.
+        """
+        self.sprite = sprite
+        self.steps = steps
+        self.max_bytes = max_bytes
+        self.step_angle = 360 / steps
+
+        self.surfaces = collections.OrderedDict()
+        self.cached_bytes = 0
+
+    def get(self, angle):
+        """Gets the sprite rotated by angle
+
+        Args:
+            angle (float): counterclockwise rotation in degrees, same as pygame.transform.rotate
+
+        Returns:
+            pygame.Surface: rotated sprite, this is shared so don't draw onto it
+        """
+        step = int(round((angle % 360) / self.step_angle)) % self.steps
+
+        surface = self.surfaces.get(step)
+        if(surface is not None):
+            self.surfaces.move_to_end(step)
+            return surface
+
+        surface = pygame.transform.rotate(self.sprite, step * self.step_angle)
+
+        #convert_alpha needs a display, without one (e.g. headless) keep the surface as is
+        if(pygame.display.get_surface() is not None):
+            surface = surface.convert_alpha()
+
+        self.surfaces[step] = surface
+        self.cached_bytes += self._surface_bytes(surface)
+
+        #evict the least recently used rotations, always keeping the one we just made
+        while(self.cached_bytes > self.max_bytes and len(self.surfaces) > 1):
+            _, evicted = self.surfaces.popitem(last=False)
+            self.cached_bytes -= self._surface_bytes(evicted)
+
+        return surface
+
+    def preload(self):
+        """Renders every rotation up front (as far as the memory budget allows) so there are no hitches the first time an angle is used"""
+        for a in range(self.steps):
+            self.get(a * self.step_angle)
+
+    def clear(self):
+        self.surfaces.clear()
+        self.cached_bytes = 0
+
+    def _surface_bytes(self, surface):
+        return surface.get_width() * surface.get_height() * surface.get_bytesize()
@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+from location_parser import LocationParser
+
+#pixels per meter with the default 1920x1080 output and 4.2x2.5 meter field
+SCALE_X = 1920 / 4.2
+SCALE_Y = 1080 / 2.5
+
+
+@pytest.fixture
+def lidar_file(tmp_path):
+    path = tmp_path / "lidar_output.txt"
+    path.write_text("")
+    pointer = tmp_path / "lidar_input_file_location.txt"
+    pointer.write_text(str(path))
+    return path, str(pointer)
+
+def make_parser(lidar_file, text, **kwargs):
+    path, pointer = lidar_file
+    path.write_text(text)
+    return LocationParser(lidar_file_path_file=pointer, **kwargs)
+
+
+def test_array_matches_line_parser(lidar_file):
+    parser = make_parser(lidar_file, "1.0,2.0\n0.5,0.25\n")
+    positions = parser.getPositionsArray()
+    np.testing.assert_allclose(positions, [(2.0 * SCALE_X, 1.0 * SCALE_Y), (0.25 * SCALE_X, 0.5 * SCALE_Y)], rtol=1e-6)
+    np.testing.assert_allclose(positions, parser.parsePositions("1.0,2.0\n0.5,0.25\n"), rtol=1e-6)
+    parser.close()
+
+def test_broken_lines_dont_add_up_to_a_position(lidar_file):
+    #'3.0' is missing a value and '4.0,' has an extra comma, together they have the right number of values and commas
+    text = "1.0,2.0\n3.0\n4.0,\n"
+    parser = make_parser(lidar_file, text)
+    np.testing.assert_allclose(parser.getPositionsArray(), [(2.0 * SCALE_X, 1.0 * SCALE_Y)], rtol=1e-6)
+    assert len(parser.parsePositions(text)) == 1
+    parser.close()
+
+@pytest.mark.parametrize("text", ["0.5,\n1.0,2.0\n", "abc,1\n1.0,2.0\n", "0.5,-\n1.0,2.0\n", "1.0,2.0,3.0\n4.0\n1.0,2.0\n", "1 2,3\n4,\n1.0,2.0\n"])
+def test_malformed_lines_are_dropped(lidar_file, text):
+    parser = make_parser(lidar_file, text)
+    np.testing.assert_allclose(parser.getPositionsArray(), [(2.0 * SCALE_X, 1.0 * SCALE_Y)], rtol=1e-6)
+    assert len(parser.getPositions()) == 1
+    parser.close()
+
+def test_unchanged_file_is_not_a_new_frame(lidar_file):
+    parser = make_parser(lidar_file, "1.0,2.0\n")
+    assert parser.getPositionsArray(return_new=True)[1]
+    assert not parser.getPositionsArray(return_new=True)[1]
+
+    lidar_file[0].write_text("1.5,2.0\n")
+    positions, is_new = parser.getPositionsArray(return_new=True)
+    assert is_new
+    np.testing.assert_allclose(positions, [(2.0 * SCALE_X, 1.5 * SCALE_Y)], rtol=1e-6)
+    parser.close()
+
+def test_both_getters_see_every_new_frame(lidar_file):
+    parser = make_parser(lidar_file, "1.0,2.0\n")
+    assert parser.getPositionsArray(return_new=True)[1]
+
+    #the array getter already fetched the frame, the list getter still has to get it as new
+    positions, is_new = parser.getPositions(return_new=True)
+    assert is_new and len(positions) == 1
+    assert not parser.getPositions(return_new=True)[1]
+    assert not parser.getPositionsArray(return_new=True)[1]
+    parser.close()
+
+def test_timestamp_line(lidar_file):
+    parser = make_parser(lidar_file, "#t=100.5\n1.0,2.0\n")
+    positions = parser.getPositionsArray()
+    assert parser.frame_timestamp == 100.5
+    np.testing.assert_allclose(positions, [(2.0 * SCALE_X, 1.0 * SCALE_Y)], rtol=1e-6)
+    assert parser.getPositions() == [tuple(a) for a in positions.tolist()]
+
+    #the same positions measured again are still a new frame
+    lidar_file[0].write_text("#t=100.6\n1.0,2.0\n")
+    assert parser.getPositionsArray(return_new=True)[1]
+    assert parser.frame_timestamp == 100.6
+    parser.close()
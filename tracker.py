@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+
+import time
+import numpy as np
+
+#the optimal assignment is optional, without scipy the greedy assignment is used
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:
+    linear_sum_assignment = None
+
+
+def greedy_assignment(distance, gate_distance):
+    """Pairs tracks with measurements, closest pairs first, ignoring any pair further apart than gate_distance
+
+    Args:
+        distance (numpy.ndarray): (tracks, measurements) distance matrix
+        gate_distance (float): largest distance a track can move between updates
+
+    Returns:
+        Tuple (numpy.ndarray): (track indices, measurement indices) of the matched pairs
+    """
+    tracks, measurements = np.nonzero(distance < gate_distance)
+    order = np.argsort(distance[tracks, measurements], kind="stable")
+
+    track_used = np.zeros(distance.shape[0], dtype=bool)
+    measurement_used = np.zeros(distance.shape[1], dtype=bool)
+    matched_tracks, matched_measurements = [], []
+    for t, m in zip(tracks[order].tolist(), measurements[order].tolist()):
+        if(track_used[t] or measurement_used[m]):
+            continue
+        track_used[t] = measurement_used[m] = True
+        matched_tracks.append(t)
+        matched_measurements.append(m)
+    return np.array(matched_tracks, dtype=np.intp), np.array(matched_measurements, dtype=np.intp)
+
+def optimal_assignment(distance, gate_distance):
+    """Same as greedy_assignment but minimizes the total distance of the pairs (Hungarian method), needs scipy"""
+    #pairs outside the gate get a cost high enough that they are only picked when nothing else is possible, then get thrown away
+    cost = np.where(distance < gate_distance, distance, gate_distance * 1000)
+    tracks, measurements = linear_sum_assignment(cost)
+    inside = distance[tracks, measurements] < gate_distance
+    return tracks[inside], measurements[inside]
+
+
+class PersonTracker():
+    def __init__(self, gate_distance=100, alpha=0.7, beta=0.25, lost_time=0.25, max_prediction=0.1, use_hungarian=False, clock=time.perf_counter):
+        """Gives the unordered lidar positions persistent ids and smooths them with a constant velocity alpha-beta filter.
+            Call update() with every new set of lidar positions and predict() every frame, predict() extrapolates the tracks
+            to the current time so a 120Hz render loop gets smooth positions from a lidar that only updates at ~40Hz.
+            Every track is a row in a set of numpy arrays so the filter runs on all tracks at once.
+
+        Args:
+            gate_distance (float, optional): largest distance in pixels a person can move between two lidar updates and still be matched to their track. Defaults to 100.
+            alpha (float, optional): position gain of the filter, 1 follows the lidar exactly and lower values smooth out more jitter. Defaults to 0.7.
+            beta (float, optional): velocity gain of the filter, higher values react faster to changes in speed. Defaults to 0.25.
+            lost_time (float, optional): seconds a track is kept (coasting on its velocity) without being matched before it is dropped. Defaults to 0.25.
+            max_prediction (float, optional): longest time in seconds predict() extrapolates past the last update. Defaults to 0.1.
+            use_hungarian (bool, optional): match tracks to measurements with the optimal assignment instead of the greedy one, requires scipy. Defaults to False.
+            clock (function, optional): time source in seconds. Defaults to time.perf_counter.
+        """
+        self.gate_distance = gate_distance
+        self.alpha = alpha
+        self.beta = beta
+        self.lost_time = lost_time
+        self.max_prediction = max_prediction
+        self.clock = clock
+
+        if(use_hungarian and linear_sum_assignment is None):
+            raise ImportError("PersonTracker(use_hungarian=True) needs scipy, install it or use the greedy assignment")
+        self.assign = optimal_assignment if use_hungarian else greedy_assignment
+
+        #state of every track, one row per track, positions are as of self.time
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.positions = np.zeros((0, 2), dtype=np.float64)
+        self.velocities = np.zeros((0, 2), dtype=np.float64)
+        self.last_seen = np.zeros(0, dtype=np.float64)
+        self.time = None
+        self.next_id = 1
+
+    def __len__(self):
+        return len(self.ids)
+
+    def update(self, measurements, timestamp=None):
+        """Matches a new set of lidar positions to the tracks and corrects the tracks with them
+
+        Args:
+            measurements (array like): (N,2) positions in pixels
+            timestamp (float, optional): time the positions were measured on the same clock as self.clock, None uses the current time. Defaults to None.
+        """
+        measurements = np.asarray(measurements, dtype=np.float64).reshape(-1, 2)
+        now = self.clock() if timestamp is None else timestamp
+        dt = 0 if self.time is None else max(now - self.time, 0)
+        self.time = now
+
+        #move every track forward to the time of the measurements
+        predicted = self.positions + self.velocities * dt
+
+        distance = np.hypot(predicted[:, None, 0] - measurements[None, :, 0], predicted[:, None, 1] - measurements[None, :, 1])
+        tracks, matched = self.assign(distance, self.gate_distance)
+
+        #alpha-beta correction of the matched tracks, the others coast along on their velocity
+        self.positions = predicted
+        if(len(tracks) > 0):
+            residual = measurements[matched] - predicted[tracks]
+            self.positions[tracks] += self.alpha * residual
+            if(dt > 0):
+                self.velocities[tracks] += self.beta / dt * residual
+            self.last_seen[tracks] = now
+
+        #drop tracks that haven't been seen for a while
+        keep = now - self.last_seen <= self.lost_time
+        if(not np.all(keep)):
+            self.ids, self.positions, self.velocities, self.last_seen = self.ids[keep], self.positions[keep], self.velocities[keep], self.last_seen[keep]
+
+        #every measurement nobody claimed is a new person
+        new = np.ones(len(measurements), dtype=bool)
+        new[matched] = False
+        new_count = np.count_nonzero(new)
+        if(new_count > 0):
+            self.ids = np.concatenate((self.ids, np.arange(self.next_id, self.next_id + new_count)))
+            self.positions = np.concatenate((self.positions, measurements[new]))
+            self.velocities = np.concatenate((self.velocities, np.zeros((new_count, 2))))
+            self.last_seen = np.concatenate((self.last_seen, np.full(new_count, now)))
+            self.next_id += new_count
+
+    def predict(self, timestamp=None):
+        """Extrapolates every track to the given time
+
+        Args:
+            timestamp (float, optional): time to predict for on the same clock as self.clock, None uses the current time. Defaults to None.
+
+        Returns:
+            Tuple (numpy.ndarray): (ids, positions, velocities), the (N,) ids, (N,2) positions in pixels and (N,2) velocities in pixels per second of every track
+        """
+        if(self.time is None):
+            return self.ids, self.positions, self.velocities
+
+        now = self.clock() if timestamp is None else timestamp
+        ahead = min(max(now - self.time, 0), self.max_prediction)
+        return self.ids, self.positions + self.velocities * ahead, self.velocities
+
+    def rescale(self, ratio):
+        """Scales the tracks when the game changes its resolution
+
+        Args:
+            ratio (float): new resolution divided by the old one
+        """
+        self.positions *= ratio
+        self.velocities *= ratio
+        self.gate_distance *= ratio